@@ -0,0 +1,251 @@
+"""
+Асинхронный вариант api.services для ASGI (httpx вместо requests).
+Разбор ответов TMDB и кэш общие с синхронной версией; ошибки HTTP — httpx.HTTPStatusError.
+"""
+import asyncio
+import time
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+from . import breaker, deadlines, metrics, profiling, ratelimit, services, titles, upstream
+from .breaker import BreakerOpen
+from .deadlines import DeadlineExceeded
+from .ratelimit import RateLimited
+from .pagination import AsyncPageWalk, Cursor, row_ref
+from .services import TMDB_BASE, _params
+
+
+@profiling.timed("upstream")
+async def _aget(url: str, params: dict, on_404_return_empty: bool = False):
+    """Асинхронный services._get: тот же кэш, ключи и single-flight."""
+    key, ttl, stale_ttl = services._cache_entry(url, params, on_404_return_empty)
+
+    def afetch():
+        return services._flight.ado(key, lambda: _afetch(url, params, on_404_return_empty))
+
+    if not services.TMDB_CACHE_ENABLED:
+        return await afetch()
+    try:
+        return await services._cache.aget_or_fetch(key, afetch, ttl, stale_ttl)
+    except (BreakerOpen, RateLimited, DeadlineExceeded, httpx.HTTPError) as e:
+        # TMDB недоступен — лучше устаревший ответ, чем ошибка
+        # Второй уровень кэша — SQLite: читаем в потоке
+        value = await asyncio.to_thread(services._cache.last_known, key) if _upstream_failure(e) else None
+        if value is None:
+            raise
+        services._note_fallback(key)
+        return value
+
+
+def _upstream_failure(e: Exception) -> bool:
+    """Как services._upstream_failure, для ошибок httpx."""
+    if isinstance(e, (BreakerOpen, RateLimited, DeadlineExceeded, httpx.TransportError)):
+        return True
+    return isinstance(e, httpx.HTTPStatusError) and (e.response.status_code == 429 or e.response.status_code >= 500)
+
+
+async def _afetch(url: str, params: dict, on_404_return_empty: bool = False):
+    """Как services._fetch (breaker, лимит запросов, повторы в TMDB_BUDGET и бюджете запроса), без блокировки event loop."""
+    endpoint = services._endpoint_class(services._cache_path(url))
+    circuit = breaker.get(url, endpoint)
+    deadline = deadlines.until(services.TMDB_BUDGET)
+    last_error = None
+    for attempt in range(services.TMDB_RETRIES):
+        if time.monotonic() >= deadline:
+            raise last_error or DeadlineExceeded(endpoint)
+        if not circuit.allow():
+            raise last_error or BreakerOpen(circuit.name, circuit.retry_in())
+        if attempt:
+            metrics.tmdb_retry(endpoint)
+        try:
+            await ratelimit.aacquire(timeout=deadline - time.monotonic())
+            timeout = min(deadlines.timeout(endpoint, services.TMDB_TIMEOUT), deadline - time.monotonic())
+            if timeout <= 0:
+                raise DeadlineExceeded(endpoint)
+            hedge_after = deadlines.hedge_after(endpoint, timeout)
+            started = time.perf_counter()
+            with metrics.TMDB_IN_FLIGHT.track_inprogress():
+                if hedge_after is None:
+                    resp = await upstream.aget(url, params=params, timeout=timeout, verify=services._ssl_verify())
+                else:
+                    resp, hedge_won = await upstream.ahedged_get(
+                        url, hedge_after, lambda: services._hedge_allowed(endpoint, blocking=False),
+                        params=params, timeout=timeout, verify=services._ssl_verify(),
+                    )
+                    if hedge_won:
+                        metrics.tmdb_hedge(endpoint, "won")
+        except httpx.TransportError as e:
+            elapsed = time.perf_counter() - started
+            if isinstance(e, httpx.TimeoutException):
+                deadlines.record(endpoint, elapsed)
+            metrics.tmdb_response(endpoint, "timeout" if isinstance(e, httpx.TimeoutException) else "error", elapsed)
+            circuit.failure()
+            last_error = e
+        except BaseException:
+            # Отмена запроса клиентом и т.п. — не сбой TMDB, но место пробного запроса освобождаем
+            circuit.abandon()
+            raise
+        else:
+            elapsed = time.perf_counter() - started
+            metrics.tmdb_response(endpoint, resp.status_code, elapsed)
+            if resp.status_code == 429:
+                circuit.abandon()
+                await ratelimit.athrottled(resp.headers.get("Retry-After"))
+                last_error = services._http_error(resp)
+            elif resp.status_code < 500:
+                deadlines.record(endpoint, elapsed)
+                circuit.success()
+                return services._response_data(url, resp, on_404_return_empty)
+            else:
+                circuit.failure()
+                last_error = services._http_error(resp)
+        delay = breaker.backoff_delay(attempt)
+        if attempt == services.TMDB_RETRIES - 1 or time.monotonic() + delay >= deadline:
+            break
+        await asyncio.sleep(delay)
+    raise last_error
+
+
+# --- Блоки главной ---
+
+async def get_popular_now(limit: int = 12):
+    """Популярное сейчас — тренды за день (фильмы + сериалы)."""
+    if not services._api_key():
+        return services._empty_results()
+    data = await _aget(f"{TMDB_BASE}/trending/all/day", _params(), on_404_return_empty=True)
+    return services._trending_results(data, limit)
+
+
+async def get_popular_movies(limit: int = 4):
+    """Популярные фильмы."""
+    if not services._api_key():
+        return services._empty_results()
+    data = await _aget(f"{TMDB_BASE}/movie/popular", _params({"page": 1}), on_404_return_empty=True)
+    items = data.get("results", [])[:limit]
+    return {"results": services._results(items, is_tv=False)}
+
+
+async def get_popular_series(limit: int = 4):
+    """Популярные сериалы."""
+    if not services._api_key():
+        return services._empty_results()
+    data = await _aget(f"{TMDB_BASE}/tv/popular", _params({"page": 1}), on_404_return_empty=True)
+    items = data.get("results", [])[:limit]
+    return {"results": services._results(items, is_tv=True)}
+
+
+async def get_coming_soon(limit: int = 4):
+    """Скоро в кино — премьеры. При 404 — fallback на discover с датой выхода."""
+    if not services._api_key():
+        return services._empty_results()
+    data = await _aget(f"{TMDB_BASE}/movie/upcoming", _params({"page": 1}), on_404_return_empty=True)
+    if not data:
+        data = await _aget(f"{TMDB_BASE}/discover/movie", services._coming_soon_fallback_params(), on_404_return_empty=True)
+    items = (data or {}).get("results", [])[:limit]
+    return {"results": services._results(items, is_tv=False)}
+
+
+# --- Поиск и детали ---
+
+def _db(fn):
+    """
+    fn с запросами к БД (индекс названий, каталог) в пуле потоков, не занимая общий поток sync_to_async.
+    Соединение Django в потоке пула закрывается по CONN_MAX_AGE до и после вызова, как в начале и конце запроса:
+    иначе каждый поток пула держит своё соединение, и оно устаревает.
+    """
+    def call(*args, **kwargs):
+        close_old_connections()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(call, thread_sensitive=False)
+
+
+async def search_by_genre(genre_name: str, year: str | None, cursor: Cursor | None = None, limit: int | None = None):
+    """Поиск фильмов по жанру (как services.search_by_genre): первая страница — из каталога в БД, если он есть."""
+    params = services._genre_params(genre_name, year)
+    if params is None:
+        return {"results_count": 0, "results": [], "next_cursor": None}
+    if cursor is None and limit in (None, services.GENRE_PAGE_SIZE):
+        items = await _db(services._catalog_items)(params["with_genres"], year)
+        if items is not None:
+            result = services._genre_results({"results": items})
+            result["next_cursor"] = Cursor(2).encode() if len(items) >= services.GENRE_PAGE_SIZE else None
+            return result
+    walk = _genre_walk(params, cursor, limit or services.GENRE_PAGE_SIZE, prefetch=False)
+    rows = [row async for row in walk]
+    return {"results_count": len(rows), "results": rows, "next_cursor": walk.next_token}
+
+
+def genre_walk(genre_name: str, year: str | None, cursor: Cursor | None, limit: int) -> AsyncPageWalk | None:
+    """Строки поиска по жанру страницами TMDB (для потоковой выдачи); None — жанр неизвестен."""
+    params = services._genre_params(genre_name, year)
+    return _genre_walk(params, cursor, limit, prefetch=True) if params is not None else None
+
+
+def _genre_walk(params: dict, cursor: Cursor | None, limit: int, prefetch: bool) -> AsyncPageWalk:
+    async def fetch_page(page):
+        data = await _aget(f"{TMDB_BASE}/discover/movie", {**params, "page": page})
+        return services._results(data.get("results", []), is_tv=False), data.get("total_pages") or 0
+
+    return AsyncPageWalk(fetch_page, cursor, limit, prefetch)
+
+
+async def search_by_query(q: str, cursor: Cursor | None = None, limit: int | None = None):
+    """Поиск по названию (как services.search_by_query): первая страница — из локального индекса, если хватает."""
+    if not (q or "").strip():
+        return {"results": [], "next_cursor": None}
+    limit = limit or services.QUERY_PAGE_SIZE
+    if cursor is None:
+        local = await _db(titles.search)(q, limit=limit)
+        if local is not None:
+            result = services._local_search_results(local)
+            result["next_cursor"] = Cursor(1, 0, [row_ref(row) for row in local]).encode()
+            return result
+    walk = query_walk(q, cursor, limit, prefetch=False)
+    rows = [row async for row in walk]
+    return {"results": rows, "next_cursor": walk.next_token}
+
+
+def query_walk(q: str, cursor: Cursor | None, limit: int, prefetch: bool = True) -> AsyncPageWalk:
+    """Строки поиска по названию страницами TMDB /search/multi."""
+    query = q.strip()
+
+    async def fetch_page(page):
+        data = await _aget(f"{TMDB_BASE}/search/multi", _params({"query": query, "page": page}))
+        return services._search_rows(data), data.get("total_pages") or 0
+
+    return AsyncPageWalk(fetch_page, cursor, limit, prefetch)
+
+
+async def get_movie_details(movie_id: int, is_tv: bool = False, include=(), fields=None):
+    """Полная информация о фильме/сериале по ID (include, fields — как в services.get_movie_details)."""
+    segment = "tv" if is_tv else "movie"
+    data = await _aget(f"{TMDB_BASE}/{segment}/{movie_id}", services._detail_params(include))
+    return services._project(services._details_result(data), fields)
+
+
+async def get_details_batch(refs: list) -> dict:
+    """Асинхронный services.get_details_batch: промахи кэша — параллельно, не больше BATCH_CONCURRENCY."""
+    semaphore = asyncio.Semaphore(services.BATCH_CONCURRENCY)
+    unique = list(dict.fromkeys(refs))
+
+    async def one(media_type, movie_id):
+        # Только память: проверка не должна ждать SQLite на event loop
+        if services._details_cached(media_type, movie_id, shared=False):
+            return await get_movie_details(movie_id, is_tv=media_type == "tv")
+        async with semaphore:
+            return await get_movie_details(movie_id, is_tv=media_type == "tv")
+
+    results = await asyncio.gather(*(one(*ref) for ref in unique), return_exceptions=True)
+    return dict(zip(unique, results))
+
+
+async def get_watch_link(movie_id: int, is_tv: bool = False, include=(), fields=None):
+    """Детали и ссылка на просмотр."""
+    details = await get_movie_details(movie_id, is_tv=is_tv, include=include)
+    return services._project(services._watch_result(details, movie_id), fields)
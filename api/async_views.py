@@ -0,0 +1,285 @@
+"""
+Асинхронные вьюхи для ASGI (config/asgi.py): тот же API, что и в api.views,
+но ожидание TMDB не занимает воркер. DRF не поддерживает async-вьюхи,
+поэтому это обычные Django-вьюхи, JSON рендерится рендерером из REST_FRAMEWORK.
+"""
+import asyncio
+import time
+
+import httpx
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.utils.http import parse_http_date_safe
+from rest_framework import status
+from rest_framework.settings import api_settings
+
+from . import aservices, deadlines, posters, responses, services
+from .pagination import PAGINATION_MAX_LIMIT
+from .renderers import NDJSONRenderer, ndjson_line
+from .views import (  # noqa: F401
+    HOME_BLOCKS,
+    UPSTREAM_ERRORS,
+    _batch_ids,
+    _batch_response,
+    _block_error,
+    _detail_key,
+    _detail_options,
+    _list_key,
+    _page_options,
+    _poster_response,
+    _poster_url_param,
+    _store_poster,
+    _streaming_poster_response,
+    _upstream_error_data,
+    _year_error,
+    genre_list,
+    upstream_stats,
+)
+
+
+def _json(data, status_code: int = status.HTTP_200_OK, headers: dict | None = None) -> HttpResponse:
+    renderer = api_settings.DEFAULT_RENDERER_CLASSES[0]()
+    return HttpResponse(renderer.render(data), status=status_code, content_type=renderer.media_type, headers=headers)
+
+
+async def _cached_json(request, endpoint: str, key: tuple, build) -> HttpResponse:
+    """Как views._cached_json: build — корутинная функция, возвращающая (data, можно ли кэшировать)."""
+    entry = responses.get(endpoint, key)
+    cacheable = True
+    if entry is None:
+        with services.tracking_fallbacks() as fallbacks:
+            data, cacheable = await build()
+        cacheable = cacheable and not fallbacks
+        if cacheable:
+            # Сжатие (brotli, gzip на высоких уровнях) — в потоке, не на event loop
+            entry = await asyncio.to_thread(responses.store, endpoint, key, data)
+        else:
+            entry = responses.encode(data)
+    return responses.response(request, endpoint, entry, cacheable)
+
+
+async def _cacheable(coro) -> tuple:
+    return await coro, True
+
+
+def _upstream_error(e: Exception, not_found: bool = False) -> HttpResponse:
+    """Как views._upstream_error: 404, 502, 503 с Retry-After или 504."""
+    return _json(*_upstream_error_data(e, not_found))
+
+
+def _wants_ndjson(request) -> bool:
+    # Как выбор NDJSONRenderer в views.LIST_RENDERERS: ?format=ndjson или Accept
+    if "format" in request.GET:
+        return request.GET["format"] == NDJSONRenderer.format
+    return NDJSONRenderer.media_type in request.headers.get("Accept", "")
+
+
+async def _ndjson_response(walk):
+    """Как views._ndjson_response: ошибка TMDB до первой строки — ответ _upstream_error, после — строка {"detail": ...}."""
+    rows = aiter(walk) if walk is not None else None
+    try:
+        first = await anext(rows, None) if rows is not None else None
+    except UPSTREAM_ERRORS as e:
+        return _upstream_error(e)
+    return StreamingHttpResponse(_ndjson_lines(first, rows, walk), content_type=NDJSONRenderer.media_type)
+
+
+async def _ndjson_lines(first, rows, walk):
+    if first is not None:
+        yield ndjson_line(first)
+        try:
+            async for row in rows:
+                yield ndjson_line(row)
+        except Exception as e:
+            yield ndjson_line({"detail": _block_error(e)["detail"]})
+            return
+    yield ndjson_line({"next_cursor": walk.next_token if walk is not None else None})
+
+
+@deadlines.view_budget("movie_list")
+async def movie_list(request):
+    """Список/поиск фильмов (q — по названию, genre и year — по жанру; cursor, limit — продолжение)."""
+    q = request.GET.get("q", "").strip()
+    genre = request.GET.get("genre", "").strip()
+    year = request.GET.get("year", "").strip() or None
+    stream = _wants_ndjson(request)
+    cursor, limit, error = _page_options(request.GET, stream)
+    if error:
+        return _json({"detail": error}, status.HTTP_400_BAD_REQUEST)
+
+    if q:
+        if len(q) < 2:
+            return _json({"detail": "Параметр q должен быть не короче 2 символов."}, status.HTTP_400_BAD_REQUEST)
+        if stream:
+            return await _ndjson_response(aservices.query_walk(q, cursor, limit or PAGINATION_MAX_LIMIT))
+        try:
+            return await _cached_json(request, "search", _list_key(q.lower(), None, cursor, limit), lambda: _cacheable(aservices.search_by_query(q, cursor, limit)))
+        except UPSTREAM_ERRORS as e:
+            return _upstream_error(e)
+
+    if genre:
+        error = _year_error(year)
+        if error:
+            return _json({"detail": error}, status.HTTP_400_BAD_REQUEST)
+        if stream:
+            return await _ndjson_response(aservices.genre_walk(genre, year, cursor, limit or PAGINATION_MAX_LIMIT))
+        try:
+            return await _cached_json(request, "genre", _list_key(genre.lower(), year, cursor, limit), lambda: _cacheable(aservices.search_by_genre(genre, year, cursor, limit)))
+        except UPSTREAM_ERRORS as e:
+            return _upstream_error(e)
+
+    return _json(
+        {"detail": "Укажите q (поиск по названию) или genre (поиск по жанру)."},
+        status.HTTP_400_BAD_REQUEST,
+    )
+
+
+@deadlines.view_budget("movie_batch")
+async def movie_batch(request):
+    """Детали нескольких фильмов/сериалов."""
+    ids, error = _batch_ids(request.GET.get("ids", ""))
+    if error:
+        return _json({"detail": error}, status.HTTP_400_BAD_REQUEST)
+    refs = [ref for ref in ids if not isinstance(ref, str)]
+    return _json(_batch_response(ids, await aservices.get_details_batch(refs)))
+
+
+@deadlines.view_budget("movie_detail")
+async def movie_detail(request, movie_id: int):
+    """Детали фильма по ID."""
+    include, fields, error = _detail_options(request.GET)
+    if error:
+        return _json({"detail": error}, status.HTTP_400_BAD_REQUEST)
+    try:
+        return await _cached_json(request, "detail", _detail_key(movie_id, include, fields), lambda: _cacheable(aservices.get_movie_details(movie_id, include=include, fields=fields)))
+    except UPSTREAM_ERRORS as e:
+        return _upstream_error(e, not_found=True)
+
+
+@deadlines.view_budget("movie_watch")
+async def movie_watch(request, movie_id: int):
+    """Детали фильма и ссылка на просмотр."""
+    include, fields, error = _detail_options(request.GET)
+    if error:
+        return _json({"detail": error}, status.HTTP_400_BAD_REQUEST)
+    try:
+        return await _cached_json(request, "watch", _detail_key(movie_id, include, fields), lambda: _cacheable(aservices.get_watch_link(movie_id, include=include, fields=fields)))
+    except UPSTREAM_ERRORS as e:
+        return _upstream_error(e, not_found=True)
+
+
+@deadlines.view_budget("search_by_genre")
+async def search_by_genre(request):
+    """Поиск фильмов по жанру: GET api/search_by_genre?genre_name=триллер&year=2020."""
+    genre_name = request.GET.get("genre_name", "").strip()
+    if not genre_name:
+        return _json({"detail": "Укажите параметр genre_name (напр. триллер, комедия)."}, status.HTTP_400_BAD_REQUEST)
+    year = request.GET.get("year", "").strip() or None
+    error = _year_error(year)
+    stream = _wants_ndjson(request)
+    cursor, limit, page_error = _page_options(request.GET, stream)
+    if error or page_error:
+        return _json({"detail": error or page_error}, status.HTTP_400_BAD_REQUEST)
+    if stream:
+        return await _ndjson_response(aservices.genre_walk(genre_name, year, cursor, limit or PAGINATION_MAX_LIMIT))
+    try:
+        return await _cached_json(request, "genre", _list_key(genre_name.lower(), year, cursor, limit), lambda: _cacheable(aservices.search_by_genre(genre_name, year, cursor, limit)))
+    except UPSTREAM_ERRORS as e:
+        return _upstream_error(e)
+
+
+async def _api_response(request, endpoint: str, afetch):
+    """Как views._api_response: при любой ошибке — 200 с пустыми results (не кэшируется). afetch — функция, возвращающая корутину."""
+
+    async def build():
+        try:
+            return await afetch(), True
+        except Exception as e:
+            return _block_error(e), False
+
+    return await _cached_json(request, endpoint, (), build)
+
+
+@deadlines.view_budget("popular_now")
+async def popular_now(request):
+    """Популярное сейчас — топ по голосам."""
+    return await _api_response(request, "popular_now", lambda: aservices.get_popular_now(limit=12))
+
+
+@deadlines.view_budget("popular_movies")
+async def popular_movies(request):
+    """Популярные фильмы (только фильмы)."""
+    return await _api_response(request, "popular_movies", lambda: aservices.get_popular_movies(limit=4))
+
+
+@deadlines.view_budget("popular_series")
+async def popular_series(request):
+    """Популярные сериалы (только сериалы)."""
+    return await _api_response(request, "popular_series", lambda: aservices.get_popular_series(limit=4))
+
+
+@deadlines.view_budget("coming_soon")
+async def coming_soon(request):
+    """Скоро на экранах — премьеры."""
+    return await _api_response(request, "coming_soon", lambda: aservices.get_coming_soon(limit=4))
+
+
+async def _home_block(func_name: str, limit: int) -> dict:
+    try:
+        return await getattr(aservices, func_name)(limit=limit)
+    except Exception as e:
+        return _block_error(e)
+
+
+@deadlines.view_budget("home")
+async def home(request):
+    """Блоки главной одним запросом (TMDB опрашивается параллельно)."""
+    async def build():
+        blocks = await asyncio.gather(*(_home_block(func_name, limit) for _, func_name, limit in HOME_BLOCKS))
+        return {key: block for (key, _, _), block in zip(HOME_BLOCKS, blocks)}, not any("detail" in block for block in blocks)
+
+    return await _cached_json(request, "home", (), build)
+
+
+@deadlines.view_budget("poster_proxy")
+async def poster_proxy(request):
+    """Прокси постеров с дисковым кэшем. При ошибке загрузки — редирект на оригинальный URL. GET ?url=<encoded_image_url>"""
+    url, parsed, error = _poster_url_param(request)
+    if error is not None:
+        return error
+
+    # Работа с диском — в потоке, чтобы не блокировать event loop
+    if posters.POSTER_CACHE_ENABLED:
+        entry = await asyncio.to_thread(posters.poster_cache.lookup, url)
+        if entry is not None:
+            try:
+                return await asyncio.to_thread(_poster_response, request, entry, None, False)
+            except OSError:
+                pass
+
+    verify = services._ssl_verify() if parsed.netloc == "image.tmdb.org" else True
+
+    if not posters.poster_slots.try_acquire():
+        return HttpResponseRedirect(url)
+    deadline = time.monotonic() + posters.POSTER_DEADLINE
+    streaming = False
+    try:
+        # Ответ источника ждём в пределах бюджета запроса; начатую передачу тела доводим до POSTER_DEADLINE
+        resp = await posters.aopen_upstream(url, verify, deadlines.until(posters.POSTER_DEADLINE))
+        if resp is None:
+            return HttpResponseRedirect(url)
+        last_modified = parse_http_date_safe(resp.headers.get("Last-Modified") or "")
+        if posters.POSTER_STREAMING:
+            stream = posters.AsyncPosterStream(resp, url, deadline, last_modified)
+            streaming = True
+            return _streaming_poster_response(resp.headers, stream, last_modified)
+        try:
+            content = await resp.aread()
+        except httpx.HTTPError:
+            return HttpResponseRedirect(url)
+        finally:
+            await resp.aclose()
+        entry = await asyncio.to_thread(_store_poster, url, content, resp.headers)
+        return _poster_response(request, entry, content)
+    finally:
+        if not streaming:
+            posters.poster_slots.release()
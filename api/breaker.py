@@ -0,0 +1,127 @@
+"""
+Circuit breaker для запросов к внешним API и экспоненциальная задержка между повторами.
+
+Свой breaker на каждую пару (хост, класс эндпоинта): например, api.themoviedb.org + /search/.
+После BREAKER_FAILURES неудач подряд (таймаут, ошибка соединения, 5xx) breaker открывается
+и BREAKER_OPEN_SECONDS сразу отказывает (BreakerOpen) — вызывающий отдаёт данные из кэша,
+если они есть. Затем breaker полуоткрыт: проходят до BREAKER_PROBES пробных запросов,
+успех закрывает его, неудача снова открывает. Состояние — в каждом воркере своё.
+"""
+import os
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+BREAKER_ENABLED = os.environ.get("BREAKER", "1").strip().lower() not in ("0", "false", "no", "off")
+BREAKER_FAILURES = int(os.environ.get("BREAKER_FAILURES", "5"))
+BREAKER_OPEN_SECONDS = float(os.environ.get("BREAKER_OPEN_SECONDS", "30"))
+BREAKER_PROBES = int(os.environ.get("BREAKER_PROBES", "1"))
+# Задержка перед повтором: BACKOFF_BASE * 2^попытка, не больше BACKOFF_MAX, со случайным разбросом
+BACKOFF_BASE = float(os.environ.get("BACKOFF_BASE", "0.25"))
+BACKOFF_MAX = float(os.environ.get("BACKOFF_MAX", "4"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class BreakerOpen(Exception):
+    """Запрос не отправлен: breaker открыт (внешний API недавно не отвечал)."""
+
+    def __init__(self, name: str, retry_in: float = 0):
+        super().__init__(f"{name}: circuit open, retry in {retry_in:.0f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failures: int = BREAKER_FAILURES, open_seconds: float = BREAKER_OPEN_SECONDS, probes: int = BREAKER_PROBES):
+        self.name = name
+        self.failure_threshold = failures
+        self.open_seconds = open_seconds
+        self.max_probes = probes
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_until = 0.0
+        self.probes = 0
+        self.rejected = 0
+        self.opened = 0
+
+    def allow(self) -> bool:
+        """Можно ли отправить запрос. В полуоткрытом состоянии пропускает не больше max_probes одновременно."""
+        if not BREAKER_ENABLED:
+            return True
+        with self._lock:
+            if self.state == OPEN and time.monotonic() >= self.opened_until:
+                self.state = HALF_OPEN
+                self.probes = 0
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and self.probes < self.max_probes:
+                self.probes += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def retry_in(self) -> float:
+        return max(self.opened_until - time.monotonic(), 0)
+
+    def success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.probes = 0
+
+    def abandon(self):
+        """Запрос прерван не по вине внешнего API (отмена, ошибка у нас) — освободить место пробного."""
+        with self._lock:
+            if self.state == HALF_OPEN and self.probes > 0:
+                self.probes -= 1
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.opened += 1
+                self.state = OPEN
+                self.opened_until = time.monotonic() + self.open_seconds
+                self.probes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "open_for": round(self.retry_in(), 1) if self.state == OPEN else 0,
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
+
+
+_lock = threading.Lock()
+_breakers = {}
+
+
+def get(url: str, endpoint_class: str) -> CircuitBreaker:
+    """Breaker для хоста url и класса эндпоинта (создаётся при первом обращении)."""
+    name = f"{urlparse(url).netloc}{endpoint_class}"
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _lock:
+            breaker = _breakers.setdefault(name, CircuitBreaker(name))
+    return breaker
+
+
+def backoff_delay(attempt: int) -> float:
+    """Задержка перед повтором номер attempt (с 0): экспонента с «равным» разбросом — от половины до целой."""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def stats() -> dict:
+    with _lock:
+        breakers = dict(_breakers)
+    return {name: b.stats() for name, b in sorted(breakers.items())}
@@ -0,0 +1,270 @@
+"""
+In-process кэш ответов TMDB: LRU с ограниченным размером, TTL на запись
+и stale-while-revalidate (просроченная запись отдаётся сразу, обновление идёт в фоне).
+Совсем устаревшие записи не удаляются до вытеснения: их отдаёт last_known, когда TMDB недоступен.
+
+Второй уровень (shared, api.sharedcache) — общий для воркеров: без свежей записи в памяти кэш смотрит туда,
+каждая новая запись дублируется туда же.
+"""
+import asyncio
+import contextvars
+import threading
+import time
+from collections import OrderedDict
+
+from . import metrics, ratelimit
+
+
+class _Entry:
+    __slots__ = ("value", "expires", "stale_until")
+
+    def __init__(self, value, expires: float, stale_until: float):
+        self.value = value
+        self.expires = expires
+        self.stale_until = stale_until
+
+
+class TTLCache:
+    """Потокобезопасный LRU-кэш с TTL и фоновым обновлением просроченных записей."""
+
+    def __init__(self, maxsize: int = 1024, name: str = "default", shared=None):
+        """name — метка cache в метриках Prometheus (api.metrics); shared — api.sharedcache.SharedCache или None."""
+        self.maxsize = maxsize
+        self.name = name
+        self.shared = shared
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._tasks = set()
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self.fallbacks = 0
+
+    def get(self, key, shared: bool = True):
+        """
+        (value, state): state — "fresh", "stale" или None, если записи нет или она устарела совсем.
+        shared=False — только память, без обращения ко второму уровню.
+        """
+        now = time.monotonic()
+        entry, fresh = self._local(key, now)
+        if fresh:
+            return entry.value, "fresh"
+        if shared and self.shared is not None:
+            # Свежей записи в памяти нет — возможно, её уже получил другой воркер
+            entry = self._merge_shared(key, entry, self._from_shared(key, now))
+        return self._state(key, entry, now)
+
+    async def aget(self, key):
+        """Асинхронный get: второй уровень (SQLite) читается в потоке, чтобы не блокировать event loop."""
+        now = time.monotonic()
+        entry, fresh = self._local(key, now)
+        if fresh:
+            return entry.value, "fresh"
+        if self.shared is not None:
+            entry = self._merge_shared(key, entry, await asyncio.to_thread(self._from_shared, key, now))
+        return self._state(key, entry, now)
+
+    def _local(self, key, now: float) -> tuple:
+        """(запись в памяти или None, свежая ли она); свежая поднимается в LRU."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and now < entry.expires:
+                self._data.move_to_end(key)
+                return entry, True
+        return entry, False
+
+    def _merge_shared(self, key, entry: _Entry | None, shared: _Entry | None) -> _Entry | None:
+        if shared is not None and (entry is None or shared.expires > entry.expires):
+            self._put(key, shared)
+            return shared
+        return entry
+
+    def _state(self, key, entry: _Entry | None, now: float) -> tuple:
+        if entry is None or now >= entry.stale_until:
+            return None, None
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+        return entry.value, ("fresh" if now < entry.expires else "stale")
+
+    def _from_shared(self, key, now: float, expired: bool = False) -> _Entry | None:
+        row = self.shared.get(key, expired=expired)
+        if row is None:
+            return None
+        value, expires, stale_until = row
+        # Сроки в общем кэше — по time.time(), в памяти — по monotonic
+        offset = now - time.time()
+        return _Entry(value, expires + offset, stale_until + offset)
+
+    def lookup(self, key):
+        """Свежее значение или None — с учётом в hits/misses, без загрузки и фонового обновления."""
+        value, state = self.get(key)
+        hit = state == "fresh"
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        metrics.cache_result(self.name, "hit" if hit else "miss")
+        return value if hit else None
+
+    def set(self, key, value, ttl: float, stale_ttl: float = 0):
+        now = time.monotonic()
+        self._put(key, _Entry(value, now + ttl, now + ttl + stale_ttl))
+        if self.shared is not None:
+            self._set_shared(key, value, ttl, stale_ttl)
+
+    def aset(self, key, value, ttl: float, stale_ttl: float = 0):
+        """set из event loop: запись во второй уровень — в фоне, в потоке (write-behind), ответ её не ждёт."""
+        now = time.monotonic()
+        self._put(key, _Entry(value, now + ttl, now + ttl + stale_ttl))
+        if self.shared is not None:
+            asyncio.get_running_loop().run_in_executor(None, self._set_shared, key, value, ttl, stale_ttl)
+
+    def _set_shared(self, key, value, ttl: float, stale_ttl: float):
+        wall = time.time()
+        self.shared.set(key, value, wall + ttl, wall + ttl + stale_ttl)
+
+    def _put(self, key, entry: _Entry):
+        with self._lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def last_known(self, key):
+        """Последнее значение для key, даже совсем устаревшее (None — записи нет). Из event loop — через asyncio.to_thread."""
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is None and self.shared is not None:
+            entry = self._from_shared(key, time.monotonic(), expired=True)
+            if entry is not None:
+                self._put(key, entry)
+        if entry is None:
+            return None
+        with self._lock:
+            self.fallbacks += 1
+        metrics.cache_result(self.name, "fallback")
+        return entry.value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+        if self.shared is not None:
+            self.shared.delete(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def get_or_fetch(self, key, fetch, ttl: float, stale_ttl: float = 0):
+        """
+        Значение из кэша или результат fetch().
+        Свежая запись — сразу; просроченная в пределах stale_ttl — сразу + фоновое обновление;
+        иначе — синхронный fetch. Исключения fetch пробрасываются, в кэш не попадают.
+        """
+        value, state = self.get(key)
+        if state == "fresh":
+            with self._lock:
+                self.hits += 1
+            metrics.cache_result(self.name, "hit")
+            return value
+        if state == "stale":
+            with self._lock:
+                self.stale_hits += 1
+            metrics.cache_result(self.name, "stale")
+            self._refresh_in_background(key, fetch, ttl, stale_ttl)
+            return value
+        with self._lock:
+            self.misses += 1
+        metrics.cache_result(self.name, "miss")
+        value = fetch()
+        self.set(key, value, ttl, stale_ttl)
+        return value
+
+    async def aget_or_fetch(self, key, afetch, ttl: float, stale_ttl: float = 0):
+        """
+        Асинхронный вариант get_or_fetch: afetch — функция без аргументов, возвращающая корутину.
+        Второй уровень читается и пишется в потоках (aget, aset): SQLite не блокирует event loop.
+        """
+        value, state = await self.aget(key)
+        if state == "fresh":
+            with self._lock:
+                self.hits += 1
+            metrics.cache_result(self.name, "hit")
+            return value
+        if state == "stale":
+            with self._lock:
+                self.stale_hits += 1
+            metrics.cache_result(self.name, "stale")
+            self._arefresh_in_background(key, afetch, ttl, stale_ttl)
+            return value
+        with self._lock:
+            self.misses += 1
+        metrics.cache_result(self.name, "miss")
+        value = await afetch()
+        self.aset(key, value, ttl, stale_ttl)
+        return value
+
+    def _arefresh_in_background(self, key, afetch, ttl, stale_ttl):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        async def run():
+            try:
+                with ratelimit.lane(ratelimit.BACKGROUND):
+                    value = await afetch()
+                self.aset(key, value, ttl, stale_ttl)
+            except Exception:
+                pass
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        # Пустой контекст: фоновое обновление не ограничено бюджетом запроса, который его запустил (api.deadlines).
+        # Запросы к TMDB — в фоновой полосе лимита (api.ratelimit), как и у потока в _refresh_in_background.
+        # Держим ссылку на задачу, иначе её может собрать GC до завершения
+        task = contextvars.Context().run(asyncio.get_running_loop().create_task, run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _refresh_in_background(self, key, fetch, ttl, stale_ttl):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                self.set(key, ratelimit.background(fetch), ttl, stale_ttl)
+            except Exception:
+                # Оставляем старую запись: её отдадим до истечения stale_until
+                pass
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, name="cache-refresh", daemon=True).start()
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "fallbacks": self.fallbacks,
+                "refreshing": len(self._refreshing),
+            }
+        if self.shared is not None:
+            out["shared"] = self.shared.stats()
+        return out
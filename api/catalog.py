@@ -0,0 +1,119 @@
+"""
+Материализованный каталог discover по жанрам и годам (таблицы api_catalogcell / api_catalogentry).
+
+Команда refresh_catalog сохраняет ответы /discover/movie для каждой пары (жанр, год),
+services.search_by_genre читает их индексированным запросом. Диапазон лет (2015-2021)
+собирается из ячеек отдельных лет — без запроса к TMDB. Если хоть одной ячейки
+диапазона нет, lookup возвращает None и поиск идёт в TMDB как раньше.
+"""
+import os
+
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+from .models import CatalogCell, CatalogEntry
+
+CATALOG_ENABLED = os.environ.get("CATALOG", "1").strip().lower() not in ("0", "false", "no", "off")
+# Год-ячейка для запроса без года (discover без фильтра по дате)
+ALL_YEARS = 0
+
+_FIELDS = ("tmdb_id", "title", "original_title", "release_date", "vote_count", "popularity", "poster_path")
+
+
+def lookup(genre_id: int, years: tuple | None, limit: int = 20) -> list | None:
+    """
+    Элементы в формате TMDB (id, title, release_date, ...) по убыванию популярности.
+    years — (от, до) включительно или None (без фильтра по году). None — ячейки не материализованы.
+    """
+    if not CATALOG_ENABLED:
+        return None
+    start, end = years if years else (ALL_YEARS, ALL_YEARS)
+    try:
+        cells = CatalogCell.objects.filter(genre_id=genre_id, year__gte=start, year__lte=end).count()
+        if cells != end - start + 1:
+            return None
+        rows = (
+            CatalogEntry.objects.filter(genre_id=genre_id, year__gte=start, year__lte=end)
+            .order_by("-popularity")
+            .values_list(*_FIELDS)[: limit * 2]
+        )
+        rows = list(rows)
+    except DatabaseError:
+        return None
+    items = []
+    seen = set()
+    for tmdb_id, title, original_title, release_date, vote_count, popularity, poster_path in rows:
+        # Фильм с датами в разных годах (перевыпуск) может попасть в две ячейки диапазона
+        if tmdb_id in seen:
+            continue
+        seen.add(tmdb_id)
+        items.append({
+            "id": tmdb_id,
+            "title": title,
+            "original_title": original_title,
+            "release_date": release_date,
+            "vote_count": vote_count,
+            "popularity": popularity,
+            "poster_path": poster_path or None,
+        })
+        if len(items) >= limit:
+            break
+    return items
+
+
+def store_cell(genre_id: int, year: int, items: list) -> int:
+    """Заменить содержимое ячейки (genre_id, year) элементами discover. Возвращает число сохранённых."""
+    entries = {}
+    for x in items or []:
+        if not isinstance(x, dict) or not x.get("id"):
+            continue
+        entries[x["id"]] = CatalogEntry(
+            genre_id=genre_id,
+            year=year,
+            tmdb_id=x["id"],
+            title=(x.get("title") or "")[:500],
+            original_title=(x.get("original_title") or "")[:500],
+            release_date=(x.get("release_date") or "")[:10],
+            vote_count=int(x.get("vote_count") or 0),
+            popularity=float(x.get("popularity") or 0),
+            poster_path=(x.get("poster_path") or "")[:255],
+        )
+    with transaction.atomic():
+        CatalogEntry.objects.filter(genre_id=genre_id, year=year).delete()
+        CatalogEntry.objects.bulk_create(entries.values())
+        CatalogCell.objects.update_or_create(
+            genre_id=genre_id,
+            year=year,
+            defaults={"total": len(entries), "refreshed_at": timezone.now()},
+        )
+    return len(entries)
+
+
+def stale_cells(genre_ids, years, max_age, past_max_age) -> list:
+    """Пары (genre_id, year), которых нет или которые старше max_age (прошлые годы — past_max_age)."""
+    now = timezone.now()
+    current_year = now.year
+    refreshed = {
+        (c.genre_id, c.year): c.refreshed_at
+        for c in CatalogCell.objects.filter(genre_id__in=list(genre_ids))
+    }
+    out = []
+    for genre_id in genre_ids:
+        for year in years:
+            at = refreshed.get((genre_id, year))
+            # Фильмы прошлых лет почти не меняются — обновляем их реже
+            age_limit = past_max_age if ALL_YEARS < year < current_year - 1 else max_age
+            if at is None or now - at > age_limit:
+                out.append((genre_id, year))
+    return out
+
+
+def stats() -> dict:
+    try:
+        return {
+            "enabled": CATALOG_ENABLED,
+            "cells": CatalogCell.objects.count(),
+            "entries": CatalogEntry.objects.count(),
+        }
+    except DatabaseError:
+        return {"enabled": CATALOG_ENABLED, "cells": 0, "entries": 0}
@@ -0,0 +1,215 @@
+"""
+Бюджет времени запроса (deadline) и адаптивные таймауты запросов к TMDB.
+
+Вьюха объявляет свой бюджет — @view_budget("movie_detail"), секунды из VIEW_BUDGETS. Срок отсчитывается от
+прихода запроса в nginx (X-Request-Start: t=<секунды>), без заголовка — от входа во вьюху. Запросы к
+источникам внутри вьюхи (services._fetch, aservices._afetch, постеры) ждут и повторяют попытки только
+в пределах оставшегося времени: ответ, которого клиент уже не дождётся, не держит воркер.
+
+Таймаут одного запроса к TMDB — по наблюдаемым задержкам класса эндпоинта: p99 × TMDB_TIMEOUT_FACTOR,
+но не меньше TMDB_TIMEOUT_MIN и не больше services.TMDB_TIMEOUT. Пока замеров мало — TMDB_TIMEOUT.
+С TMDB_HEDGE=1 запрос, не получивший ответа за p95, дублируется вторым (upstream.hedged_get).
+"""
+import contextvars
+import functools
+import os
+import threading
+import time
+from collections import deque
+
+from asgiref.sync import iscoroutinefunction
+
+DEADLINES_ENABLED = os.environ.get("DEADLINES", "1").strip().lower() not in ("0", "false", "no", "off")
+# Вьюха (имя функции в api.views / api.async_views) -> сколько секунд на ответ, включая ожидание в очереди
+VIEW_BUDGETS = {
+    "home": 8,
+    "popular_now": 6,
+    "popular_movies": 6,
+    "popular_series": 6,
+    "coming_soon": 8,
+    "movie_list": 8,
+    "search_by_genre": 8,
+    "movie_detail": 6,
+    "movie_watch": 6,
+    "movie_batch": 10,
+    # Не успели — редирект на оригинал, браузер загрузит картинку сам
+    "poster_proxy": 10,
+}
+# Учитывать время в очереди nginx (proxy_set_header X-Request-Start "t=${msec}")
+DEADLINE_REQUEST_START = os.environ.get("DEADLINE_REQUEST_START", "1").strip().lower() not in ("0", "false", "no", "off")
+
+TMDB_ADAPTIVE_TIMEOUT = os.environ.get("TMDB_ADAPTIVE_TIMEOUT", "1").strip().lower() not in ("0", "false", "no", "off")
+TMDB_TIMEOUT_MIN = float(os.environ.get("TMDB_TIMEOUT_MIN", "2"))
+TMDB_TIMEOUT_FACTOR = float(os.environ.get("TMDB_TIMEOUT_FACTOR", "3"))
+# Хеджирование: второй GET, если первый не ответил за p95 (но не раньше TMDB_HEDGE_MIN_DELAY секунд)
+TMDB_HEDGE = os.environ.get("TMDB_HEDGE", "0").strip().lower() in ("1", "true", "yes", "on")
+TMDB_HEDGE_MIN_DELAY = float(os.environ.get("TMDB_HEDGE_MIN_DELAY", "0.05"))
+# Последних замеров на класс эндпоинта и сколько нужно, чтобы им доверять
+LATENCY_WINDOW = int(os.environ.get("TMDB_LATENCY_WINDOW", "200"))
+LATENCY_MIN_SAMPLES = int(os.environ.get("TMDB_LATENCY_MIN_SAMPLES", "20"))
+
+_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Бюджет запроса исчерпан — к источнику не обращаемся."""
+
+    def __init__(self, what: str = ""):
+        super().__init__(f"Request deadline exceeded{': ' + what if what else ''}")
+
+
+def _queued(request) -> float:
+    """Сколько секунд запрос ждал до воркера по X-Request-Start (0 — заголовка нет или он неправдоподобен)."""
+    raw = request.META.get("HTTP_X_REQUEST_START", "")
+    if not raw or not DEADLINE_REQUEST_START:
+        return 0.0
+    try:
+        started = float(raw.strip().removeprefix("t="))
+    except ValueError:
+        return 0.0
+    # nginx ${msec} — секунды; встречаются и милли-/микросекунды
+    while started > 1e11:
+        started /= 1000
+    waited = time.time() - started
+    return waited if 0 < waited < 3600 else 0.0
+
+
+def _start(request, seconds: float):
+    return _deadline.set(time.monotonic() + seconds - _queued(request))
+
+
+def view_budget(name: str):
+    """Декоратор вьюхи (синхронной или async): запросы к источникам внутри укладываются в VIEW_BUDGETS[name]."""
+    seconds = VIEW_BUDGETS[name]
+
+    def decorator(view):
+        if not DEADLINES_ENABLED:
+            return view
+        if iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                token = _start(request, seconds)
+                try:
+                    return await view(request, *args, **kwargs)
+                finally:
+                    _deadline.reset(token)
+
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            token = _start(request, seconds)
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                _deadline.reset(token)
+
+        return wrapper
+
+    return decorator
+
+
+def remaining() -> float | None:
+    """Сколько секунд осталось у текущего запроса (None — бюджета нет: прогрев, команды, фоновое обновление)."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def until(limit: float) -> float:
+    """Срок (time.monotonic()) для операции, которой самой отведено limit секунд, с учётом бюджета запроса."""
+    deadline = time.monotonic() + limit
+    request_deadline = _deadline.get()
+    return deadline if request_deadline is None else min(deadline, request_deadline)
+
+
+def bind(fn):
+    """fn в копии текущего контекста — чтобы бюджет запроса действовал и в пуле потоков."""
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+class LatencyWindow:
+    """Последние LATENCY_WINDOW задержек (секунд) одного класса эндпоинтов."""
+
+    def __init__(self, size: int = LATENCY_WINDOW):
+        self._samples = deque(maxlen=size)
+        self._sorted = None
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+            self._sorted = None
+
+    def percentile(self, q: float) -> float | None:
+        """q-квантиль (0..1) или None, пока замеров меньше LATENCY_MIN_SAMPLES."""
+        with self._lock:
+            if len(self._samples) < LATENCY_MIN_SAMPLES:
+                return None
+            if self._sorted is None:
+                self._sorted = sorted(self._samples)
+            values = self._sorted
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    def __len__(self):
+        return len(self._samples)
+
+
+_windows = {}
+_windows_lock = threading.Lock()
+
+
+def _window(endpoint: str) -> LatencyWindow:
+    window = _windows.get(endpoint)
+    if window is None:
+        with _windows_lock:
+            window = _windows.setdefault(endpoint, LatencyWindow())
+    return window
+
+
+def record(endpoint: str, seconds: float):
+    """
+    Задержка ответа TMDB. Таймауты тоже записываются (временем до таймаута): иначе при замедлении
+    TMDB окно видело бы только быстрые ответы и таймаут не рос бы вслед за задержкой.
+    """
+    _window(endpoint).add(seconds)
+
+
+def timeout(endpoint: str, default: float) -> float:
+    """Таймаут запроса к endpoint: p99 × TMDB_TIMEOUT_FACTOR в пределах [TMDB_TIMEOUT_MIN, default]."""
+    if not TMDB_ADAPTIVE_TIMEOUT:
+        return default
+    p99 = _window(endpoint).percentile(0.99)
+    if p99 is None:
+        return default
+    return min(default, max(TMDB_TIMEOUT_MIN, p99 * TMDB_TIMEOUT_FACTOR))
+
+
+def hedge_after(endpoint: str, timeout: float) -> float | None:
+    """Через сколько секунд дублировать запрос (p95); None — хеджирование выключено, мало замеров или не успеть."""
+    if not TMDB_HEDGE:
+        return None
+    p95 = _window(endpoint).percentile(0.95)
+    if p95 is None:
+        return None
+    delay = max(p95, TMDB_HEDGE_MIN_DELAY)
+    # Второму запросу нужно хоть какое-то время до таймаута
+    return delay if delay < timeout / 2 else None
+
+
+def stats() -> dict:
+    with _windows_lock:
+        windows = dict(_windows)
+    return {
+        "enabled": DEADLINES_ENABLED,
+        "adaptive_timeout": TMDB_ADAPTIVE_TIMEOUT,
+        "hedge": TMDB_HEDGE,
+        "endpoints": {
+            endpoint: {
+                "samples": len(window),
+                "p50": window.percentile(0.5),
+                "p95": window.percentile(0.95),
+                "p99": window.percentile(0.99),
+            }
+            for endpoint, window in sorted(windows.items())
+        },
+    }
@@ -0,0 +1,145 @@
+"""
+Документация API (Swagger) без drf_yasg в рабочем процессе.
+
+Схема генерируется один раз командой generate_openapi (при деплое) в OPENAPI_DIR: openapi.json и
+страница Swagger UI. Корень сайта отдаёт эти файлы из памяти с ETag и Last-Modified (повторный
+запрос — 304). drf_yasg импортируется только командой и живой схемой (API_DOCS=live или нет файлов).
+
+Вьюхи описываются как раньше — swagger_auto_schema(...) и openapi.Parameter(...), но из этого модуля:
+декоратор только запоминает описание, к вьюхам его применяет apply() перед генерацией схемы.
+"""
+import hashlib
+import os
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotFound
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+# auto — готовые файлы, если есть, иначе живая схема; static — только файлы; live — drf_yasg на каждый запрос; off — без документации
+API_DOCS = os.environ.get("API_DOCS", "auto").strip().lower()
+OPENAPI_DIR = Path(os.environ.get("OPENAPI_DIR") or Path(settings.BASE_DIR) / "openapi")
+SCHEMA_FILE = "openapi.json"
+UI_FILE = "swagger-ui.html"
+
+
+class _Parameter:
+    """Отложенный drf_yasg.openapi.Parameter: аргументы сохраняются до apply()."""
+
+    def __init__(self, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+
+    def build(self):
+        from drf_yasg import openapi as yasg_openapi
+
+        return yasg_openapi.Parameter(*self.args, **self.kwargs)
+
+
+# Те же значения, что у констант drf_yasg.openapi
+openapi = SimpleNamespace(
+    Parameter=_Parameter,
+    IN_QUERY="query",
+    IN_PATH="path",
+    TYPE_STRING="string",
+    TYPE_INTEGER="integer",
+    TYPE_BOOLEAN="boolean",
+)
+
+_pending = []
+_applied = False
+_apply_lock = threading.Lock()
+
+
+def swagger_auto_schema(**kwargs):
+    """Как drf_yasg.utils.swagger_auto_schema, но описание применяется к вьюхе только в apply()."""
+
+    def decorator(view):
+        _pending.append((view, kwargs))
+        return view
+
+    return decorator
+
+
+def apply():
+    """Применить отложенные описания к вьюхам (импортирует drf_yasg). Повторный вызов ничего не делает."""
+    global _applied
+    from drf_yasg.utils import swagger_auto_schema as yasg_swagger_auto_schema
+
+    with _apply_lock:
+        if _applied:
+            return
+        for view, kwargs in _pending:
+            kwargs = dict(kwargs)
+            if "manual_parameters" in kwargs:
+                kwargs["manual_parameters"] = [p.build() if isinstance(p, _Parameter) else p for p in kwargs["manual_parameters"]]
+            yasg_swagger_auto_schema(**kwargs)(view)
+        _applied = True
+
+
+class _File:
+    __slots__ = ("body", "etag", "mtime")
+
+    def __init__(self, path: Path):
+        self.body = path.read_bytes()
+        self.mtime = int(path.stat().st_mtime)
+        self.etag = '"{}"'.format(hashlib.blake2b(self.body, digest_size=16).hexdigest())
+
+
+_files = {}
+
+
+def _static_file(name: str) -> _File | None:
+    """Файл из OPENAPI_DIR, прочитанный один раз (перечитывается, если команда сгенерировала новый)."""
+    path = OPENAPI_DIR / name
+    try:
+        mtime = int(path.stat().st_mtime)
+    except OSError:
+        return None
+    cached = _files.get(name)
+    if cached is None or cached.mtime != mtime:
+        try:
+            cached = _files[name] = _File(path)
+        except OSError:
+            return None
+    return cached
+
+
+def _static_response(request, name: str, content_type: str) -> HttpResponse | None:
+    f = _static_file(name)
+    if f is None:
+        return None
+    response = get_conditional_response(request, etag=f.etag, last_modified=f.mtime)
+    if response is None:
+        response = HttpResponse(f.body, content_type=content_type)
+    response["ETag"] = f.etag
+    response["Last-Modified"] = http_date(f.mtime)
+    # Версия меняется только при деплое — браузер проверяет её каждый раз, обычно получая 304
+    response["Cache-Control"] = "public, no-cache"
+    return response
+
+
+def root_view(schema_view_factory):
+    """
+    Вьюха корня: Swagger UI, с ?format=openapi — сама схема. schema_view_factory() -> drf_yasg schema view,
+    вызывается только для живой схемы.
+    """
+
+    def docs(request):
+        if API_DOCS == "off":
+            return HttpResponseNotFound()
+        if API_DOCS != "live":
+            if request.GET.get("format") == "openapi":
+                response = _static_response(request, SCHEMA_FILE, "application/json")
+            else:
+                response = _static_response(request, UI_FILE, "text/html; charset=utf-8")
+            if response is not None:
+                return response
+            if API_DOCS == "static":
+                return HttpResponseNotFound("OpenAPI schema is not generated: python manage.py generate_openapi")
+        return schema_view_factory().with_ui("swagger", cache_timeout=0)(request)
+
+    return docs
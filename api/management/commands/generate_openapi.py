@@ -0,0 +1,48 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from api import docs
+
+
+class Command(BaseCommand):
+    help = (
+        "Сгенерировать схему OpenAPI и страницу Swagger UI в OPENAPI_DIR (api.docs). "
+        "Запускать при деплое: корень сайта отдаёт эти файлы без drf_yasg."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output-dir", default=str(docs.OPENAPI_DIR), help="Куда записать файлы (по умолчанию OPENAPI_DIR).")
+        parser.add_argument(
+            "--url", default=None,
+            help="Базовый URL API в схеме, напр. https://api.example.com. По умолчанию не указывается — Swagger UI берёт хост страницы.",
+        )
+
+    def handle(self, *args, output_dir, url, **options):
+        from config.urls import schema_view
+
+        view = schema_view(url)
+        factory = RequestFactory()
+        schema = view.without_ui(cache_timeout=0)(factory.get("/", {"format": "openapi"}))
+        schema.render()
+        data = json.loads(schema.content)
+        if not url:
+            # Хост и схема из RequestFactory (testserver, http) неверны — без них клиент использует адрес страницы
+            data.pop("host", None)
+            data.pop("schemes", None)
+        ui = view.with_ui("swagger", cache_timeout=0)(factory.get("/"))
+        ui.render()
+
+        os.makedirs(output_dir, exist_ok=True)
+        self._write(os.path.join(output_dir, docs.SCHEMA_FILE), json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8"))
+        self._write(os.path.join(output_dir, docs.UI_FILE), ui.content)
+        self.stdout.write(self.style.SUCCESS(f"Схема: {len(data.get('paths', {}))} путей -> {output_dir}"))
+
+    def _write(self, path: str, content: bytes):
+        # Атомарно: воркеры могут читать файл в этот момент
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(content)
+        os.replace(tmp, path)
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import ratelimit, services, titles
+
+# Списки TMDB, из которых набираем названия: (путь, тип)
+SOURCES = {
+    "popular": (("/movie/popular", "movie"), ("/tv/popular", "tv")),
+    "top_rated": (("/movie/top_rated", "movie"), ("/tv/top_rated", "tv")),
+    "trending": (("/trending/all/week", None),),
+    "upcoming": (("/movie/upcoming", "movie"),),
+}
+
+
+class Command(BaseCommand):
+    help = "Заполнить локальный индекс названий (api.titles) страницами списков TMDB."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pages", type=int, default=20, help="Страниц на каждый список (по 20 названий).")
+        parser.add_argument(
+            "--sources",
+            default=",".join(SOURCES),
+            help=f"Списки через запятую: {', '.join(SOURCES)}.",
+        )
+
+    def handle(self, *args, pages, sources, **options):
+        if not services._api_key():
+            raise CommandError("TMDB_API_KEY не задан")
+        names = [s.strip() for s in sources.split(",") if s.strip()]
+        unknown = [s for s in names if s not in SOURCES]
+        if unknown:
+            raise CommandError(f"Неизвестные списки: {', '.join(unknown)}")
+        total = 0
+        for name in names:
+            for path, media_type in SOURCES[name]:
+                for page in range(1, pages + 1):
+                    # Мимо кэша: массовая загрузка не должна вытеснять горячие ответы; в фоновой полосе лимита TMDB
+                    data = ratelimit.background(
+                        services._fetch, f"{services.TMDB_BASE}{path}", services._params({"page": page}), True
+                    )
+                    items = data.get("results") or []
+                    total += titles.index_items(items, media_type)
+                    if page >= (data.get("total_pages") or 0):
+                        break
+                self.stdout.write(f"{path}: ok")
+        # _fetch тоже ставит ответы в очередь индексации — записываем её сразу, не дожидаясь фонового потока
+        titles.flush()
+        self.stdout.write(self.style.SUCCESS(f"Проиндексировано названий: {total}"))
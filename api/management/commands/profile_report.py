@@ -0,0 +1,79 @@
+import pstats
+import re
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api import profiling
+
+_LIB_RE = re.compile(r"^.*/lib/python\d+\.\d+/(?:site-packages/)?")
+
+
+class Command(BaseCommand):
+    help = (
+        "Сводка профилей из PROFILE_DIR (api.profiling): время по фазам для каждого маршрута "
+        "и top-N самых горячих функций по всем выбранным профилям."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", default=str(profiling.PROFILE_DIR), help="Каталог профилей (по умолчанию PROFILE_DIR).")
+        parser.add_argument("--top", type=int, default=30, help="Сколько функций показать.")
+        parser.add_argument(
+            "--sort", default="tottime", choices=("tottime", "cumulative", "ncalls"),
+            help="tottime — собственное время функции, cumulative — с вложенными вызовами.",
+        )
+        parser.add_argument("--route", default="", help="Только профили этого маршрута, напр. api/v1/movies/<int:movie_id>.")
+        parser.add_argument("--since", type=float, default=0, help="Только профили за последние столько часов.")
+
+    def handle(self, *args, dir, top, sort, route, since, **options):
+        profiles = profiling.load(dir)
+        if route:
+            profiles = [p for p in profiles if p.get("route") == route]
+        if since:
+            profiles = [p for p in profiles if p.get("time", 0) >= time.time() - since * 3600]
+        if not profiles:
+            raise CommandError(f"Нет профилей в {dir}")
+
+        self.stdout.write(f"Профилей: {len(profiles)}\n")
+        self._phases(profiles)
+        stats = pstats.Stats(*(p["prof"] for p in profiles))
+        self._hot_functions(stats, len(profiles), top, sort)
+
+    def _phases(self, profiles: list):
+        """Среднее время (мс) по фазам для каждого маршрута."""
+        by_route = defaultdict(list)
+        for profile in profiles:
+            by_route[profile.get("route") or profile.get("path")].append(profile)
+        header = f"{'маршрут':<45} {'n':>5} {'total':>9}" + "".join(f" {phase:>10}" for phase in profiling.PHASES)
+        self.stdout.write(header)
+        for name, items in sorted(by_route.items(), key=lambda kv: -sum(p["total"] for p in kv[1])):
+            n = len(items)
+            row = f"{name:<45} {n:>5} {sum(p['total'] for p in items) / n * 1000:>9.1f}"
+            for phase in profiling.PHASES:
+                row += f" {sum(p['phases'].get(phase, 0) for p in items) / n * 1000:>10.1f}"
+            self.stdout.write(row)
+        self.stdout.write("")
+
+    def _hot_functions(self, stats: pstats.Stats, count: int, top: int, sort: str):
+        """Top-N функций: вызовов, собственное и полное время (мс на профиль) и доля от всего собственного времени."""
+        rows = [
+            (func, calls, tottime, cumtime)
+            for func, (_, calls, tottime, cumtime, _) in stats.stats.items()
+        ]
+        total = sum(row[2] for row in rows) or 1
+        key = {"tottime": 2, "cumulative": 3, "ncalls": 1}[sort]
+        rows.sort(key=lambda row: row[key], reverse=True)
+        self.stdout.write(f"{'ncalls':>10} {'tottime':>9} {'cumtime':>9} {'%':>6}  функция (мс на профиль)")
+        for (filename, line, name), calls, tottime, cumtime in rows[:top]:
+            where = f"{_short(filename)}:{line}({name})" if line else name
+            self.stdout.write(
+                f"{calls:>10} {tottime / count * 1000:>9.2f} {cumtime / count * 1000:>9.2f} {tottime / total * 100:>6.1f}  {where}"
+            )
+
+
+def _short(filename: str) -> str:
+    """Путь относительно проекта, стандартной библиотеки или site-packages."""
+    filename = _LIB_RE.sub("", filename)
+    return filename.removeprefix(f"{settings.BASE_DIR}/")
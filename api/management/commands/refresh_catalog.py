@@ -0,0 +1,46 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import catalog, ratelimit, services
+
+
+class Command(BaseCommand):
+    help = (
+        "Обновить материализованный каталог discover по жанрам и годам (api.catalog). "
+        "Обновляются только отсутствующие и устаревшие ячейки."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--years", default=f"1980-{date.today().year}", help="Диапазон лет, напр. 1980-2026.")
+        parser.add_argument("--genres", default="", help="Жанры через запятую (по умолчанию — все из TMDB_GENRE_IDS).")
+        parser.add_argument("--pages", type=int, default=1, help="Страниц discover на ячейку (по 20 фильмов).")
+        parser.add_argument("--max-age", type=float, default=24, help="Обновлять ячейки старше стольких часов.")
+        parser.add_argument("--past-max-age", type=float, default=24 * 7, help="То же для прошлых лет (кроме текущего и предыдущего).")
+        parser.add_argument("--force", action="store_true", help="Обновить все ячейки независимо от возраста.")
+
+    def handle(self, *args, years, genres, pages, max_age, past_max_age, force, **options):
+        if not services._api_key():
+            raise CommandError("TMDB_API_KEY не задан")
+        try:
+            start, end = services._year_bounds(years)
+        except ValueError:
+            low, high = services.year_range()
+            raise CommandError(f"--years: год или диапазон в пределах {low}-{high}, напр. 1980-2026")
+        names = [g.strip().lower() for g in genres.split(",") if g.strip()] or list(services.TMDB_GENRE_IDS)
+        unknown = [g for g in names if g not in services.TMDB_GENRE_IDS]
+        if unknown:
+            raise CommandError(f"Неизвестные жанры: {', '.join(unknown)}")
+        genre_ids = {services.TMDB_GENRE_IDS[g]: g for g in names}
+        year_list = [catalog.ALL_YEARS] + list(range(start, end + 1))
+
+        if force:
+            cells = [(g, y) for g in genre_ids for y in year_list]
+        else:
+            cells = catalog.stale_cells(genre_ids, year_list, timedelta(hours=max_age), timedelta(hours=past_max_age))
+        self.stdout.write(f"Ячеек к обновлению: {len(cells)}")
+
+        for genre_id, year in cells:
+            stored = ratelimit.background(services.refresh_catalog_cell, genre_ids[genre_id], year, pages)
+            self.stdout.write(f"{genre_ids[genre_id]} {year or 'все годы'}: {stored}")
+        self.stdout.write(self.style.SUCCESS("Готово"))
@@ -0,0 +1,156 @@
+"""
+Метрики Prometheus: /metrics в текстовом формате.
+
+- http_request_duration_seconds — время ответа по маршруту (шаблон из urls.py, а не сам путь), методу и статусу;
+- http_requests_in_flight — запросы в обработке;
+- tmdb_request_duration_seconds, tmdb_responses_total, tmdb_retries_total, tmdb_requests_in_flight —
+  запросы к TMDB по классу эндпоинта (как у circuit breaker: /search/, /discover/, /movie/ ...);
+- cache_requests_total — попадания, устаревшие записи (stale), промахи и ответы last_known (fallback)
+  кэша ответов TMDB и дискового кэша постеров;
+- poster_bytes_total — отданные байты постеров: из кэша и потоком от источника.
+
+Под gunicorn у каждого воркера свои счётчики. Чтобы /metrics отдавал сумму по всем воркерам,
+задайте PROMETHEUS_MULTIPROC_DIR (пустой каталог, очищается при старте — см. gunicorn.conf.py):
+воркеры пишут значения в mmap-файлы, а /metrics собирает их все.
+"""
+import hmac
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.decorators import sync_and_async_middleware
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+METRICS_ENABLED = os.environ.get("METRICS", "1").strip().lower() not in ("0", "false", "no", "off")
+# Если задан — /metrics требует заголовок Authorization: Bearer <METRICS_TOKEN>
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "").strip()
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR", "").strip()
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Время ответа API по маршруту",
+    ["route", "method", "status"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "Запросы к API в обработке",
+    multiprocess_mode="livesum",
+)
+TMDB_DURATION = Histogram(
+    "tmdb_request_duration_seconds",
+    "Время запроса к TMDB (одна попытка, без ожидания лимита)",
+    ["endpoint"],
+)
+TMDB_RESPONSES = Counter(
+    "tmdb_responses",
+    "Ответы TMDB по статусу; timeout и error — ответа не было",
+    ["endpoint", "status"],
+)
+TMDB_RETRIES = Counter(
+    "tmdb_retries",
+    "Повторные попытки запросов к TMDB",
+    ["endpoint"],
+)
+TMDB_HEDGES = Counter(
+    "tmdb_hedged_requests",
+    "Хеджирование запросов к TMDB: result=sent — отправлен второй запрос, won — он ответил первым",
+    ["endpoint", "result"],
+)
+TMDB_IN_FLIGHT = Gauge(
+    "tmdb_requests_in_flight",
+    "Запросы к TMDB в ожидании ответа",
+    multiprocess_mode="livesum",
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests",
+    "Обращения к кэшу: hit, stale, miss, fallback",
+    ["cache", "result"],
+)
+POSTER_BYTES = Counter(
+    "poster_bytes",
+    "Отданные байты постеров",
+    ["source"],
+)
+
+
+def cache_result(cache: str, result: str):
+    CACHE_REQUESTS.labels(cache, result).inc()
+
+
+def tmdb_response(endpoint: str, status, seconds: float):
+    """Итог одной попытки запроса к TMDB: status — код ответа, "timeout" или "error"."""
+    TMDB_DURATION.labels(endpoint).observe(seconds)
+    TMDB_RESPONSES.labels(endpoint, str(status)).inc()
+
+
+def tmdb_retry(endpoint: str):
+    TMDB_RETRIES.labels(endpoint).inc()
+
+
+def tmdb_hedge(endpoint: str, result: str):
+    TMDB_HEDGES.labels(endpoint, result).inc()
+
+
+def poster_bytes(source: str, size: int):
+    POSTER_BYTES.labels(source).inc(size)
+
+
+def _route(request) -> str:
+    match = getattr(request, "resolver_match", None)
+    return match.route if match is not None else UNMATCHED_ROUTE
+
+
+def _observe(request, response, started: float):
+    REQUEST_DURATION.labels(_route(request), request.method, str(response.status_code)).observe(time.perf_counter() - started)
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """
+    Время ответа и число запросов в обработке. Для потоковых ответов (NDJSON, постеры)
+    время — до начала отдачи тела.
+    """
+    if not METRICS_ENABLED:
+        raise MiddlewareNotUsed
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            started = time.perf_counter()
+            with REQUESTS_IN_FLIGHT.track_inprogress():
+                response = await get_response(request)
+            _observe(request, response, started)
+            return response
+    else:
+        def middleware(request):
+            started = time.perf_counter()
+            with REQUESTS_IN_FLIGHT.track_inprogress():
+                response = get_response(request)
+            _observe(request, response, started)
+            return response
+
+    return middleware
+
+
+def _registry():
+    if not MULTIPROC_DIR:
+        return REGISTRY
+    # Значения всех воркеров (и завершившихся — для счётчиков) из файлов в PROMETHEUS_MULTIPROC_DIR
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def metrics_view(request):
+    """GET /metrics — метрики в текстовом формате Prometheus."""
+    if not METRICS_ENABLED:
+        return HttpResponse(status=404)
+    if METRICS_TOKEN:
+        auth = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(auth.encode("utf-8"), f"Bearer {METRICS_TOKEN}".encode("utf-8")):
+            return HttpResponseForbidden()
+    return HttpResponse(generate_latest(_registry()), content_type=CONTENT_TYPE_LATEST)
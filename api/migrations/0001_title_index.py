@@ -0,0 +1,83 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:01
+
+from django.db import migrations, models
+
+# Полнотекстовый индекс названий (SQLite FTS5) поверх api_title, синхронизируется триггерами.
+# unicode61 приводит к нижнему регистру и кириллицу; prefix — быстрый поиск по началу слова (typeahead).
+FTS_SQL = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS api_title_fts USING fts5(
+        name, original_name,
+        content='api_title', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS api_title_ai AFTER INSERT ON api_title BEGIN
+        INSERT INTO api_title_fts(rowid, name, original_name) VALUES (new.id, new.name, new.original_name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS api_title_ad AFTER DELETE ON api_title BEGIN
+        INSERT INTO api_title_fts(api_title_fts, rowid, name, original_name) VALUES ('delete', old.id, old.name, old.original_name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS api_title_au AFTER UPDATE OF name, original_name ON api_title BEGIN
+        INSERT INTO api_title_fts(api_title_fts, rowid, name, original_name) VALUES ('delete', old.id, old.name, old.original_name);
+        INSERT INTO api_title_fts(rowid, name, original_name) VALUES (new.id, new.name, new.original_name);
+    END
+    """,
+)
+
+FTS_DROP_SQL = (
+    "DROP TRIGGER IF EXISTS api_title_au",
+    "DROP TRIGGER IF EXISTS api_title_ad",
+    "DROP TRIGGER IF EXISTS api_title_ai",
+    "DROP TABLE IF EXISTS api_title_fts",
+)
+
+
+def create_fts(apps, schema_editor):
+    # FTS5 есть только в SQLite; на других БД локальный поиск просто выключен (api.titles)
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for sql in FTS_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for sql in FTS_DROP_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Title',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('media_type', models.CharField(choices=[('movie', 'Фильм'), ('tv', 'Сериал')], max_length=5)),
+                ('tmdb_id', models.IntegerField()),
+                ('name', models.CharField(max_length=500)),
+                ('original_name', models.CharField(blank=True, default='', max_length=500)),
+                ('year', models.IntegerField(blank=True, null=True)),
+                ('votes', models.IntegerField(default=0)),
+                ('popularity', models.FloatField(default=0)),
+                ('poster_path', models.CharField(blank=True, default='', max_length=255)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('media_type', 'tmdb_id'), name='api_title_media_tmdb_uniq')],
+            },
+        ),
+        migrations.RunPython(create_fts, drop_fts),
+    ]
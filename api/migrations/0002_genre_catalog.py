@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_title_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('genre_id', models.IntegerField()),
+                ('year', models.IntegerField()),
+                ('total', models.IntegerField(default=0)),
+                ('refreshed_at', models.DateTimeField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('genre_id', 'year'), name='api_catalogcell_genre_year_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CatalogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('genre_id', models.IntegerField()),
+                ('year', models.IntegerField()),
+                ('tmdb_id', models.IntegerField()),
+                ('title', models.CharField(blank=True, default='', max_length=500)),
+                ('original_title', models.CharField(blank=True, default='', max_length=500)),
+                ('release_date', models.CharField(blank=True, default='', max_length=10)),
+                ('vote_count', models.IntegerField(default=0)),
+                ('popularity', models.FloatField(default=0)),
+                ('poster_path', models.CharField(blank=True, default='', max_length=255)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['genre_id', 'year', '-popularity'], name='api_catalog_genre_year_pop')],
+                'constraints': [models.UniqueConstraint(fields=('genre_id', 'year', 'tmdb_id'), name='api_catalogentry_uniq')],
+            },
+        ),
+    ]
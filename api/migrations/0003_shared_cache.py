@@ -0,0 +1,47 @@
+from django.db import migrations
+
+# Общий для воркеров второй уровень кэша ответов TMDB (api.sharedcache). Таблица без модели:
+# читается и пишется напрямую через sqlite3, WITHOUT ROWID — строка лежит прямо в B-дереве ключа.
+SHARED_CACHE_SQL = (
+    """
+    CREATE TABLE IF NOT EXISTS api_shared_cache (
+        key TEXT PRIMARY KEY,
+        value BLOB NOT NULL,
+        expires REAL NOT NULL,
+        stale_until REAL NOT NULL,
+        size INTEGER NOT NULL
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS api_shared_cache_stale_until ON api_shared_cache (stale_until)",
+)
+
+SHARED_CACHE_DROP_SQL = (
+    "DROP INDEX IF EXISTS api_shared_cache_stale_until",
+    "DROP TABLE IF EXISTS api_shared_cache",
+)
+
+
+def create_shared_cache(apps, schema_editor):
+    # Только SQLite: на других БД общий кэш выключен (api.sharedcache)
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for sql in SHARED_CACHE_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_shared_cache(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for sql in SHARED_CACHE_DROP_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_genre_catalog'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_shared_cache, drop_shared_cache),
+    ]
@@ -0,0 +1,65 @@
+from django.db import migrations
+
+# Общий размер api_shared_cache ведут триггеры: проверка лимита в api.sharedcache читает одну строку,
+# а не суммирует size по всей таблице. Запись — UPSERT (ON CONFLICT DO UPDATE), поэтому замена значения —
+# UPDATE: INSERT OR REPLACE удаляет старую строку без срабатывания DELETE-триггера.
+SHARED_CACHE_SIZE_SQL = (
+    """
+    CREATE TABLE IF NOT EXISTS api_shared_cache_size (
+        id INTEGER PRIMARY KEY CHECK (id = 0),
+        bytes INTEGER NOT NULL
+    )
+    """,
+    "INSERT OR REPLACE INTO api_shared_cache_size (id, bytes) SELECT 0, COALESCE(SUM(size), 0) FROM api_shared_cache",
+    """
+    CREATE TRIGGER IF NOT EXISTS api_shared_cache_size_insert AFTER INSERT ON api_shared_cache
+    BEGIN
+        UPDATE api_shared_cache_size SET bytes = bytes + NEW.size WHERE id = 0;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS api_shared_cache_size_update AFTER UPDATE OF size ON api_shared_cache
+    BEGIN
+        UPDATE api_shared_cache_size SET bytes = bytes + NEW.size - OLD.size WHERE id = 0;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS api_shared_cache_size_delete AFTER DELETE ON api_shared_cache
+    BEGIN
+        UPDATE api_shared_cache_size SET bytes = bytes - OLD.size WHERE id = 0;
+    END
+    """,
+)
+
+SHARED_CACHE_SIZE_DROP_SQL = (
+    "DROP TRIGGER IF EXISTS api_shared_cache_size_delete",
+    "DROP TRIGGER IF EXISTS api_shared_cache_size_update",
+    "DROP TRIGGER IF EXISTS api_shared_cache_size_insert",
+    "DROP TABLE IF EXISTS api_shared_cache_size",
+)
+
+
+def create_shared_cache_size(apps, schema_editor):
+    # Как и сам общий кэш — только SQLite
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for sql in SHARED_CACHE_SIZE_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_shared_cache_size(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for sql in SHARED_CACHE_SIZE_DROP_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_shared_cache'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_shared_cache_size, drop_shared_cache_size),
+    ]
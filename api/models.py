@@ -0,0 +1,61 @@
+from django.db import models
+
+
+class Title(models.Model):
+    """Фильм/сериал, встреченный в ответах TMDB, — основа локального поиска по названию (api.titles)."""
+
+    MEDIA_TYPES = (("movie", "Фильм"), ("tv", "Сериал"))
+
+    media_type = models.CharField(max_length=5, choices=MEDIA_TYPES)
+    tmdb_id = models.IntegerField()
+    name = models.CharField(max_length=500)
+    original_name = models.CharField(max_length=500, blank=True, default="")
+    year = models.IntegerField(null=True, blank=True)
+    votes = models.IntegerField(default=0)
+    popularity = models.FloatField(default=0)
+    poster_path = models.CharField(max_length=255, blank=True, default="")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["media_type", "tmdb_id"], name="api_title_media_tmdb_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.year or '—'})"
+
+
+class CatalogCell(models.Model):
+    """Ячейка каталога discover: жанр TMDB + год (0 — без фильтра по году) и время последнего обновления."""
+
+    genre_id = models.IntegerField()
+    year = models.IntegerField()
+    total = models.IntegerField(default=0)
+    refreshed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["genre_id", "year"], name="api_catalogcell_genre_year_uniq"),
+        ]
+
+
+class CatalogEntry(models.Model):
+    """Фильм из ответа discover для ячейки (genre_id, year); поля — как в элементе TMDB, для services._movie_item."""
+
+    genre_id = models.IntegerField()
+    year = models.IntegerField()
+    tmdb_id = models.IntegerField()
+    title = models.CharField(max_length=500, blank=True, default="")
+    original_title = models.CharField(max_length=500, blank=True, default="")
+    release_date = models.CharField(max_length=10, blank=True, default="")
+    vote_count = models.IntegerField(default=0)
+    popularity = models.FloatField(default=0)
+    poster_path = models.CharField(max_length=255, blank=True, default="")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["genre_id", "year", "tmdb_id"], name="api_catalogentry_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["genre_id", "year", "-popularity"], name="api_catalog_genre_year_pop"),
+        ]
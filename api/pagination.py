@@ -0,0 +1,175 @@
+"""
+Курсорная пагинация списков TMDB (поиск по жанру и по названию).
+
+Курсор — непрозрачная строка: страница TMDB, сколько строк на ней уже отдано и строки
+("movie:550", "tv:1399" — id фильма и сериала могут совпадать), которые не нужно повторять
+(первую страницу поиска мог отдать локальный индекс).
+PageWalk идёт по страницам TMDB начиная с курсора и отдаёт строки по одной. Когда клиент уже
+листает (есть курсор) или читает поток NDJSON, следующие PAGINATION_PREFETCH страниц
+запрашиваются параллельно и ложатся в кэш ответов, так что следующий запрос (или следующие
+строки потока) уже не ждут TMDB. Первая страница без курсора — это в основном поиск по мере
+ввода, дальше которого не листают: для неё предзагрузки нет.
+Предзагрузка идёт в фоновой полосе лимита запросов (api.ratelimit), в контексте запроса:
+с его бюджетом (api.deadlines) и отметками об устаревших ответах (services.tracking_fallbacks).
+"""
+import asyncio
+import base64
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from . import deadlines, ratelimit
+
+# Сколько следующих страниц TMDB запрашивать заранее
+PAGINATION_PREFETCH = int(os.environ.get("PAGINATION_PREFETCH", "2"))
+# Максимальный limit для JSON-ответа и для потока application/x-ndjson
+PAGINATION_MAX_LIMIT = int(os.environ.get("PAGINATION_MAX_LIMIT", "100"))
+PAGINATION_STREAM_MAX_LIMIT = int(os.environ.get("PAGINATION_STREAM_MAX_LIMIT", "1000"))
+# Дальше 500-й страницы TMDB не отдаёт
+TMDB_MAX_PAGES = 500
+
+
+def row_ref(row: dict) -> str:
+    """Строка для Cursor.exclude: "<media_type>:<id>" (без media_type — фильм)."""
+    return f"{row.get('media_type') or 'movie'}:{row.get('id')}"
+
+
+class Cursor:
+    __slots__ = ("page", "skip", "exclude")
+
+    def __init__(self, page: int = 1, skip: int = 0, exclude=()):
+        self.page = page
+        self.skip = skip
+        self.exclude = tuple(exclude)
+
+    def encode(self) -> str:
+        raw = json.dumps([self.page, self.skip, list(self.exclude)], separators=(",", ":"))
+        return base64.urlsafe_b64encode(raw.encode("ascii")).decode("ascii").rstrip("=")
+
+    @classmethod
+    def decode(cls, token: str) -> "Cursor":
+        """ValueError — строка не похожа на выданный нами курсор."""
+        try:
+            raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+            page, skip, exclude = json.loads(raw)
+        except (TypeError, ValueError) as e:
+            raise ValueError(token) from e
+        if not (isinstance(page, int) and 1 <= page <= TMDB_MAX_PAGES and isinstance(skip, int) and skip >= 0):
+            raise ValueError(token)
+        # int — курсоры, выданные до появления media_type в exclude
+        if not isinstance(exclude, list) or not all(isinstance(x, (int, str)) for x in exclude):
+            raise ValueError(token)
+        return cls(page, skip, exclude)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    # Создаём лениво в воркере, а не при импорте (потоки не переживают fork)
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=max(PAGINATION_PREFETCH, 1) * 4, thread_name_prefix="pages")
+    return _executor
+
+
+class _Walk:
+    def __init__(self, fetch_page, cursor: Cursor | None, limit: int, prefetch: bool = False):
+        """
+        fetch_page(page) -> (строки страницы, total_pages); строки — dict с "id" (и "media_type" в поиске).
+        prefetch — предзагружать следующие страницы и без курсора (поток NDJSON).
+        """
+        self.fetch_page = fetch_page
+        self.prefetch = PAGINATION_PREFETCH if prefetch or cursor is not None else 0
+        self.cursor = cursor or Cursor()
+        self.limit = limit
+        self.next_cursor = None
+
+    @property
+    def next_token(self) -> str | None:
+        return self.next_cursor.encode() if self.next_cursor else None
+
+    def _take(self, page: int, skip: int, rows: list, total_pages: int, taken: int):
+        """(строки для отдачи, следующий курсор или None, дальше ли идти на следующую страницу)."""
+        exclude = self.cursor.exclude
+        if exclude:
+            rows = [r for r in rows if row_ref(r) not in exclude and r.get("id") not in exclude]
+        take = rows[skip : skip + self.limit - taken]
+        consumed = skip + len(take)
+        if consumed < len(rows):
+            return take, Cursor(page, consumed, exclude), False
+        if page >= min(total_pages, TMDB_MAX_PAGES):
+            return take, None, False
+        return take, Cursor(page + 1, 0, exclude), taken + len(take) < self.limit
+
+
+class PageWalk(_Walk):
+    """Итератор по строкам начиная с курсора, не больше limit; после обхода — next_cursor / next_token."""
+
+    def __iter__(self):
+        executor = _get_executor()
+        pending = {}
+        page, skip, taken = self.cursor.page, self.cursor.skip, 0
+        while True:
+            future = pending.pop(page, None)
+            rows, total_pages = future.result() if future is not None else self.fetch_page(page)
+            last = min(total_pages, TMDB_MAX_PAGES)
+            # Следующие страницы — параллельно; недочитанные останутся в кэше для следующего запроса.
+            # bind — контекст запроса: бюджет и отметки об устаревших ответах
+            for p in range(page + 1, min(page + self.prefetch, last) + 1):
+                if p not in pending:
+                    pending[p] = executor.submit(deadlines.bind(ratelimit.background), self.fetch_page, p)
+            take, self.next_cursor, more = self._take(page, skip, rows, total_pages, taken)
+            yield from take
+            taken += len(take)
+            if not more:
+                return
+            page, skip = self.next_cursor.page, 0
+
+
+class AsyncPageWalk(_Walk):
+    """Асинхронный PageWalk: fetch_page — корутина, предзагрузка — задачи event loop."""
+
+    _background = set()
+
+    def __aiter__(self):
+        return self._iterate()
+
+    def _spawn(self, page: int):
+        task = asyncio.get_running_loop().create_task(self._prefetch(page))
+        # Держим ссылку, пока задача не завершится; ошибку предзагрузки забираем, чтобы не было предупреждений
+        self._background.add(task)
+        task.add_done_callback(self._forget)
+        return task
+
+    async def _prefetch(self, page: int):
+        with ratelimit.lane(ratelimit.BACKGROUND):
+            return await self.fetch_page(page)
+
+    @classmethod
+    def _forget(cls, task):
+        cls._background.discard(task)
+        if not task.cancelled():
+            task.exception()
+
+    async def _iterate(self):
+        pending = {}
+        page, skip, taken = self.cursor.page, self.cursor.skip, 0
+        while True:
+            task = pending.pop(page, None)
+            rows, total_pages = await asyncio.shield(task) if task is not None else await self.fetch_page(page)
+            last = min(total_pages, TMDB_MAX_PAGES)
+            for p in range(page + 1, min(page + self.prefetch, last) + 1):
+                if p not in pending:
+                    pending[p] = self._spawn(p)
+            take, self.next_cursor, more = self._take(page, skip, rows, total_pages, taken)
+            for row in take:
+                yield row
+            taken += len(take)
+            if not more:
+                return
+            page, skip = self.next_cursor.page, 0
@@ -0,0 +1,490 @@
+"""
+Дисковый кэш постеров для poster_proxy.
+
+Картинки хранятся по хэшу содержимого (blobs/ab/<sha256>), индекс url -> метаданные
+лежит в index/<sha256(url)>.json. Запись атомарная (временный файл + os.replace),
+поэтому воркеры gunicorn могут писать в один каталог одновременно.
+Размер ограничен POSTER_CACHE_MAX_MB: при превышении удаляются давно не читавшиеся
+картинки (LRU по mtime, который обновляется при каждом попадании).
+
+Промах отдаётся потоково (PosterStream / AsyncPosterStream): куски от источника сразу
+уходят клиенту и параллельно пишутся во временный файл, который после успешной
+загрузки становится записью кэша. Число одновременных загрузок ограничено (poster_slots),
+вся загрузка укладывается в POSTER_DEADLINE секунд. В AsyncPosterStream запись на диск, публикация
+и вытеснение идут в отдельном потоке записи — event loop диск не ждёт.
+"""
+import asyncio
+import fcntl
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlparse
+
+import httpx
+import requests
+
+from . import metrics, upstream
+
+POSTER_CACHE_ENABLED = os.environ.get("POSTER_CACHE", "1").strip().lower() not in ("0", "false", "no", "off")
+POSTER_CACHE_DIR = Path(os.environ.get("POSTER_CACHE_DIR") or Path(__file__).resolve().parent.parent / "poster_cache")
+POSTER_CACHE_MAX_BYTES = int(float(os.environ.get("POSTER_CACHE_MAX_MB", "512")) * 1024 * 1024)
+# Не чаще раза в столько секунд (на процесс) проверяем размер кэша
+POSTER_CACHE_EVICT_INTERVAL = float(os.environ.get("POSTER_CACHE_EVICT_INTERVAL", "60"))
+# Потоковая отдача промахов (0 — сначала загрузить картинку целиком, как раньше)
+POSTER_STREAMING = os.environ.get("POSTER_STREAMING", "1").strip().lower() not in ("0", "false", "no", "off")
+# Одновременных загрузок постеров с источников на процесс; сверх лимита — редирект на оригинал
+POSTER_MAX_CONCURRENCY = int(os.environ.get("POSTER_MAX_CONCURRENCY", "16"))
+# Общий срок на загрузку одного постера (все попытки и передача тела), секунд
+POSTER_DEADLINE = float(os.environ.get("POSTER_DEADLINE", "30"))
+# Таймаут одной попытки; оставшееся время запроса (api.deadlines) может его сократить
+POSTER_TIMEOUT = float(os.environ.get("POSTER_TIMEOUT", "25"))
+POSTER_RETRIES = 3
+POSTER_CHUNK_SIZE = 64 * 1024
+# Отдача файлов из кэша через nginx (X-Accel-Redirect): префикс internal-location, смотрящей на POSTER_CACHE_DIR.
+# Пусто — файл отдаёт Django (FileResponse, под gunicorn — sendfile через wsgi.file_wrapper)
+POSTER_ACCEL_REDIRECT_PREFIX = os.environ.get("POSTER_ACCEL_REDIRECT_PREFIX", "").strip()
+# mtime при попадании обновляем не чаще, чем раз в столько секунд — лишние utime не нужны
+_TOUCH_INTERVAL = 300
+
+
+_TMDB_SIZE_RE = re.compile(r"^(/t/p/)(w\d+|original)(/.+)$")
+
+
+def resize_url(url: str, size: str) -> str:
+    """URL картинки TMDB с другим размером (image.tmdb.org/t/p/<size>/...); прочие URL — без изменений."""
+    parsed = urlparse(url)
+    if parsed.netloc != "image.tmdb.org":
+        return url
+    match = _TMDB_SIZE_RE.match(parsed.path)
+    if not match:
+        return url
+    return parsed._replace(path=f"{match.group(1)}{size}{match.group(3)}").geturl()
+
+
+class PosterEntry:
+    __slots__ = ("url", "path", "sha256", "size", "content_type", "last_modified")
+
+    def __init__(self, url, path, sha256, size, content_type, last_modified):
+        self.url = url
+        self.path = path
+        self.sha256 = sha256
+        self.size = size
+        self.content_type = content_type
+        self.last_modified = last_modified
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.sha256}"'
+
+    @property
+    def accel_redirect(self) -> str:
+        """Путь для X-Accel-Redirect (относительно POSTER_ACCEL_REDIRECT_PREFIX)."""
+        return f"{POSTER_ACCEL_REDIRECT_PREFIX.rstrip('/')}/blobs/{self.sha256[:2]}/{self.sha256}"
+
+
+def _atomic_write(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Уникальное имя: один и тот же файл могут писать и потоки одного воркера
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class PosterWriter:
+    """Запись картинки в кэш по частям: sha256 считается на лету, commit() атомарно публикует файл."""
+
+    def __init__(self, cache: "PosterCache", url: str, content_type: str, last_modified: float | None = None):
+        self.cache = cache
+        self.url = url
+        self.content_type = content_type
+        self.last_modified = last_modified
+        self.size = 0
+        self._hash = hashlib.sha256()
+        tmp_dir = cache.root / "blobs"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        self._tmp = tmp_dir / f".{uuid.uuid4().hex}.tmp"
+        self._file = open(self._tmp, "wb")
+
+    def write(self, chunk: bytes):
+        self._hash.update(chunk)
+        self._file.write(chunk)
+        self.size += len(chunk)
+
+    def commit(self) -> PosterEntry:
+        self._file.close()
+        sha256 = self._hash.hexdigest()
+        blob = self.cache._blob_path(sha256)
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        if blob.exists():
+            self._tmp.unlink(missing_ok=True)
+        else:
+            os.replace(self._tmp, blob)
+        last_modified = self.last_modified or time.time()
+        meta = {"url": self.url, "sha256": sha256, "content_type": self.content_type, "last_modified": last_modified}
+        _atomic_write(self.cache._index_path(self.url), json.dumps(meta).encode("utf-8"))
+        self.cache.maybe_evict()
+        return PosterEntry(self.url, blob, sha256, self.size, self.content_type, last_modified)
+
+    def abort(self):
+        self._file.close()
+        self._tmp.unlink(missing_ok=True)
+
+
+class PosterCache:
+    def __init__(self, root: Path = POSTER_CACHE_DIR, max_bytes: int = POSTER_CACHE_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._last_evict = 0.0
+
+    def _index_path(self, url: str) -> Path:
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return self.root / "index" / digest[:2] / f"{digest}.json"
+
+    def _blob_path(self, sha256: str) -> Path:
+        return self.root / "blobs" / sha256[:2] / sha256
+
+    def lookup(self, url: str) -> PosterEntry | None:
+        """Запись кэша для url или None (нет в кэше или картинка уже вытеснена)."""
+        index = self._index_path(url)
+        try:
+            with open(index, encoding="utf-8") as f:
+                meta = json.load(f)
+            blob = self._blob_path(meta["sha256"])
+            st = blob.stat()
+        except (OSError, ValueError, KeyError):
+            metrics.cache_result("posters", "miss")
+            return None
+        metrics.cache_result("posters", "hit")
+        if time.time() - st.st_mtime > _TOUCH_INTERVAL:
+            try:
+                os.utime(blob)
+            except OSError:
+                pass
+        return PosterEntry(url, blob, meta["sha256"], st.st_size, meta.get("content_type") or "image/jpeg", meta.get("last_modified") or st.st_mtime)
+
+    def store(self, url: str, content: bytes, content_type: str, last_modified: float | None = None) -> PosterEntry:
+        writer = self.writer(url, content_type, last_modified)
+        try:
+            writer.write(content)
+        except BaseException:
+            writer.abort()
+            raise
+        return writer.commit()
+
+    def writer(self, url: str, content_type: str, last_modified: float | None = None) -> PosterWriter:
+        return PosterWriter(self, url, content_type, last_modified)
+
+    def maybe_evict(self):
+        now = time.monotonic()
+        if now - self._last_evict < POSTER_CACHE_EVICT_INTERVAL:
+            return
+        self._last_evict = now
+        self.root.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.root / ".evict.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                # Вытесняет один воркер, остальные не ждут
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            self.evict()
+        finally:
+            os.close(fd)
+
+    def evict(self) -> int:
+        """Удалить самые давно читавшиеся картинки, пока кэш больше max_bytes. Возвращает число удалённых."""
+        blobs = []
+        total = 0
+        for path in (self.root / "blobs").glob("*/*"):
+            # Пропускаем временные файлы, которые прямо сейчас пишет другой воркер
+            if path.name.startswith("."):
+                continue
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            blobs.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        removed = 0
+        if total <= self.max_bytes:
+            return removed
+        blobs.sort()
+        # Освобождаем с запасом до 90% лимита, чтобы не вытеснять на каждой записи
+        target = self.max_bytes * 0.9
+        for _, size, path in blobs:
+            if total <= target:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        # Индексы на удалённые картинки lookup сам считает промахом; чистим их при вытеснении
+        if removed:
+            for index in (self.root / "index").glob("*/*.json"):
+                try:
+                    with open(index, encoding="utf-8") as f:
+                        sha256 = json.load(f).get("sha256") or ""
+                    if not self._blob_path(sha256).exists():
+                        index.unlink()
+                except (OSError, ValueError):
+                    continue
+        return removed
+
+    def stats(self) -> dict:
+        files = 0
+        total = 0
+        for path in (self.root / "blobs").glob("*/*"):
+            try:
+                total += path.stat().st_size
+            except OSError:
+                continue
+            files += 1
+        return {"enabled": POSTER_CACHE_ENABLED, "dir": str(self.root), "files": files, "bytes": total, "max_bytes": self.max_bytes}
+
+
+poster_cache = PosterCache()
+
+
+class PosterSlots:
+    """Неблокирующий счётчик одновременных загрузок; освобождать можно из любого потока."""
+
+    def __init__(self, limit: int = POSTER_MAX_CONCURRENCY):
+        self.limit = limit
+        self.in_use = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.in_use >= self.limit:
+                self.rejected += 1
+                return False
+            self.in_use += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_use = max(0, self.in_use - 1)
+
+
+poster_slots = PosterSlots()
+
+
+def open_upstream(url: str, verify: bool, deadline: float) -> requests.Response | None:
+    """Открыть потоковый ответ источника (с повторами в пределах deadline); None — не удалось."""
+    for attempt in range(POSTER_RETRIES):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            resp = upstream.get(url, timeout=min(POSTER_TIMEOUT, remaining), stream=True, verify=verify)
+            if resp.status_code >= 400:
+                resp.close()
+            resp.raise_for_status()
+            return resp
+        except requests.RequestException:
+            if attempt < POSTER_RETRIES - 1 and deadline - time.monotonic() > 1:
+                time.sleep(1)
+    return None
+
+
+async def aopen_upstream(url: str, verify: bool, deadline: float) -> httpx.Response | None:
+    """Асинхронный open_upstream (httpx, stream=True)."""
+    for attempt in range(POSTER_RETRIES):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            resp = await upstream.aget(url, timeout=min(POSTER_TIMEOUT, remaining), verify=verify, stream=True)
+            if resp.status_code >= 400:
+                await resp.aclose()
+            resp.raise_for_status()
+            return resp
+        except httpx.HTTPError:
+            if attempt < POSTER_RETRIES - 1 and deadline - time.monotonic() > 1:
+                await asyncio.sleep(1)
+    return None
+
+
+def _cache_writer(url: str, headers, last_modified: float | None) -> PosterWriter | None:
+    if not POSTER_CACHE_ENABLED:
+        return None
+    try:
+        return poster_cache.writer(url, headers.get("Content-Type", "image/jpeg"), last_modified)
+    except OSError:
+        return None
+
+
+_disk_executor = None
+_disk_executor_lock = threading.Lock()
+
+
+def _get_disk_executor() -> ThreadPoolExecutor:
+    # Один поток: задачи одной картинки (открыть, куски, публикация) выполняются по порядку.
+    # Создаём лениво в воркере, а не при импорте (потоки не переживают fork)
+    global _disk_executor
+    if _disk_executor is None:
+        with _disk_executor_lock:
+            if _disk_executor is None:
+                _disk_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="poster-cache")
+    return _disk_executor
+
+
+class _BackgroundWriter:
+    """
+    PosterWriter для event loop: все операции с диском ставятся в очередь потока записи.
+    Ошибка диска там — картинка просто не попадёт в кэш; отдачу клиенту она не прерывает.
+    """
+
+    def __init__(self, url: str, headers, last_modified: float | None):
+        self.size = 0
+        self._writer = None
+        self._submit(self._open, url, headers, last_modified)
+
+    @staticmethod
+    def _submit(fn, *args):
+        _get_disk_executor().submit(fn, *args)
+
+    def _open(self, url, headers, last_modified):
+        self._writer = _cache_writer(url, headers, last_modified)
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        self._submit(self._write, chunk)
+
+    def _write(self, chunk: bytes):
+        if self._writer is None:
+            return
+        try:
+            self._writer.write(chunk)
+        except OSError:
+            self._abort()
+
+    def commit(self):
+        self._submit(self._commit)
+
+    def _commit(self):
+        if self._writer is None:
+            return
+        try:
+            self._writer.commit()
+        except OSError:
+            self._writer.abort()
+        self._writer = None
+
+    def abort(self):
+        self._submit(self._abort)
+
+    def _abort(self):
+        if self._writer is not None:
+            self._writer.abort()
+            self._writer = None
+
+
+def _expected_length(headers) -> int | None:
+    value = headers.get("Content-Length")
+    if value and value.isdigit() and not headers.get("Content-Encoding"):
+        return int(value)
+    return None
+
+
+class _BaseStream:
+    def __init__(self, resp, url: str, deadline: float, last_modified: float | None):
+        self._resp = resp
+        self._deadline = deadline
+        self._expected = _expected_length(resp.headers)
+        self._writer = self._open_writer(url, resp.headers, last_modified)
+        self._complete = False
+        self._closed = False
+
+    @staticmethod
+    def _open_writer(url: str, headers, last_modified: float | None):
+        return _cache_writer(url, headers, last_modified)
+
+    def _feed(self, chunk: bytes):
+        if time.monotonic() > self._deadline:
+            raise TimeoutError("poster deadline exceeded")
+        if self._writer is not None:
+            self._writer.write(chunk)
+        metrics.poster_bytes("upstream", len(chunk))
+
+    def _finish_cache(self):
+        """Публикуем файл, если картинка получена целиком (конец потока или ровно Content-Length байт), иначе удаляем."""
+        writer, self._writer = self._writer, None
+        if writer is None:
+            return
+        if self._complete or (self._expected is not None and writer.size == self._expected):
+            try:
+                writer.commit()
+            except OSError:
+                writer.abort()
+        else:
+            writer.abort()
+
+
+class PosterStream(_BaseStream):
+    """
+    Тело StreamingHttpResponse для промаха кэша: куски источника уходят клиенту
+    и пишутся в кэш. close() (его вызывает Django) освобождает слот и соединение
+    даже если отдача не началась или оборвалась.
+    """
+
+    def __iter__(self):
+        try:
+            for chunk in self._resp.iter_content(POSTER_CHUNK_SIZE):
+                self._feed(chunk)
+                yield chunk
+            self._complete = True
+        finally:
+            self.close()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._finish_cache()
+        self._resp.close()
+        poster_slots.release()
+
+
+class AsyncPosterStream(_BaseStream):
+    """
+    Асинхронный PosterStream для httpx (ASGI). С диском работает поток записи (_BackgroundWriter),
+    кэш публикуется без await: Django отменяет задачу, как только клиент отключился, получив последний байт.
+    """
+
+    @staticmethod
+    def _open_writer(url: str, headers, last_modified: float | None):
+        return _BackgroundWriter(url, headers, last_modified) if POSTER_CACHE_ENABLED else None
+
+    def __init__(self, resp: httpx.Response, url: str, deadline: float, last_modified: float | None = None):
+        super().__init__(resp, url, deadline, last_modified)
+        self._loop = asyncio.get_running_loop()
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self._resp.aiter_bytes(POSTER_CHUNK_SIZE):
+                self._feed(chunk)
+                yield chunk
+            self._complete = True
+        finally:
+            self.close()
+
+    def close(self):
+        # Django может вызвать close() из другого потока — закрытие соединения отдаём в event loop
+        if self._closed:
+            return
+        self._closed = True
+        self._finish_cache()
+        if not self._resp.is_closed and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(lambda: self._loop.create_task(self._resp.aclose()))
+        poster_slots.release()
@@ -0,0 +1,248 @@
+"""
+Профилирование запросов по требованию: доля запросов (PROFILE_SAMPLE_RATE) или запросы с заголовком
+X-Profile: <PROFILE_TOKEN> снимаются cProfile вместе с разбивкой времени по фазам:
+
+- upstream — ожидание данных TMDB в services._get / aservices._aget (кэш, single-flight, запросы с повторами);
+- transform — сборка ответа из данных TMDB (_results, _project и т.п.);
+- render — кодирование JSON и сжатие.
+
+Фазы помечаются декоратором timed(); параллельные блоки главной суммируются, поэтому upstream
+может быть больше total. Профиль пишется в PROFILE_DIR парой файлов <id>.prof (pstats) и <id>.json
+(маршрут, статус, фазы); хранятся последние PROFILE_MAX_FILES. Сводка — python manage.py profile_report.
+
+В процессе снимается не больше одного запроса одновременно. В async-режиме профиль event loop
+включает и задачи других запросов; у потоковых ответов — только время до начала отдачи тела.
+Запросу с X-Profile в ответ добавляются Server-Timing и X-Profile-Id.
+"""
+import asyncio
+import contextvars
+import cProfile
+import functools
+import hmac
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.decorators import sync_and_async_middleware
+
+from . import metrics
+
+# Доля профилируемых запросов (0.01 — каждый сотый); 0 — только по заголовку
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+# Значение заголовка X-Profile, при котором запрос профилируется всегда; пусто — заголовок не действует
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+PROFILE_DIR = Path(os.environ.get("PROFILE_DIR") or Path(__file__).resolve().parent.parent / "profiles")
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", "500"))
+PROFILE_ENABLED = PROFILE_SAMPLE_RATE > 0 or bool(PROFILE_TOKEN)
+
+PHASES = ("upstream", "transform", "render")
+
+_recorder = contextvars.ContextVar("profile_recorder", default=None)
+# Фаза, внутри которой идёт вызов: вложенные timed() время не дублируют
+_active_phase = contextvars.ContextVar("profile_phase", default=None)
+# Один профилируемый запрос на процесс: cProfile (с 3.12) не допускает двух профилировщиков сразу
+_busy = threading.Lock()
+_ids = itertools.count(1)
+
+
+class _Recorder:
+    """Сумма времени и число вызовов по фазам одного запроса (пишут и потоки пулов — под замком)."""
+
+    def __init__(self):
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+        self.calls = dict.fromkeys(PHASES, 0)
+        self._lock = threading.Lock()
+
+    def add(self, phase: str, seconds: float):
+        with self._lock:
+            self.seconds[phase] += seconds
+            self.calls[phase] += 1
+
+
+def timed(phase: str):
+    """Декоратор: время вызова (функции или корутины) идёт в фазу phase профилируемого запроса."""
+
+    def decorator(fn):
+        if not PROFILE_ENABLED:
+            return fn
+        if iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                recorder = _recorder.get()
+                if recorder is None or _active_phase.get() is not None:
+                    return await fn(*args, **kwargs)
+                token = _active_phase.set(phase)
+                started = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    recorder.add(phase, time.perf_counter() - started)
+                    _active_phase.reset(token)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            recorder = _recorder.get()
+            if recorder is None or _active_phase.get() is not None:
+                return fn(*args, **kwargs)
+            token = _active_phase.set(phase)
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                recorder.add(phase, time.perf_counter() - started)
+                _active_phase.reset(token)
+
+        return wrapper
+
+    return decorator
+
+
+def _reason(request) -> str | None:
+    """Почему профилировать запрос: "header", "sample" или None."""
+    if PROFILE_TOKEN:
+        header = request.headers.get("X-Profile", "")
+        if header and hmac.compare_digest(header.encode("utf-8"), PROFILE_TOKEN.encode("utf-8")):
+            return "header"
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return "sample"
+    return None
+
+
+class _Session:
+    def __init__(self, reason: str):
+        self.reason = reason
+        self.profiler = cProfile.Profile()
+        self.recorder = _Recorder()
+        self.total = 0.0
+
+    def start(self) -> bool:
+        try:
+            self.profiler.enable()
+        except ValueError:
+            # Активен другой профилировщик (отладчик, coverage) — запрос не профилируем
+            return False
+        self._token = _recorder.set(self.recorder)
+        self._started = time.perf_counter()
+        return True
+
+    def stop(self):
+        self.total = time.perf_counter() - self._started
+        self.profiler.disable()
+        _recorder.reset(self._token)
+
+    def finish(self, request, response):
+        # Счётчик дополнен нулями: порядок имён — порядок записи (на нём держатся _rotate и load)
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_ids):06d}"
+        meta = {
+            "id": profile_id,
+            "time": time.time(),
+            "pid": os.getpid(),
+            "reason": self.reason,
+            "method": request.method,
+            "path": request.path,
+            "route": metrics._route(request),
+            "status": response.status_code,
+            "total": self.total,
+            "phases": self.recorder.seconds,
+            "calls": self.recorder.calls,
+        }
+        try:
+            _write(profile_id, self.profiler, meta)
+        except OSError:
+            return
+        if self.reason == "header":
+            response["Server-Timing"] = ", ".join(
+                f"{name};dur={seconds * 1000:.1f}" for name, seconds in (*self.recorder.seconds.items(), ("total", self.total))
+            )
+            response["X-Profile-Id"] = profile_id
+
+
+def _write(profile_id: str, profiler: cProfile.Profile, meta: dict):
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    prof = PROFILE_DIR / f"{profile_id}.prof"
+    profiler.dump_stats(f"{prof}.tmp")
+    os.replace(f"{prof}.tmp", prof)
+    # .json — последним: profile_report берёт только пары, у которых он уже есть
+    index = PROFILE_DIR / f"{profile_id}.json"
+    index.with_suffix(".json.tmp").write_text(json.dumps(meta), encoding="utf-8")
+    os.replace(index.with_suffix(".json.tmp"), index)
+    _rotate()
+
+
+def _rotate():
+    """Оставить последние PROFILE_MAX_FILES профилей (имена начинаются со времени — сортировка по имени)."""
+    indexes = sorted(PROFILE_DIR.glob("*.json"))
+    for index in indexes[:max(len(indexes) - PROFILE_MAX_FILES, 0)]:
+        for path in (index, index.with_suffix(".prof")):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def load(directory: Path = PROFILE_DIR) -> list:
+    """Метаданные сохранённых профилей (по времени), у которых есть и .prof."""
+    out = []
+    for index in sorted(Path(directory).glob("*.json")):
+        prof = index.with_suffix(".prof")
+        try:
+            meta = json.loads(index.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue
+        if prof.exists():
+            meta["prof"] = str(prof)
+            out.append(meta)
+    return out
+
+
+@sync_and_async_middleware
+def profiling_middleware(get_response):
+    """Профилирование выбранных запросов (см. модуль). Без PROFILE_SAMPLE_RATE и PROFILE_TOKEN не подключается."""
+    if not PROFILE_ENABLED:
+        raise MiddlewareNotUsed
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            reason = _reason(request)
+            if reason is None or not _busy.acquire(blocking=False):
+                return await get_response(request)
+            try:
+                session = _Session(reason)
+                if not session.start():
+                    return await get_response(request)
+                try:
+                    response = await get_response(request)
+                finally:
+                    session.stop()
+                # Запись .prof/.json и ротация — файловый ввод-вывод, не на event loop
+                await asyncio.to_thread(session.finish, request, response)
+                return response
+            finally:
+                _busy.release()
+    else:
+        def middleware(request):
+            reason = _reason(request)
+            if reason is None or not _busy.acquire(blocking=False):
+                return get_response(request)
+            try:
+                session = _Session(reason)
+                if not session.start():
+                    return get_response(request)
+                try:
+                    response = get_response(request)
+                finally:
+                    session.stop()
+                session.finish(request, response)
+                return response
+            finally:
+                _busy.release()
+
+    return middleware
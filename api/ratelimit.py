@@ -0,0 +1,291 @@
+"""
+Общий для всех воркеров лимит запросов к TMDB: token bucket в маленьком файле (RATE_LIMIT_FILE),
+доступ под flock — файл живёт в page cache, так что это по сути разделяемая память.
+
+Ведро на RATE_LIMIT_BURST запросов пополняется со скоростью RATE_LIMIT_RPS. Две полосы:
+пользовательские запросы (USER) могут брать токены до нуля, фоновые (BACKGROUND — прогрев
+кэша, предзагрузка страниц, команды) оставляют RATE_LIMIT_RESERVE от ведра пользователям.
+
+На 429 (throttled) все воркеры ждут Retry-After, а скорость временно снижается вдвое
+и восстанавливается на RATE_LIMIT_RECOVERY от номинала в секунду.
+"""
+import asyncio
+import contextvars
+import fcntl
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils.http import parse_http_date_safe
+
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT", "1").strip().lower() not in ("0", "false", "no", "off")
+RATE_LIMIT_RPS = float(os.environ.get("RATE_LIMIT_RPS", "40"))
+RATE_LIMIT_BURST = float(os.environ.get("RATE_LIMIT_BURST", "40"))
+# Доля ведра, которую фоновые запросы не трогают
+RATE_LIMIT_RESERVE = float(os.environ.get("RATE_LIMIT_RESERVE", "0.25"))
+# Скорость восстановления после 429: доля номинала в секунду
+RATE_LIMIT_RECOVERY = float(os.environ.get("RATE_LIMIT_RECOVERY", "0.05"))
+RATE_LIMIT_MIN_FACTOR = 0.1
+RATE_LIMIT_FILE = os.environ.get("RATE_LIMIT_FILE", "").strip() or os.path.join(
+    tempfile.gettempdir(),
+    "movie-backend-ratelimit-{}.bin".format(hashlib.sha1(str(settings.BASE_DIR).encode("utf-8")).hexdigest()[:12]),
+)
+
+USER = "user"
+BACKGROUND = "background"
+
+# tokens, updated_at, blocked_until, factor
+_STATE = struct.Struct("dddd")
+# Пауза aacquire, если состояние ведра занято другим потоком или воркером (его держат микросекунды), секунд
+_BUSY_RETRY = 0.001
+
+_lane = contextvars.ContextVar("tmdb_lane", default=USER)
+_lock = threading.Lock()
+_fd = None
+_fd_pid = None
+_stats = {"acquired": 0, "waited": 0, "wait_seconds": 0.0, "rejected": 0, "throttled": 0}
+
+
+def _reset_after_fork():
+    global _lock, _fd, _fd_pid
+    _lock = threading.Lock()
+    _fd = None
+    _fd_pid = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class RateLimited(Exception):
+    """Токен не получить до истечения отведённого времени (лимит TMDB исчерпан)."""
+
+    def __init__(self, wait: float):
+        super().__init__(f"TMDB rate limit, next slot in {wait:.1f}s")
+        self.wait = wait
+
+
+@contextmanager
+def lane(name: str):
+    """Полоса для запросов к TMDB внутри блока (в текущем потоке или задаче)."""
+    token = _lane.set(name)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def background(fn, *args):
+    """Вызвать fn(*args) в фоновой полосе — для задач в пулах потоков."""
+    with lane(BACKGROUND):
+        return fn(*args)
+
+
+def _file():
+    global _fd, _fd_pid
+    pid = os.getpid()
+    if _fd is None or _fd_pid != pid:
+        # Свой дескриптор в каждом процессе: flock на унаследованном после fork общий с родителем
+        _fd = os.open(RATE_LIMIT_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+        _fd_pid = pid
+    return _fd
+
+
+@contextmanager
+def _locked_state(blocking: bool = True):
+    """
+    Состояние ведра под flock: [tokens, updated_at, blocked_until, factor], изменения записываются обратно.
+    blocking=False — BlockingIOError, если состояние сейчас у другого потока или воркера.
+    """
+    if not _lock.acquire(blocking=blocking):
+        raise BlockingIOError
+    try:
+        fd = _file()
+        fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        try:
+            raw = os.pread(fd, _STATE.size, 0)
+            state = list(_STATE.unpack(raw)) if len(raw) == _STATE.size else [RATE_LIMIT_BURST, time.time(), 0.0, 1.0]
+            yield state
+            os.pwrite(fd, _STATE.pack(*state), 0)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        _lock.release()
+
+
+def _try_take(reserve: float, blocking: bool = True) -> float | None:
+    """
+    Взять токен: 0 — взят (или файл состояния недоступен), иначе сколько секунд подождать.
+    None — blocking=False, а состояние занято.
+    """
+    try:
+        return _take_locked(reserve, blocking)
+    except BlockingIOError:
+        return None
+    except OSError:
+        # Без общего состояния лимит не соблюсти — не мешаем запросам
+        return 0.0
+
+
+def _take_locked(reserve: float, blocking: bool = True) -> float:
+    with _locked_state(blocking) as state:
+        tokens, updated, blocked_until, factor = state
+        now = time.time()
+        elapsed = max(now - updated, 0)
+        factor = min(1.0, factor + RATE_LIMIT_RECOVERY * elapsed)
+        rate = RATE_LIMIT_RPS * factor
+        tokens = min(RATE_LIMIT_BURST, tokens + elapsed * rate)
+        state[:] = [tokens, now, blocked_until, factor]
+        if now < blocked_until:
+            return blocked_until - now
+        if tokens - 1 >= reserve:
+            state[0] = tokens - 1
+            return 0.0
+        return (reserve + 1 - tokens) / rate
+
+
+def _reserve() -> float:
+    return RATE_LIMIT_RESERVE * RATE_LIMIT_BURST if _lane.get() == BACKGROUND else 0.0
+
+
+def _account(waited: float):
+    with _lock:
+        _stats["acquired"] += 1
+        if waited:
+            _stats["waited"] += 1
+            _stats["wait_seconds"] += waited
+
+
+def _reject(wait: float):
+    with _lock:
+        _stats["rejected"] += 1
+    raise RateLimited(wait)
+
+
+def acquire(timeout: float | None = None):
+    """Дождаться токена (не дольше timeout секунд, иначе RateLimited). Полоса — из lane()."""
+    if not RATE_LIMIT_ENABLED:
+        return
+    start = time.monotonic()
+    reserve = _reserve()
+    while True:
+        wait = _try_take(reserve)
+        if not wait:
+            _account(time.monotonic() - start)
+            return
+        if timeout is not None and time.monotonic() - start + wait > timeout:
+            _reject(wait)
+        time.sleep(wait)
+
+
+def try_acquire(blocking: bool = True) -> bool:
+    """
+    Взять токен, только если он есть сейчас (не ждать пополнения ведра). blocking=False — не ждать и flock:
+    состояние занято — False (для event loop, как в aacquire).
+    """
+    if not RATE_LIMIT_ENABLED:
+        return True
+    wait = _try_take(_reserve(), blocking)
+    if wait == 0:
+        _account(0)
+        return True
+    with _lock:
+        _stats["rejected"] += 1
+    return False
+
+
+async def aacquire(timeout: float | None = None):
+    """
+    Асинхронный acquire: ждёт через asyncio.sleep. flock берётся без ожидания — event loop не блокируется,
+    даже если состояние сейчас у другого воркера; занято — повтор через _BUSY_RETRY.
+    """
+    if not RATE_LIMIT_ENABLED:
+        return
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    reserve = _reserve()
+    while True:
+        wait = _try_take(reserve, blocking=False)
+        if wait is None:
+            wait = _BUSY_RETRY
+        elif not wait:
+            _account(loop.time() - start)
+            return
+        if timeout is not None and loop.time() - start + wait > timeout:
+            _reject(wait)
+        await asyncio.sleep(wait)
+
+
+def throttled(retry_after: str | None) -> float:
+    """
+    Ответ 429: все воркеры ждут Retry-After (секунды или HTTP-дата; по умолчанию 1 с),
+    скорость снижается вдвое. Возвращает паузу в секундах.
+    """
+    delay = _throttle_delay(retry_after)
+    if not RATE_LIMIT_ENABLED:
+        return delay
+    try:
+        with _locked_state() as state:
+            _slow_down(state, delay)
+    except OSError:
+        pass
+    return delay
+
+
+async def athrottled(retry_after: str | None) -> float:
+    """Асинхронный throttled: flock без ожидания, как в aacquire — event loop не блокируется."""
+    delay = _throttle_delay(retry_after)
+    if not RATE_LIMIT_ENABLED:
+        return delay
+    while True:
+        try:
+            with _locked_state(blocking=False) as state:
+                _slow_down(state, delay)
+            return delay
+        except BlockingIOError:
+            await asyncio.sleep(_BUSY_RETRY)
+        except OSError:
+            return delay
+
+
+def _throttle_delay(retry_after: str | None) -> float:
+    delay = 1.0
+    if retry_after:
+        retry_after = retry_after.strip()
+        if retry_after.isdigit():
+            delay = float(retry_after)
+        else:
+            at = parse_http_date_safe(retry_after)
+            if at is not None:
+                delay = max(at - time.time(), 0.0)
+    with _lock:
+        _stats["throttled"] += 1
+    return delay
+
+
+def _slow_down(state: list, delay: float):
+    state[0] = min(state[0], 0.0)
+    state[2] = max(state[2], time.time() + delay)
+    state[3] = max(RATE_LIMIT_MIN_FACTOR, state[3] / 2)
+
+
+def stats() -> dict:
+    out = {"enabled": RATE_LIMIT_ENABLED, "rps": RATE_LIMIT_RPS, "burst": RATE_LIMIT_BURST}
+    with _lock:
+        out.update(_stats, wait_seconds=round(_stats["wait_seconds"], 3))
+    if RATE_LIMIT_ENABLED:
+        try:
+            with _locked_state() as state:
+                tokens, _, blocked_until, factor = state
+        except OSError:
+            return out
+        out.update(
+            tokens=round(tokens, 2),
+            rate_factor=round(factor, 3),
+            blocked_for=round(max(blocked_until - time.time(), 0), 2),
+        )
+    return out
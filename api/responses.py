@@ -0,0 +1,198 @@
+"""
+Кэш готовых ответов: для горячих эндпоинтов (блоки главной, жанры, поиск, детали) хранится
+уже закодированное тело JSON. Повторный запрос с теми же параметрами не собирает dict заново
+(_results, _movie_item, _project) и не кодирует его — отдаются те же bytes.
+
+TTL записей (RESPONSE_CACHE_TTLS) короче TTL кэша TMDB, так что ответ отстаёт от данных TMDB
+не больше чем на эти секунды. Ответы с ошибкой не кэшируются.
+
+У каждого тела — сильный ETag (хэш содержимого, считается один раз при кодировании), у эндпоинта —
+своя политика Cache-Control (RESPONSE_CACHE_CONTROL). If-None-Match со свежей записью в кэше даёт 304
+без обращения к TMDB и без сборки ответа.
+
+Вместе с телом при заполнении кэша один раз сжимаются варианты gzip и br: ответ выбирается по
+Accept-Encoding (Vary: Accept-Encoding), у каждого варианта свой ETag. Сжатие на каждый запрос
+(GZipMiddleware) не нужно.
+"""
+import gzip
+import hashlib
+import os
+from functools import lru_cache
+
+import brotli
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+
+from . import profiling
+from .cache import TTLCache
+from .renderers import ORJSONRenderer, encode_json
+
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE", "1").strip().lower() not in ("0", "false", "no", "off")
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_COMPRESS = os.environ.get("RESPONSE_COMPRESS", "1").strip().lower() not in ("0", "false", "no", "off")
+# Тела короче не сжимаются: выигрыш меньше заголовков
+RESPONSE_COMPRESS_MIN = int(os.environ.get("RESPONSE_COMPRESS_MIN", "512"))
+# Сжатие раз на заполнение кэша — можно не экономить на уровне
+RESPONSE_GZIP_LEVEL = int(os.environ.get("RESPONSE_GZIP_LEVEL", "9"))
+RESPONSE_BROTLI_QUALITY = int(os.environ.get("RESPONSE_BROTLI_QUALITY", "9"))
+# Поиск по мере ввода — почти каждый ключ новый и редко запрашивается повторно: сжимаем на быстром уровне
+RESPONSE_FAST_COMPRESS = ("search",)
+RESPONSE_FAST_GZIP_LEVEL = int(os.environ.get("RESPONSE_FAST_GZIP_LEVEL", "1"))
+RESPONSE_FAST_BROTLI_QUALITY = int(os.environ.get("RESPONSE_FAST_BROTLI_QUALITY", "4"))
+# Эндпоинт -> сколько секунд отдавать закодированный ответ
+RESPONSE_CACHE_TTLS = {
+    "home": 60,
+    "popular_now": 60,
+    "popular_movies": 300,
+    "popular_series": 300,
+    "coming_soon": 600,
+    "genres": 3600,
+    "search": 120,
+    "genre": 600,
+    "detail": 1800,
+    "watch": 1800,
+}
+
+# Эндпоинт -> Cache-Control для браузеров и CDN; max-age не больше TTL записи
+RESPONSE_CACHE_CONTROL = {
+    "home": "public, max-age=60, stale-while-revalidate=300",
+    "popular_now": "public, max-age=60, stale-while-revalidate=300",
+    "popular_movies": "public, max-age=300, stale-while-revalidate=900",
+    "popular_series": "public, max-age=300, stale-while-revalidate=900",
+    "coming_soon": "public, max-age=600, stale-while-revalidate=3600",
+    "genres": "public, max-age=3600",
+    "search": "public, max-age=120",
+    "genre": "public, max-age=600, stale-while-revalidate=3600",
+    "detail": "public, max-age=1800, stale-while-revalidate=86400",
+    "watch": "public, max-age=1800",
+}
+# Ответ с ошибкой (пустой блок с detail) или из устаревших данных — без валидаторов, кэши каждый раз переспрашивают
+UNCACHEABLE_CACHE_CONTROL = "no-cache"
+# Эти эндпоинты по Accept отдают JSON или поток NDJSON
+VARY_ACCEPT = ("search", "genre")
+
+CONTENT_TYPE = ORJSONRenderer.media_type
+
+_cache = TTLCache(maxsize=RESPONSE_CACHE_SIZE, name="responses")
+
+
+# Предпочтение при выборе варианта: лучшее сжатие первым
+ENCODINGS = ("br", "gzip")
+
+
+@profiling.timed("render")
+def _compress(body: bytes, digest: str, fast: bool = False) -> dict:
+    """{кодировка: (сжатое тело, ETag)} — только варианты, которые меньше исходного тела. fast — быстрые уровни."""
+    if len(body) < RESPONSE_COMPRESS_MIN:
+        return {}
+    quality = RESPONSE_FAST_BROTLI_QUALITY if fast else RESPONSE_BROTLI_QUALITY
+    level = RESPONSE_FAST_GZIP_LEVEL if fast else RESPONSE_GZIP_LEVEL
+    out = {}
+    for encoding, data in (
+        ("br", brotli.compress(body, mode=brotli.MODE_TEXT, quality=quality)),
+        ("gzip", gzip.compress(body, compresslevel=level, mtime=0)),
+    ):
+        if len(data) < len(body):
+            # Другое представление — другой сильный ETag
+            out[encoding] = (data, f'"{digest}-{encoding}"')
+    return out
+
+
+class CachedResponse:
+    """Закодированное тело ответа 200, его ETag и сжатые варианты {кодировка: (тело, ETag)}."""
+
+    __slots__ = ("body", "etag", "encoded")
+
+    def __init__(self, body: bytes, compress: bool = False, fast: bool = False):
+        digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.body = body
+        self.etag = f'"{digest}"'
+        self.encoded = _compress(body, digest, fast) if compress else {}
+
+
+@lru_cache(maxsize=256)
+def _accepted(accept_encoding: str) -> frozenset:
+    """
+    Кодировки из Accept-Encoding с q > 0 (значений заголовка немного — разбор кэшируется).
+    * относится только к кодировкам, не названным явно: "br;q=0, *" — всё, кроме br.
+    """
+    listed = {}
+    star = 0.0
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip()
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if coding == "*":
+            star = q
+        elif coding:
+            listed[coding] = q
+    out = {coding for coding, q in listed.items() if q > 0}
+    if star > 0:
+        out.update(encoding for encoding in ENCODINGS if encoding not in listed)
+    return frozenset(out)
+
+
+def _encoding(request, entry: CachedResponse) -> str | None:
+    if not entry.encoded:
+        return None
+    accepted = _accepted(request.headers.get("Accept-Encoding", ""))
+    for encoding in ENCODINGS:
+        if encoding in accepted and encoding in entry.encoded:
+            return encoding
+    return None
+
+
+def response(request, endpoint: str, entry: CachedResponse, cacheable: bool = True) -> HttpResponse:
+    """
+    Ответ 200 с телом entry (сжатым, если клиент принимает) или 304, если у клиента та же версия.
+    cacheable=False — ответ с ошибкой или из устаревших данных (last_known).
+    """
+    if not cacheable:
+        resp = HttpResponse(entry.body, content_type=CONTENT_TYPE)
+        resp["Cache-Control"] = UNCACHEABLE_CACHE_CONTROL
+    else:
+        encoding = _encoding(request, entry)
+        body, etag = entry.encoded[encoding] if encoding else (entry.body, entry.etag)
+        resp = get_conditional_response(request, etag=etag)
+        if resp is None:
+            resp = HttpResponse(body, content_type=CONTENT_TYPE)
+            if encoding:
+                resp["Content-Encoding"] = encoding
+        resp["ETag"] = etag
+        resp["Cache-Control"] = RESPONSE_CACHE_CONTROL[endpoint]
+        if entry.encoded:
+            patch_vary_headers(resp, ("Accept-Encoding",))
+    if endpoint in VARY_ACCEPT:
+        patch_vary_headers(resp, ("Accept",))
+    return resp
+
+
+def get(endpoint: str, key: tuple) -> CachedResponse | None:
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    return _cache.lookup((endpoint, key))
+
+
+def encode(data) -> CachedResponse:
+    return CachedResponse(encode_json(data))
+
+
+def store(endpoint: str, key: tuple, data) -> CachedResponse:
+    """Закодировать и сжать data и запомнить для (endpoint, key) на RESPONSE_CACHE_TTLS[endpoint] секунд."""
+    if not RESPONSE_CACHE_ENABLED:
+        # Без кэша сжатие было бы на каждый запрос
+        return encode(data)
+    entry = CachedResponse(encode_json(data), compress=RESPONSE_COMPRESS, fast=endpoint in RESPONSE_FAST_COMPRESS)
+    _cache.set((endpoint, key), entry, RESPONSE_CACHE_TTLS[endpoint])
+    return entry
+
+
+def stats() -> dict:
+    return {"enabled": RESPONSE_CACHE_ENABLED, "compress": RESPONSE_COMPRESS, **_cache.stats()}
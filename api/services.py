@@ -2,19 +2,85 @@
 Сервис для работы с API The Movie Database (TMDB).
 Документация: https://developer.themoviedb.org/docs
 """
+import contextvars
 import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import date
 from urllib.parse import quote
 import requests
 
+from . import breaker, catalog, deadlines, metrics, profiling, ratelimit, titles, upstream
+from .breaker import BreakerOpen
+from .deadlines import DeadlineExceeded
+from .ratelimit import RateLimited
+from .cache import TTLCache
+from .pagination import Cursor, PageWalk, row_ref
+from .sharedcache import SharedCache
+from .singleflight import SingleFlight
+
 # Без завершающего слэша, чтобы не было двойного слэша в путях
 TMDB_BASE = (os.environ.get("TMDB_BASE") or "https://api.themoviedb.org/3").rstrip("/")
-TMDB_IMAGE_BASE = "https://image.tmdb.org/t/p/w500"
+TMDB_IMAGE_ROOT = (os.environ.get("TMDB_IMAGE_ROOT") or "https://image.tmdb.org/t/p").rstrip("/")
+TMDB_IMAGE_BASE = f"{TMDB_IMAGE_ROOT}/w500"
+# Ширины постеров TMDB (https://developer.themoviedb.org/docs/image-basics); шире последней — original
+TMDB_POSTER_LADDER = (92, 154, 185, 342, 500, 780)
+# Какие размеры отдавать в списках (posters): TMDB_POSTER_SIZES=w185,w342,w500
+TMDB_POSTER_SIZES = tuple(
+    x.strip() for x in os.environ.get("TMDB_POSTER_SIZES", "w185,w342,w500").split(",") if x.strip()
+)
 FILMS_STORAGE_BASE = os.environ.get("FILMS_STORAGE_BASE", "https://flcksbr.top/film/")
 # Таймаут в секундах; можно задать TMDB_TIMEOUT=30 в .env при медленной сети
+# Верхняя граница таймаута запроса; фактический — по задержкам эндпоинта (api.deadlines)
 TMDB_TIMEOUT = int(os.environ.get("TMDB_TIMEOUT", "25"))
-TMDB_RETRIES = 3  # повторов при ReadTimeout/ConnectionError
+TMDB_RETRIES = 3  # попыток при ReadTimeout/ConnectionError/5xx
+# Общий срок на все попытки одного запроса к TMDB, секунд (таймаут попытки — не больше остатка)
+TMDB_BUDGET = float(os.environ.get("TMDB_BUDGET", "30"))
+# Что можно подгрузить к деталям тем же запросом (append_to_response, параметр include)
+TMDB_DETAIL_INCLUDES = (
+    "credits", "aggregate_credits", "videos", "images", "external_ids", "keywords", "recommendations",
+    "similar", "reviews", "release_dates", "content_ratings", "translations", "watch/providers",
+)
+# Размер первой страницы поиска по жанру и по названию (limit по умолчанию)
+GENRE_PAGE_SIZE = 20
+QUERY_PAGE_SIZE = 10
+# Допустимый параметр year: фильмов раньше 1874 в TMDB нет, премьер дальше чем через 5 лет — тоже.
+# Год 0 — ячейка каталога без года (catalog.ALL_YEARS), фильтром по году он быть не может
+YEAR_MIN = 1874
+YEAR_MAX_AHEAD = 5
+# Пакетные детали (/api/v1/movies/batch): максимум id в запросе и одновременных запросов к TMDB
+BATCH_MAX_IDS = int(os.environ.get("BATCH_MAX_IDS", "50"))
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "8"))
+
+# Кэш ответов TMDB: размер (записей) и TTL по типу эндпоинта, TMDB_CACHE=0 — отключить
+TMDB_CACHE_ENABLED = os.environ.get("TMDB_CACHE", "1").strip().lower() not in ("0", "false", "no", "off")
+TMDB_CACHE_SIZE = int(os.environ.get("TMDB_CACHE_SIZE", "2048"))
+# (префикс пути TMDB, ttl, сколько ещё отдавать устаревшее значение, пока идёт обновление) — в секундах
+TMDB_CACHE_TTLS = (
+    ("/search/", 300, 600),
+    ("/trending/", 900, 3600),
+    ("/movie/popular", 1800, 3600 * 6),
+    ("/tv/popular", 1800, 3600 * 6),
+    ("/movie/upcoming", 3600, 3600 * 12),
+    ("/discover/", 3600 * 6, 3600 * 24),
+    ("/genre/", 3600 * 24, 3600 * 24 * 7),
+    ("/movie/", 3600 * 12, 3600 * 24),
+    ("/tv/", 3600 * 12, 3600 * 24),
+)
+TMDB_CACHE_DEFAULT_TTL = (600, 3600)
+
+# Второй уровень — общий для воркеров (api.sharedcache): ответ, полученный одним воркером, видят все
+_cache = TTLCache(maxsize=TMDB_CACHE_SIZE, name="tmdb", shared=SharedCache("tmdb"))
+# Одинаковые одновременные запросы к TMDB (вместе с повторами) выполняются один раз
+_flight = SingleFlight()
+# Режим принудительного обновления кэша для api.warmup (см. refreshing)
+_refresh = threading.local()
+# Список, в который _get/_aget отмечают ответы last_known (см. tracking_fallbacks). Изменяется на месте:
+# так видны вызывающему отметки из задач asyncio (у них копия контекста) и из пулов потоков —
+# если задача передана туда с контекстом (deadlines.bind); без него отметка теряется
+_fallbacks = contextvars.ContextVar("tmdb_fallbacks", default=None)
 
 def _api_key():
     return (os.environ.get("TMDB_API_KEY") or os.environ.get("TMDB_API_KEY_V3") or "").strip()
@@ -31,7 +97,7 @@ def _params(extra=None):
     return p
 
 
-def _poster_url(path):
+def _poster_url(path, size: str = "w500"):
     if not path or not isinstance(path, str):
         return None
     path = path.strip()
@@ -40,11 +106,32 @@ def _poster_url(path):
     if path.startswith("http://") or path.startswith("https://"):
         return path
     prefix = path if path.startswith("/") else f"/{path}"
-    return f"{TMDB_IMAGE_BASE}{prefix}"
+    return f"{TMDB_IMAGE_ROOT}/{size}{prefix}"
+
+
+def _poster_urls(path) -> dict | None:
+    """Постер в нескольких размерах TMDB: {"w185": url, "w342": url, ...}."""
+    if not _poster_url(path):
+        return None
+    return {size: _poster_url(path, size) for size in TMDB_POSTER_SIZES}
+
+
+def tmdb_image_size(value: str) -> str | None:
+    """Размер TMDB для запрошенного ("w185", "185", "original"): ближайшая ступень не меньше запрошенной; None — некорректно."""
+    value = (value or "").strip().lower()
+    if value == "original":
+        return value
+    width = value[1:] if value.startswith("w") else value
+    if not width.isdigit() or int(width) <= 0:
+        return None
+    for step in TMDB_POSTER_LADDER:
+        if int(width) <= step:
+            return f"w{step}"
+    return "original"
 
 
 def _movie_item(item: dict, is_tv: bool = False) -> dict | None:
-    """Приводим элемент TMDB к формату для фронта (id, name, alternativeName, year, votes, poster)."""
+    """Приводим элемент TMDB к формату для фронта (id, name, alternativeName, year, votes, poster, posters)."""
     if not item or not isinstance(item, dict):
         return None
     if is_tv:
@@ -66,9 +153,11 @@ def _movie_item(item: dict, is_tv: bool = False) -> dict | None:
         "year": year,
         "votes": item.get("vote_count") or 0,
         "poster": _poster_url(item.get("poster_path")),
+        "posters": _poster_urls(item.get("poster_path")),
     }
 
 
+@profiling.timed("transform")
 def _results(items: list, is_tv: bool = False) -> list:
     out = []
     for x in items or []:
@@ -78,24 +167,223 @@ def _results(items: list, is_tv: bool = False) -> list:
     return out
 
 
+def _cache_path(url: str) -> str:
+    return url[len(TMDB_BASE):] if url.startswith(TMDB_BASE) else url
+
+
+def _cache_ttl(path: str) -> tuple:
+    for prefix, ttl, stale_ttl in TMDB_CACHE_TTLS:
+        if path.startswith(prefix):
+            return ttl, stale_ttl
+    return TMDB_CACHE_DEFAULT_TTL
+
+
+def _cache_key(path: str, params: dict) -> tuple:
+    """Ключ кэша: путь + отсортированные параметры без api_key (строка запроса — без регистра и пробелов по краям)."""
+    items = []
+    for k, v in sorted((params or {}).items()):
+        if k == "api_key" or v is None:
+            continue
+        v = str(v).strip()
+        if k == "query":
+            v = v.lower()
+        items.append((k, v))
+    return (path, tuple(items))
+
+
+def breaker_stats() -> dict:
+    return breaker.stats()
+
+
+def ratelimit_stats() -> dict:
+    return ratelimit.stats()
+
+
+def cache_stats() -> dict:
+    return {"enabled": TMDB_CACHE_ENABLED, **_cache.stats()}
+
+
+def singleflight_stats() -> dict:
+    return _flight.stats()
+
+
+def _cache_entry(url: str, params: dict, on_404_return_empty: bool) -> tuple:
+    """(ключ, ttl, stale_ttl) записи кэша для запроса к TMDB."""
+    path = _cache_path(url)
+    ttl, stale_ttl = _cache_ttl(path)
+    return _cache_key(path, params) + (on_404_return_empty,), ttl, stale_ttl
+
+
+@profiling.timed("upstream")
 def _get(url: str, params: dict, on_404_return_empty: bool = False):
-    """Запрос к TMDB с повторами при таймауте/соединении. При 404 можно вернуть {} без исключения."""
+    """Запрос к TMDB через кэш (см. TMDB_CACHE_TTLS). Возвращаемый dict общий для всех — не изменять на месте."""
+    key, ttl, stale_ttl = _cache_entry(url, params, on_404_return_empty)
+
+    def fetch():
+        return _flight.do(key, lambda: _fetch(url, params, on_404_return_empty))
+
+    if not TMDB_CACHE_ENABLED:
+        return fetch()
+    refreshed = getattr(_refresh, "keys", None)
+    if refreshed is not None:
+        value = fetch()
+        _cache.set(key, value, ttl, stale_ttl)
+        refreshed.append((key, ttl))
+        return value
+    try:
+        return _cache.get_or_fetch(key, fetch, ttl, stale_ttl)
+    except (BreakerOpen, RateLimited, DeadlineExceeded, requests.RequestException) as e:
+        # TMDB недоступен — лучше устаревший ответ, чем ошибка
+        value = _cache.last_known(key) if _upstream_failure(e) else None
+        if value is None:
+            raise
+        _note_fallback(key)
+        return value
+
+
+@contextmanager
+def tracking_fallbacks():
+    """
+    Внутри блока (и в задачах и в пулах потоков через deadlines.bind) отмечает ответы TMDB, отданные из last_known.
+    Отдаёт список их ключей: непустой — в ответе устаревшие данные, кэшировать его нельзя.
+    """
+    served = []
+    token = _fallbacks.set(served)
+    try:
+        yield served
+    finally:
+        _fallbacks.reset(token)
+
+
+def _note_fallback(key):
+    served = _fallbacks.get()
+    if served is not None:
+        served.append(key)
+
+
+def _upstream_failure(e: Exception) -> bool:
+    """Сбой TMDB (а не ошибка запроса): breaker открыт, лимит запросов, таймаут или бюджет запроса, нет соединения, 429 и 5xx."""
+    if isinstance(e, (BreakerOpen, RateLimited, DeadlineExceeded, requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+        return True
+    response = getattr(e, "response", None)
+    return response is not None and (response.status_code == 429 or response.status_code >= 500)
+
+
+def _endpoint_class(path: str) -> str:
+    """Класс эндпоинта для circuit breaker: префикс из TMDB_CACHE_TTLS или первый сегмент пути."""
+    for prefix, _, _ in TMDB_CACHE_TTLS:
+        if path.startswith(prefix):
+            return prefix
+    return "/" + path.strip("/").split("/")[0]
+
+
+@contextmanager
+def refreshing():
+    """
+    Внутри блока (в текущем потоке) _get запрашивает TMDB независимо от свежести записи и кладёт
+    ответ в кэш. Отдаёт список (ключ, ttl) обновлённых записей — по нему api.warmup планирует следующий раз.
+    """
+    keys = _refresh.keys = []
+    try:
+        yield keys
+    finally:
+        _refresh.keys = None
+
+
+def _fetch(url: str, params: dict, on_404_return_empty: bool = False):
+    """
+    Запрос к TMDB через circuit breaker (api.breaker) и общий лимит запросов (api.ratelimit).
+    При таймауте, ошибке соединения, 429 и 5xx — повторы с экспоненциальной задержкой, пока укладываемся
+    в TMDB_BUDGET и бюджет запроса (api.deadlines). При 404 можно вернуть {} без исключения.
+    """
+    endpoint = _endpoint_class(_cache_path(url))
+    circuit = breaker.get(url, endpoint)
+    deadline = deadlines.until(TMDB_BUDGET)
     last_error = None
     for attempt in range(TMDB_RETRIES):
+        if time.monotonic() >= deadline:
+            raise last_error or DeadlineExceeded(endpoint)
+        if not circuit.allow():
+            raise last_error or BreakerOpen(circuit.name, circuit.retry_in())
+        if attempt:
+            metrics.tmdb_retry(endpoint)
         try:
-            resp = requests.get(url, params=params, timeout=TMDB_TIMEOUT, verify=_ssl_verify())
-            if resp.status_code == 404 and on_404_return_empty:
-                return {}
-            resp.raise_for_status()
-            return resp.json() or {}
+            ratelimit.acquire(timeout=deadline - time.monotonic())
+            timeout = min(deadlines.timeout(endpoint, TMDB_TIMEOUT), deadline - time.monotonic())
+            if timeout <= 0:
+                raise DeadlineExceeded(endpoint)
+            hedge_after = deadlines.hedge_after(endpoint, timeout)
+            started = time.perf_counter()
+            with metrics.TMDB_IN_FLIGHT.track_inprogress():
+                if hedge_after is None:
+                    resp = upstream.get(url, params=params, timeout=timeout, verify=_ssl_verify())
+                else:
+                    resp, hedge_won = upstream.hedged_get(
+                        url, hedge_after, lambda: _hedge_allowed(endpoint), params=params, timeout=timeout, verify=_ssl_verify()
+                    )
+                    if hedge_won:
+                        metrics.tmdb_hedge(endpoint, "won")
         except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            elapsed = time.perf_counter() - started
+            if isinstance(e, requests.exceptions.Timeout):
+                deadlines.record(endpoint, elapsed)
+            metrics.tmdb_response(endpoint, "timeout" if isinstance(e, requests.exceptions.Timeout) else "error", elapsed)
+            circuit.failure()
             last_error = e
-            if attempt < TMDB_RETRIES - 1:
-                time.sleep(1)
-            continue
+        except BaseException:
+            circuit.abandon()
+            raise
+        else:
+            elapsed = time.perf_counter() - started
+            metrics.tmdb_response(endpoint, resp.status_code, elapsed)
+            if resp.status_code == 429:
+                # Лимит TMDB — не сбой сервиса: breaker не трогаем, остальные воркеры ждут Retry-After
+                circuit.abandon()
+                ratelimit.throttled(resp.headers.get("Retry-After"))
+                last_error = _http_error(resp)
+            elif resp.status_code < 500:
+                deadlines.record(endpoint, elapsed)
+                circuit.success()
+                return _response_data(url, resp, on_404_return_empty)
+            else:
+                circuit.failure()
+                last_error = _http_error(resp)
+        delay = breaker.backoff_delay(attempt)
+        if attempt == TMDB_RETRIES - 1 or time.monotonic() + delay >= deadline:
+            break
+        time.sleep(delay)
     raise last_error
 
 
+def _hedge_allowed(endpoint: str, blocking: bool = True) -> bool:
+    """
+    Второй (хеджирующий) запрос — только со свободным токеном общего лимита, ждать его он не должен.
+    blocking=False — не ждать и flock состояния лимита (из event loop).
+    """
+    if not ratelimit.try_acquire(blocking):
+        return False
+    metrics.tmdb_hedge(endpoint, "sent")
+    return True
+
+
+def _http_error(resp) -> Exception:
+    """Исключение raise_for_status() ответа requests или httpx."""
+    try:
+        resp.raise_for_status()
+    except Exception as e:
+        return e
+
+
+def _response_data(url: str, resp, on_404_return_empty: bool) -> dict:
+    """JSON ответа TMDB (requests или httpx); 4xx — исключение, кроме 404 при on_404_return_empty."""
+    if resp.status_code == 404 and on_404_return_empty:
+        return {}
+    resp.raise_for_status()
+    data = resp.json() or {}
+    titles.remember_response(_cache_path(url), data)
+    return data
+
+
 # --- Блоки главной ---
 
 def _empty_results(detail: str = "TMDB_API_KEY не задан"):
@@ -108,6 +396,11 @@ def get_popular_now(limit: int = 12):
     if not _api_key():
         return _empty_results()
     data = _get(f"{TMDB_BASE}/trending/all/day", _params(), on_404_return_empty=True)
+    return _trending_results(data, limit)
+
+
+@profiling.timed("transform")
+def _trending_results(data: dict, limit: int) -> dict:
     items = data.get("results") or []
     out = []
     for x in items[:limit]:
@@ -144,16 +437,16 @@ def get_coming_soon(limit: int = 4):
         return _empty_results()
     data = _get(f"{TMDB_BASE}/movie/upcoming", _params({"page": 1}), on_404_return_empty=True)
     if not data:
-        today = date.today().isoformat()
-        data = _get(
-            f"{TMDB_BASE}/discover/movie",
-            _params({"page": 1, "sort_by": "popularity.desc", "primary_release_date.gte": today}),
-            on_404_return_empty=True,
-        )
+        data = _get(f"{TMDB_BASE}/discover/movie", _coming_soon_fallback_params(), on_404_return_empty=True)
     items = (data or {}).get("results", [])[:limit]
     return {"results": _results(items, is_tv=False)}
 
 
+def _coming_soon_fallback_params() -> dict:
+    today = date.today().isoformat()
+    return _params({"page": 1, "sort_by": "popularity.desc", "primary_release_date.gte": today})
+
+
 # --- Поиск по жанру (TMDB: discover + genre id) ---
 
 # Маппинг названий жанров на id TMDB (movie) — можно расширить
@@ -172,12 +465,91 @@ TMDB_GENRE_IDS = {
 }
 
 
-def search_by_genre(genre_name: str, year: str | None):
-    """Поиск фильмов по жанру (и опционально году). До 20 результатов."""
+def search_by_genre(genre_name: str, year: str | None, cursor: Cursor | None = None, limit: int | None = None):
+    """
+    Поиск фильмов по жанру (и опционально году). По умолчанию 20 результатов; первая страница —
+    из каталога в БД (api.catalog), если он есть. cursor и limit — продолжение (next_cursor из ответа).
+    """
+    params = _genre_params(genre_name, year)
+    if params is None:
+        return {"results_count": 0, "results": [], "next_cursor": None}
+    if cursor is None and limit in (None, GENRE_PAGE_SIZE):
+        items = _catalog_items(params["with_genres"], year)
+        if items is not None:
+            result = _genre_results({"results": items})
+            # В каталоге первая страница discover — продолжаем из TMDB со второй
+            result["next_cursor"] = Cursor(2).encode() if len(items) >= GENRE_PAGE_SIZE else None
+            return result
+    walk = _genre_walk(params, cursor, limit or GENRE_PAGE_SIZE, prefetch=False)
+    rows = list(walk)
+    return {"results_count": len(rows), "results": rows, "next_cursor": walk.next_token}
+
+
+def genre_walk(genre_name: str, year: str | None, cursor: Cursor | None, limit: int) -> PageWalk | None:
+    """Строки поиска по жанру страницами TMDB (для потоковой выдачи); None — жанр неизвестен."""
+    params = _genre_params(genre_name, year)
+    return _genre_walk(params, cursor, limit, prefetch=True) if params is not None else None
+
+
+def _genre_walk(params: dict, cursor: Cursor | None, limit: int, prefetch: bool) -> PageWalk:
+    def fetch_page(page):
+        data = _get(f"{TMDB_BASE}/discover/movie", {**params, "page": page})
+        return _results(data.get("results", []), is_tv=False), data.get("total_pages") or 0
+
+    return PageWalk(fetch_page, cursor, limit, prefetch)
+
+
+def year_range() -> tuple:
+    """(от, до) допустимых значений параметра year."""
+    return YEAR_MIN, date.today().year + YEAR_MAX_AHEAD
+
+
+def _year_bounds(year: str | None) -> tuple | None:
+    """(от, до) для "2020" или "2015-2021"; None — год не задан. ValueError — некорректный год или вне year_range()."""
+    if not year:
+        return None
+    parts = year.split("-")
+    if len(parts) == 1:
+        start = end = int(parts[0])
+    elif len(parts) == 2:
+        start, end = int(parts[0]), int(parts[1])
+    else:
+        raise ValueError(year)
+    low, high = year_range()
+    if not low <= start <= end <= high:
+        raise ValueError(year)
+    return start, end
+
+
+def _catalog_items(genre_id: int, year: str | None) -> list | None:
+    try:
+        years = _year_bounds(year)
+    except ValueError:
+        return None
+    return catalog.lookup(genre_id, years, limit=20)
+
+
+def refresh_catalog_cell(genre_name: str, year: int, pages: int = 1) -> int:
+    """Перезаписать ячейку каталога (жанр, год; catalog.ALL_YEARS — без года) ответами discover. Возвращает число фильмов."""
+    items = []
+    year_param = str(year) if year != catalog.ALL_YEARS else None
+    for page in range(1, pages + 1):
+        params = _genre_params(genre_name, year_param)
+        params["page"] = page
+        # Мимо кэша ответов: результат и так ляжет в БД
+        data = _fetch(f"{TMDB_BASE}/discover/movie", params)
+        items.extend(data.get("results") or [])
+        if page >= (data.get("total_pages") or 0):
+            break
+    return catalog.store_cell(TMDB_GENRE_IDS[genre_name.strip().lower()], year, items)
+
+
+def _genre_params(genre_name: str, year: str | None) -> dict | None:
+    """Параметры discover для жанра и года; None — жанр неизвестен."""
     name = (genre_name or "").strip().lower()
     genre_id = TMDB_GENRE_IDS.get(name)
     if not genre_id:
-        return {"results_count": 0, "results": []}
+        return None
     params = _params({"with_genres": genre_id, "page": 1, "sort_by": "popularity.desc"})
     if year:
         if "-" in year:
@@ -187,38 +559,175 @@ def search_by_genre(genre_name: str, year: str | None):
                 params["primary_release_date.lte"] = f"{parts[1].strip()}-12-31"
         else:
             params["primary_release_year"] = year.strip()
-    data = _get(f"{TMDB_BASE}/discover/movie", params)
+    return params
+
+
+def _genre_results(data: dict) -> dict:
     items = data.get("results", [])[:20]
     return {"results_count": len(items), "results": _results(items, is_tv=False)}
 
 
-def search_by_query(q: str):
-    """Поиск по названию (мульти: фильмы + сериалы), до 10 результатов."""
+def search_by_query(q: str, cursor: Cursor | None = None, limit: int | None = None):
+    """
+    Поиск по названию (мульти: фильмы + сериалы), по умолчанию до 10 результатов.
+    Первая страница — из локального индекса (api.titles), если там достаточно совпадений.
+    cursor и limit — продолжение (next_cursor из ответа).
+    """
     if not (q or "").strip():
-        return {"results": []}
-    data = _get(f"{TMDB_BASE}/search/multi", _params({"query": q.strip(), "page": 1}))
+        return {"results": [], "next_cursor": None}
+    limit = limit or QUERY_PAGE_SIZE
+    if cursor is None:
+        local = titles.search(q, limit=limit)
+        if local is not None:
+            result = _local_search_results(local)
+            # Продолжение — из TMDB без уже показанных из индекса
+            result["next_cursor"] = Cursor(1, 0, [row_ref(row) for row in local]).encode()
+            return result
+    walk = query_walk(q, cursor, limit, prefetch=False)
+    rows = list(walk)
+    return {"results": rows, "next_cursor": walk.next_token}
+
+
+def query_walk(q: str, cursor: Cursor | None, limit: int, prefetch: bool = True) -> PageWalk:
+    """Строки поиска по названию страницами TMDB /search/multi (prefetch — как в PageWalk; по умолчанию — для потока)."""
+    query = q.strip()
+
+    def fetch_page(page):
+        data = _get(f"{TMDB_BASE}/search/multi", _params({"query": query, "page": page}))
+        return _search_rows(data), data.get("total_pages") or 0
+
+    return PageWalk(fetch_page, cursor, limit, prefetch)
+
+
+@profiling.timed("transform")
+def _local_search_results(rows: list) -> dict:
+    for row in rows:
+        poster_path = row.pop("poster_path")
+        row["poster"] = _poster_url(poster_path)
+        row["posters"] = _poster_urls(poster_path)
+    return {"results": rows}
+
+
+@profiling.timed("transform")
+def _search_rows(data: dict) -> list:
+    """Фильмы и сериалы из ответа /search/multi (персоны отбрасываются); media_type — movie или tv."""
     items = []
     for x in data.get("results", []):
         if x.get("media_type") not in ("movie", "tv"):
             continue
-        is_tv = x.get("media_type") == "tv"
-        items.append(_movie_item(x, is_tv=is_tv))
-        if len(items) >= 10:
-            break
-    return {"results": items}
+        items.append({**_movie_item(x, is_tv=x.get("media_type") == "tv"), "media_type": x["media_type"]})
+    return items
 
 
-def get_movie_details(movie_id: int, is_tv: bool = False):
-    """Полная информация о фильме/сериале по ID."""
+def get_movie_details(movie_id: int, is_tv: bool = False, include=(), fields=None):
+    """
+    Полная информация о фильме/сериале по ID.
+    include — подресурсы TMDB_DETAIL_INCLUDES одним запросом (append_to_response),
+    fields — оставить только эти поля (см. _project).
+    """
     segment = "tv" if is_tv else "movie"
-    data = _get(f"{TMDB_BASE}/{segment}/{movie_id}", _params())
+    data = _get(f"{TMDB_BASE}/{segment}/{movie_id}", _detail_params(include))
+    return _project(_details_result(data), fields)
+
+
+def _detail_params(include=()) -> dict:
+    if not include:
+        return _params()
+    # Отсортировано: один и тот же набор include — одна запись кэша
+    return _params({"append_to_response": ",".join(sorted(set(include)))})
+
+
+@profiling.timed("transform")
+def _project(data: dict, fields) -> dict:
+    """
+    Только поля fields: ["id", "title", "credits.cast"] — вложенные через точку.
+    Значения не копируются (могут быть общими с кэшем); отсутствующие поля пропускаются.
+    """
+    if not fields:
+        return data
+    out = {}
+    taken = set()
+    # Сначала короткие пути: "credits" уже целиком в ответе — "credits.cast" пропускаем (и не трогаем общий dict)
+    for field in sorted(fields, key=lambda f: f.count(".")):
+        *path, name = field.split(".")
+        if any(".".join(path[:i]) in taken for i in range(1, len(path) + 1)):
+            continue
+        src = data
+        for part in path:
+            src = src.get(part) if isinstance(src, dict) else None
+        if not isinstance(src, dict) or name not in src:
+            continue
+        dst = out
+        for part in path:
+            if not isinstance(dst.get(part), dict):
+                dst[part] = {}
+            dst = dst[part]
+        dst[name] = src[name]
+        taken.add(field)
+    return out
+
+
+def _details_cached(media_type: str, movie_id: int, shared: bool = True) -> bool:
+    """Есть ли детали в кэше (свежие или устаревшие, но ещё отдаваемые); shared=False — только в памяти."""
+    key, _, _ = _cache_entry(f"{TMDB_BASE}/{media_type}/{movie_id}", _params(), False)
+    return TMDB_CACHE_ENABLED and _cache.get(key, shared=shared)[1] is not None
+
+
+_batch_executor = None
+_batch_executor_lock = threading.Lock()
+
+
+def _get_batch_executor() -> ThreadPoolExecutor:
+    # Создаём лениво в воркере, а не при импорте (потоки не переживают fork)
+    global _batch_executor
+    if _batch_executor is None:
+        with _batch_executor_lock:
+            if _batch_executor is None:
+                _batch_executor = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY, thread_name_prefix="batch")
+    return _batch_executor
+
+
+def get_details_batch(refs: list) -> dict:
+    """
+    Детали для нескольких фильмов/сериалов: refs — [(media_type "movie"/"tv", id)], дубли схлопываются.
+    Записи из кэша отдаются сразу, промахи запрашиваются параллельно (не больше BATCH_CONCURRENCY).
+    Возвращает {(media_type, id): детали или исключение}.
+    """
+    out = {}
+    futures = {}
+    for media_type, movie_id in dict.fromkeys(refs):
+        ref = (media_type, movie_id)
+        if _details_cached(media_type, movie_id):
+            try:
+                out[ref] = get_movie_details(movie_id, is_tv=media_type == "tv")
+            except Exception as e:
+                out[ref] = e
+        else:
+            futures[ref] = _get_batch_executor().submit(deadlines.bind(get_movie_details), movie_id, media_type == "tv")
+    for ref, future in futures.items():
+        try:
+            out[ref] = future.result()
+        except Exception as e:
+            out[ref] = e
+    return out
+
+
+@profiling.timed("transform")
+def _details_result(data: dict) -> dict:
+    # Копия: data может лежать в кэше и быть общей для всех запросов
+    data = dict(data)
     if data.get("poster_path"):
         data["poster_url"] = _poster_url(data["poster_path"])
+        data["poster_urls"] = _poster_urls(data["poster_path"])
     return data
 
 
-def get_watch_link(movie_id: int, is_tv: bool = False):
-    """Детали и ссылка на просмотр."""
-    details = get_movie_details(movie_id, is_tv=is_tv)
+def get_watch_link(movie_id: int, is_tv: bool = False, include=(), fields=None):
+    """Детали и ссылка на просмотр (include и fields — как в get_movie_details, view_link тоже можно выбрать)."""
+    details = get_movie_details(movie_id, is_tv=is_tv, include=include)
+    return _project(_watch_result(details, movie_id), fields)
+
+
+def _watch_result(details: dict, movie_id: int) -> dict:
     details["view_link"] = f"{FILMS_STORAGE_BASE}{movie_id}"
     return details
@@ -0,0 +1,222 @@
+"""
+Общий для всех воркеров второй уровень кэша — таблица api_shared_cache в db.sqlite3 (WAL).
+
+TTLCache(shared=SharedCache(...)) при промахе или просроченной записи в памяти смотрит сюда,
+а каждую новую запись дублирует сюда же. Ответ TMDB, полученный одним воркером (или прогревом),
+видят все воркеры на хосте: TMDB запрашивается один раз, а не по разу на воркер.
+
+Значения — JSON (orjson), длиннее SHARED_CACHE_COMPRESS_MIN байт — ещё и сжатые zlib. Сроки — по
+time.time(): monotonic у каждого процесса свой. Общий размер таблицы ограничен SHARED_CACHE_MAX_BYTES:
+при превышении удаляются записи, раньше всех вышедшие из stale-окна. Сам размер ведут триггеры
+в api_shared_cache_size (миграция 0004) — проверка не суммирует таблицу. Совсем устаревшие записи
+живут до вытеснения — их отдаёт last_known, когда TMDB недоступен.
+
+Кэш — best effort: занятая БД, нет таблицы (не выполнен migrate) или БД не SQLite — просто промах.
+"""
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+import orjson
+from django.conf import settings
+
+from . import metrics
+
+SHARED_CACHE_ENABLED = os.environ.get("SHARED_CACHE", "1").strip().lower() not in ("0", "false", "no", "off")
+SHARED_CACHE_MAX_BYTES = int(os.environ.get("SHARED_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Значения длиннее (байт JSON) сжимаются zlib
+SHARED_CACHE_COMPRESS_MIN = int(os.environ.get("SHARED_CACHE_COMPRESS_MIN", "1024"))
+# Сколько ждать блокировку записи, мс: кэш не должен задерживать ответ (и event loop в async-режиме)
+SHARED_CACHE_BUSY_TIMEOUT_MS = int(os.environ.get("SHARED_CACHE_BUSY_TIMEOUT_MS", "50"))
+# Размер таблицы проверяется раз в столько записей из процесса
+_EVICT_EVERY = 64
+_TABLE = "api_shared_cache"
+_SIZE_TABLE = "api_shared_cache_size"
+
+# Первый байт значения: как закодировано
+_RAW = b"j"
+_ZLIB = b"z"
+
+
+def _database_path() -> str | None:
+    db = settings.DATABASES["default"]
+    if db["ENGINE"] != "django.db.backends.sqlite3":
+        return None
+    return str(db["NAME"])
+
+
+def _encode(value) -> bytes:
+    data = orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+    if len(data) >= SHARED_CACHE_COMPRESS_MIN:
+        return _ZLIB + zlib.compress(data, 1)
+    return _RAW + data
+
+
+def _decode(blob: bytes):
+    data = blob[1:]
+    if blob[:1] == _ZLIB:
+        data = zlib.decompress(data)
+    return orjson.loads(data)
+
+
+class SharedCache:
+    """
+    Кэш ключ-значение в SQLite, общий для процессов. name — префикс ключей и метка cache="<name>_shared"
+    в метриках. Значения должны кодироваться в JSON (ответы TMDB); остальные не сохраняются.
+    """
+
+    def __init__(self, name: str, max_bytes: int = SHARED_CACHE_MAX_BYTES):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.path = _database_path() if SHARED_CACHE_ENABLED else None
+        # Соединение своё у каждого потока; после fork — новое
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def _connection(self) -> sqlite3.Connection:
+        pid = os.getpid()
+        if getattr(self._local, "pid", None) != pid:
+            conn = sqlite3.connect(self.path, timeout=SHARED_CACHE_BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = pid
+        return self._local.conn
+
+    def _key(self, key) -> str:
+        # Ключи TTLCache — кортежи строк, чисел и bool: repr стабилен между процессами
+        return f"{self.name}:{key!r}"
+
+    def _count(self, field: str):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def get(self, key, expired: bool = False) -> tuple | None:
+        """(value, expires, stale_until) — сроки по time.time() — или None. expired=True — и вне stale-окна."""
+        if self.path is None:
+            return None
+        sql = f"SELECT value, expires, stale_until FROM {_TABLE} WHERE key = ?"
+        params = [self._key(key)]
+        if not expired:
+            sql += " AND stale_until > ?"
+            params.append(time.time())
+        try:
+            row = self._connection().execute(sql, params).fetchone()
+            value = _decode(row[0]) if row is not None else None
+        except (sqlite3.Error, zlib.error, orjson.JSONDecodeError):
+            self._count("errors")
+            row = None
+        if row is None:
+            self._count("misses")
+            metrics.cache_result(f"{self.name}_shared", "miss")
+            return None
+        self._count("hits")
+        metrics.cache_result(f"{self.name}_shared", "hit")
+        return value, row[1], row[2]
+
+    def set(self, key, value, expires: float, stale_until: float):
+        """Записать value со сроками по time.time(). Ошибки (в т.ч. значение не JSON) глотаются."""
+        if self.path is None:
+            return
+        key = self._key(key)
+        try:
+            blob = _encode(value)
+            # UPSERT, а не INSERT OR REPLACE: замена должна пройти через UPDATE-триггер размера
+            self._connection().execute(
+                f"INSERT INTO {_TABLE} (key, value, expires, stale_until, size) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires = excluded.expires, "
+                "stale_until = excluded.stale_until, size = excluded.size",
+                (key, blob, expires, stale_until, len(key) + len(blob)),
+            )
+        except (sqlite3.Error, TypeError):
+            self._count("errors")
+            return
+        with self._lock:
+            self.writes += 1
+            evict = self.writes % _EVICT_EVERY == 0
+        if evict:
+            self._evict()
+
+    def _evict(self):
+        """Пока таблица больше max_bytes — удалить записи, раньше всех вышедшие из stale-окна (до 90% лимита)."""
+        conn = self._connection()
+        try:
+            total = self._size(conn)
+            if total <= self.max_bytes:
+                return
+            excess = total - self.max_bytes * 0.9
+            keys = []
+            cursor = conn.execute(f"SELECT key, size FROM {_TABLE} ORDER BY stale_until")
+            for key, size in cursor:
+                keys.append((key,))
+                excess -= size
+                if excess <= 0:
+                    break
+            cursor.close()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(f"DELETE FROM {_TABLE} WHERE key = ?", keys)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            self._count("errors")
+            return
+        with self._lock:
+            self.evictions += len(keys)
+
+    @staticmethod
+    def _size(conn: sqlite3.Connection) -> int:
+        """Общий размер записей из api_shared_cache_size (sqlite3.Error — таблицы нет, не выполнен migrate)."""
+        row = conn.execute(f"SELECT bytes FROM {_SIZE_TABLE} WHERE id = 0").fetchone()
+        return row[0] if row is not None else 0
+
+    def delete(self, key):
+        if self.path is None:
+            return
+        try:
+            self._connection().execute(f"DELETE FROM {_TABLE} WHERE key = ?", (self._key(key),))
+        except sqlite3.Error:
+            self._count("errors")
+
+    def clear(self):
+        """Удалить все записи этого кэша (с префиксом name)."""
+        if self.path is None:
+            return
+        try:
+            self._connection().execute(
+                f"DELETE FROM {_TABLE} WHERE key >= ? AND key < ?", (f"{self.name}:", f"{self.name};")
+            )
+        except sqlite3.Error:
+            self._count("errors")
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "errors": self.errors,
+            }
+        if self.enabled:
+            try:
+                conn = self._connection()
+                entries = conn.execute(f"SELECT COUNT(*) FROM {_TABLE}").fetchone()[0]
+                size = self._size(conn)
+            except sqlite3.Error:
+                entries = size = None
+            out.update(entries=entries, bytes=size, max_bytes=self.max_bytes)
+        return out
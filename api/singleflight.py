@@ -0,0 +1,234 @@
+"""
+Single-flight: одновременные одинаковые запросы к TMDB выполняются один раз.
+Первый вызов с ключом становится ведущим, остальные ждут его результат или ошибку.
+
+Внутри процесса — для потоков (do) и для корутин одного event loop (ado).
+Между воркерами gunicorn — опционально, если задан каталог SINGLEFLIGHT_DIR:
+ведущий берёт flock на файл ключа и публикует результат (JSON) рядом,
+ведущие других воркеров, дождавшись блокировки, берут свежий результат из файла.
+Ведомые и ведущий, ждущий блокировку другого воркера, ждут не дольше бюджета своего запроса
+(api.deadlines) — дальше DeadlineExceeded.
+"""
+import asyncio
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+import weakref
+
+from . import deadlines
+from .deadlines import DeadlineExceeded
+
+SINGLEFLIGHT_DIR = os.environ.get("SINGLEFLIGHT_DIR", "").strip()
+# Сколько секунд опубликованный другим воркером результат считается свежим
+SINGLEFLIGHT_SHARE_TTL = float(os.environ.get("SINGLEFLIGHT_SHARE_TTL", "5"))
+# Пауза между попытками взять блокировку ключа, которую держит другой воркер, секунд
+_LOCK_POLL = 0.01
+
+
+class _Call:
+    __slots__ = ("event", "value", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class _FileLease:
+    """Межпроцессная блокировка ключа (flock) и файл с результатом последнего ведущего."""
+
+    def __init__(self, directory: str, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        self.lock_path = os.path.join(directory, f"{digest}.lock")
+        self.result_path = os.path.join(directory, f"{digest}.json")
+        self._fd = None
+
+    def acquire(self, timeout: float | None = None):
+        """Взять блокировку: ждать не дольше timeout секунд (иначе DeadlineExceeded), None — без срока."""
+        self._fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        if timeout is None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            return
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    os.close(self._fd)
+                    self._fd = None
+                    raise DeadlineExceeded("single-flight lock") from None
+                time.sleep(min(_LOCK_POLL, left))
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+    def shared_result(self):
+        """(True, value), если другой воркер только что получил результат, иначе (False, None)."""
+        try:
+            if time.time() - os.path.getmtime(self.result_path) > SINGLEFLIGHT_SHARE_TTL:
+                return False, None
+            with open(self.result_path, encoding="utf-8") as f:
+                return True, json.load(f)
+        except (OSError, ValueError):
+            return False, None
+
+    def publish(self, value):
+        tmp = f"{self.result_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp, self.result_path)
+        except (OSError, TypeError, ValueError):
+            # Несериализуемое значение или нет места — просто не делимся результатом
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+
+def _release_after(lease: _FileLease):
+    """Колбэк для future захвата lease: отпустить блокировку (ошибку захвата — забрать, чтобы не было в логе)."""
+
+    def callback(future):
+        if not future.cancelled():
+            future.exception()
+        lease.release()
+
+    return callback
+
+
+class SingleFlight:
+    def __init__(self, directory: str = SINGLEFLIGHT_DIR):
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._afutures = weakref.WeakKeyDictionary()
+        self.leaders = 0
+        self.followers = 0
+        self.shared_across_workers = 0
+
+    def do(self, key, fn):
+        """Выполнить fn() для key один раз на все одновременные вызовы (потоки процесса и, опционально, воркеры)."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.followers += 1
+        if not leader:
+            # Ведущий может быть фоновым (прогрев, без бюджета) — ждём не дольше своего запроса
+            if not call.event.wait(deadlines.remaining()):
+                raise DeadlineExceeded("single-flight")
+            if call.error is not None:
+                raise call.error
+            return call.value
+        try:
+            call.value = self._run_leader(key, fn)
+            return call.value
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def _run_leader(self, key, fn):
+        if not self.directory:
+            return fn()
+        lease = _FileLease(self.directory, key)
+        lease.acquire(deadlines.remaining())
+        try:
+            found, value = lease.shared_result()
+            if found:
+                with self._lock:
+                    self.shared_across_workers += 1
+                return value
+            value = fn()
+            lease.publish(value)
+            return value
+        finally:
+            lease.release()
+
+    async def ado(self, key, afn):
+        """Асинхронный do: afn — функция без аргументов, возвращающая корутину."""
+        loop = asyncio.get_running_loop()
+        futures = self._afutures.get(loop)
+        if futures is None:
+            futures = self._afutures[loop] = {}
+        while (future := futures.get(key)) is not None:
+            with self._lock:
+                self.followers += 1
+            try:
+                # shield: отмена одного ожидающего (и истёкший бюджет) не должна отменять общий запрос
+                return await asyncio.wait_for(asyncio.shield(future), deadlines.remaining())
+            except TimeoutError:
+                raise DeadlineExceeded("single-flight") from None
+            except asyncio.CancelledError:
+                # Отменили ведущего (клиент ушёл, wait_for), а не нас — повторяем, возможно уже ведущим
+                if not future.cancelled() or asyncio.current_task().cancelling():
+                    raise
+        future = futures[key] = loop.create_future()
+        with self._lock:
+            self.leaders += 1
+        try:
+            value = await self._arun_leader(key, afn)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Исключение уже пробрасываем сами; помечаем, что у future оно получено
+            future.exception()
+            raise
+        finally:
+            futures.pop(key, None)
+
+    async def _arun_leader(self, key, afn):
+        if not self.directory:
+            return await afn()
+        lease = _FileLease(self.directory, key)
+        # Ждём flock в потоке, чтобы не останавливать event loop
+        acquiring = asyncio.ensure_future(asyncio.to_thread(lease.acquire, deadlines.remaining()))
+        try:
+            await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            # Поток всё равно получит блокировку — отпускаем её, как только получит
+            acquiring.add_done_callback(_release_after(lease))
+            raise
+        try:
+            found, value = lease.shared_result()
+            if found:
+                with self._lock:
+                    self.shared_across_workers += 1
+                return value
+            value = await afn()
+            lease.publish(value)
+            return value
+        finally:
+            lease.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "cross_worker": bool(self.directory),
+                "in_flight": len(self._calls) + sum(len(f) for f in list(self._afutures.values())),
+                "leaders": self.leaders,
+                "followers": self.followers,
+                "shared_across_workers": self.shared_across_workers,
+            }
@@ -0,0 +1,67 @@
+"""
+Общее для тестов вьюх: upstream.get подменён, кэши, single-flight и breaker — свои на каждый тест,
+лимит запросов, индекс названий и каталог выключены (тесты не трогают ни БД, ни файлы, ни TMDB).
+"""
+import json
+import time
+from unittest import mock
+
+import requests
+from django.test import SimpleTestCase, override_settings
+
+from api import breaker, catalog, ratelimit, responses, services, titles, upstream
+from api.cache import TTLCache
+from api.singleflight import SingleFlight
+
+MOVIE = {"id": 550, "title": "Бойцовский клуб", "poster_path": "/p.jpg"}
+
+
+def tmdb_response(status_code: int, data: dict | None = None, headers: dict | None = None, url: str = "/movie/550") -> requests.Response:
+    """Ответ TMDB для подменённого upstream.get."""
+    resp = requests.Response()
+    resp.status_code = status_code
+    resp._content = json.dumps(data or {}).encode("utf-8")
+    resp.headers.update(headers or {})
+    resp.url = f"{services.TMDB_BASE}{url}"
+    return resp
+
+
+def discover_page(page: int, total_pages: int = 5, per_page: int = 20) -> dict:
+    """Страница /discover/movie: id фильмов page*100 + номер строки."""
+    return {
+        "page": page,
+        "total_pages": total_pages,
+        "results": [{"id": page * 100 + i, "title": f"Фильм {page}-{i}"} for i in range(per_page)],
+    }
+
+
+class TMDBMixin:
+    def setUp(self):
+        super().setUp()
+        self.upstream = mock.MagicMock()
+        patches = [
+            mock.patch.object(upstream, "get", self.upstream),
+            mock.patch.object(services, "_cache", TTLCache(maxsize=256, name="tmdb_test")),
+            mock.patch.object(services, "_flight", SingleFlight("")),
+            mock.patch.object(responses, "_cache", TTLCache(maxsize=256, name="responses_test")),
+            mock.patch.object(breaker, "_breakers", {}),
+            mock.patch.object(breaker, "backoff_delay", lambda attempt: 0),
+            mock.patch.object(ratelimit, "RATE_LIMIT_ENABLED", False),
+            mock.patch.object(titles, "TITLE_INDEX_ENABLED", False),
+            mock.patch.object(catalog, "CATALOG_ENABLED", False),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def expire_tmdb_cache(self, path: str = ""):
+        """Записи кэша TMDB (с путём, начинающимся с path) — совсем устаревшие, доступны только last_known."""
+        for key, entry in services._cache._data.items():
+            if key[0].startswith(path):
+                entry.expires = entry.stale_until = time.monotonic() - 1
+        responses._cache.clear()
+
+
+@override_settings(ROOT_URLCONF="api.tests.urls")
+class TMDBTestCase(TMDBMixin, SimpleTestCase):
+    """Тесты синхронных вьюх (api.tests.urls — независимо от API_ASYNC_VIEWS)."""
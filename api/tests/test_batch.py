@@ -0,0 +1,68 @@
+import threading
+import time
+
+from api import services
+from api.tests.base import TMDBTestCase, tmdb_response
+
+DETAILS = {
+    "/movie/550": {"id": 550, "title": "Бойцовский клуб"},
+    "/movie/13": {"id": 13, "title": "Форрест Гамп"},
+    "/tv/1399": {"id": 1399, "name": "Игра престолов"},
+}
+
+
+class BatchTests(TMDBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.threads = set()
+        self.upstream.side_effect = self.tmdb
+
+    def tmdb(self, url, params=None, **kwargs):
+        self.threads.add(threading.current_thread().name)
+        path = url[len(services.TMDB_BASE):]
+        if path in DETAILS:
+            return tmdb_response(200, DETAILS[path], url=path)
+        return tmdb_response(404, url=path)
+
+    def get(self, ids: str):
+        resp = self.client.get("/api/v1/movies/batch", {"ids": ids})
+        self.assertEqual(resp.status_code, 200)
+        return resp.json()
+
+    def test_items_in_request_order(self):
+        data = self.get("550,tv:1399,movie:404,abc")
+        self.assertEqual([item["id"] for item in data["results"]], ["movie:550", "tv:1399", "movie:404", "abc"])
+        self.assertEqual([item["status"] for item in data["results"]], [200, 200, 404, 400])
+        self.assertEqual(data["results"][1]["data"]["name"], "Игра престолов")
+        self.assertEqual(data["errors_count"], 2)
+        # Промахи кэша — в пуле пакетных запросов
+        self.assertTrue(all(name.startswith("batch") for name in self.threads))
+
+    def test_duplicates_fetched_once(self):
+        data = self.get("550,movie:550,550,13")
+        self.assertEqual(data["count"], 2)
+        self.assertEqual(self.upstream.call_count, 2)
+
+    def test_cached_details_served_without_tmdb(self):
+        self.get("550")
+        self.upstream.reset_mock()
+        data = self.get("550,13")
+        self.assertEqual([item["status"] for item in data["results"]], [200, 200])
+        # 550 — из кэша, к TMDB только за 13
+        self.assertEqual(self.upstream.call_count, 1)
+
+    def test_upstream_failure_per_item(self):
+        self.upstream.side_effect = lambda url, **kwargs: tmdb_response(500) if url.endswith("/13") else self.tmdb(url, **kwargs)
+        data = self.get("550,13")
+        self.assertEqual([item["status"] for item in data["results"]], [200, 503])
+
+    def test_too_many_ids(self):
+        ids = ",".join(str(i) for i in range(1, services.BATCH_MAX_IDS + 2))
+        resp = self.client.get("/api/v1/movies/batch", {"ids": ids})
+        self.assertEqual(resp.status_code, 400)
+        self.upstream.assert_not_called()
+
+    def test_batch_respects_view_budget(self):
+        resp = self.client.get("/api/v1/movies/batch", {"ids": "550"}, HTTP_X_REQUEST_START=f"t={time.time() - 100:.3f}")
+        self.assertEqual(resp.json()["results"][0]["status"], 504)
+        self.upstream.assert_not_called()
@@ -0,0 +1,89 @@
+import time
+from unittest import mock
+
+import requests
+from django.test import SimpleTestCase
+
+from api import breaker, services
+from api.breaker import CircuitBreaker
+from api.tests.base import TMDBTestCase, tmdb_response
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_opens_after_consecutive_failures(self):
+        circuit = CircuitBreaker("test", failures=3, open_seconds=30)
+        for _ in range(2):
+            circuit.failure()
+        circuit.success()
+        for _ in range(2):
+            circuit.failure()
+        self.assertTrue(circuit.allow())
+        circuit.failure()
+        self.assertFalse(circuit.allow())
+        self.assertGreater(circuit.retry_in(), 29)
+
+    def test_half_open_probe(self):
+        circuit = CircuitBreaker("test", failures=1, open_seconds=0.01, probes=1)
+        circuit.failure()
+        time.sleep(0.02)
+        self.assertTrue(circuit.allow())
+        # Второй одновременный запрос ждёт итога пробного
+        self.assertFalse(circuit.allow())
+        circuit.abandon()
+        self.assertTrue(circuit.allow())
+        circuit.failure()
+        self.assertFalse(circuit.allow())
+        time.sleep(0.02)
+        self.assertTrue(circuit.allow())
+        circuit.success()
+        self.assertEqual(circuit.state, breaker.CLOSED)
+
+    def test_backoff_delay_bounds(self):
+        for attempt in range(10):
+            delay = min(breaker.BACKOFF_MAX, breaker.BACKOFF_BASE * 2 ** attempt)
+            for _ in range(20):
+                self.assertTrue(delay / 2 <= breaker.backoff_delay(attempt) <= delay)
+
+
+class UpstreamErrorTests(TMDBTestCase):
+    def test_breaker_open_gives_503_with_retry_after(self):
+        self.upstream.return_value = tmdb_response(500)
+        # Каждый запрос — TMDB_RETRIES неудач; breaker открывается на BREAKER_FAILURES-й
+        for _ in range(breaker.BREAKER_FAILURES):
+            resp = self.client.get("/api/v1/movies/550")
+            self.assertEqual(resp.status_code, 503)
+            if resp.has_header("Retry-After"):
+                break
+        self.assertEqual(int(resp["Retry-After"]), int(breaker.BREAKER_OPEN_SECONDS))
+        # Пока breaker открыт, к TMDB не обращаемся
+        calls = self.upstream.call_count
+        resp = self.client.get("/api/v1/movies/550")
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(self.upstream.call_count, calls)
+
+    def test_retries_then_success(self):
+        self.upstream.side_effect = [tmdb_response(502), requests.exceptions.ConnectTimeout(), tmdb_response(200, {"id": 550})]
+        resp = self.client.get("/api/v1/movies/550")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.upstream.call_count, 3)
+
+    def test_not_found(self):
+        self.upstream.return_value = tmdb_response(404)
+        resp = self.client.get("/api/v1/movies/550")
+        self.assertEqual(resp.status_code, 404)
+        # 404 — не сбой TMDB: breaker закрыт, повторов нет
+        self.assertEqual(self.upstream.call_count, 1)
+        self.assertEqual(breaker.get(f"{services.TMDB_BASE}/movie/550", "/movie/").failures, 0)
+
+    def test_search_outage_gives_503(self):
+        self.upstream.side_effect = requests.exceptions.ConnectTimeout()
+        resp = self.client.get("/api/v1/movies", {"q": "клуб"})
+        self.assertEqual(resp.status_code, 503)
+
+    @mock.patch.object(breaker, "BREAKER_ENABLED", False)
+    def test_breaker_disabled(self):
+        self.upstream.return_value = tmdb_response(500)
+        for _ in range(breaker.BREAKER_FAILURES + 1):
+            resp = self.client.get("/api/v1/movies/550")
+            self.assertFalse(resp.has_header("Retry-After"))
+        self.assertEqual(self.upstream.call_count, (breaker.BREAKER_FAILURES + 1) * services.TMDB_RETRIES)
@@ -0,0 +1,70 @@
+from datetime import date
+from unittest import mock
+
+from django.test import TestCase
+
+from api import catalog, services, upstream
+from api.pagination import Cursor
+from api.tests.base import TMDBTestCase, discover_page, tmdb_response
+
+DRAMA = services.TMDB_GENRE_IDS["драма"]
+
+
+def _items(year: int, count: int = 20) -> list:
+    return [
+        {"id": year * 100 + i, "title": f"Драма {year}-{i}", "release_date": f"{year}-01-01", "popularity": count - i}
+        for i in range(count)
+    ]
+
+
+@mock.patch.object(catalog, "CATALOG_ENABLED", True)
+class CatalogTests(TestCase):
+    def test_cell_lookup(self):
+        self.assertEqual(catalog.store_cell(DRAMA, 2020, _items(2020)), 20)
+        items = catalog.lookup(DRAMA, (2020, 2020), limit=5)
+        self.assertEqual([x["id"] for x in items], [202000, 202001, 202002, 202003, 202004])
+        # Перезапись ячейки заменяет её содержимое
+        catalog.store_cell(DRAMA, 2020, _items(2020, 3))
+        self.assertEqual(len(catalog.lookup(DRAMA, (2020, 2020))), 3)
+
+    def test_year_range_needs_every_cell(self):
+        catalog.store_cell(DRAMA, 2019, _items(2019))
+        catalog.store_cell(DRAMA, 2021, _items(2021))
+        self.assertIsNone(catalog.lookup(DRAMA, (2019, 2021)))
+        catalog.store_cell(DRAMA, 2020, _items(2020))
+        self.assertEqual(len(catalog.lookup(DRAMA, (2019, 2021), limit=50)), 50)
+
+    def test_no_year_cell_is_separate(self):
+        catalog.store_cell(DRAMA, 2020, _items(2020))
+        self.assertIsNone(catalog.lookup(DRAMA, None))
+        catalog.store_cell(DRAMA, catalog.ALL_YEARS, _items(1999))
+        self.assertEqual(catalog.lookup(DRAMA, None)[0]["id"], 199900)
+
+    @mock.patch.object(upstream, "get")
+    def test_search_by_genre_first_page_from_catalog(self, get):
+        catalog.store_cell(DRAMA, 2020, _items(2020))
+        result = services.search_by_genre("Драма", "2020")
+        get.assert_not_called()
+        self.assertEqual(result["results_count"], 20)
+        self.assertEqual(result["results"][0]["name"], "Драма 2020-0")
+        self.assertEqual(result["next_cursor"], Cursor(2).encode())
+
+    def test_year_outside_range_is_not_a_catalog_cell(self):
+        catalog.store_cell(DRAMA, catalog.ALL_YEARS, _items(1999))
+        self.assertIsNone(services._catalog_items(DRAMA, "0"))
+        with self.assertRaises(ValueError):
+            services._year_bounds("0-2020")
+
+
+class YearParameterTests(TMDBTestCase):
+    def test_year_out_of_range_rejected(self):
+        for year in ("0", "1800", "0-2020", str(date.today().year + 50)):
+            resp = self.client.get("/api/v1/movies", {"genre": "драма", "year": year})
+            self.assertEqual(resp.status_code, 400, year)
+        self.upstream.assert_not_called()
+
+    def test_valid_year(self):
+        self.upstream.return_value = tmdb_response(200, discover_page(1), url="/discover/movie")
+        resp = self.client.get("/api/v1/movies", {"genre": "драма", "year": "2020"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.upstream.call_args.kwargs["params"]["primary_release_year"], "2020")
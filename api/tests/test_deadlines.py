@@ -0,0 +1,131 @@
+import asyncio
+import threading
+import time
+from unittest import mock
+
+import requests
+
+from django.test import SimpleTestCase
+
+from api import deadlines, upstream
+from api.tests.base import TMDBTestCase, tmdb_response
+
+
+class HedgedGetTests(SimpleTestCase):
+    def setUp(self):
+        self.calls = []
+        self.delays = []
+        patch = mock.patch.object(upstream, "get", self.get)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def get(self, url, **kwargs):
+        n = len(self.calls)
+        self.calls.append(threading.current_thread().name)
+        delay, result = self.delays[n]
+        time.sleep(delay)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def test_fast_primary_in_calling_thread(self):
+        resp = mock.MagicMock()
+        self.delays = [(0, resp)]
+        self.assertEqual(upstream.hedged_get("url", 0.05, timeout=1), (resp, False))
+        time.sleep(0.1)
+        # Второй запрос не отправлен
+        self.assertEqual(self.calls, [threading.current_thread().name])
+
+    def test_hedge_replaces_failed_primary(self):
+        second = mock.MagicMock()
+        self.delays = [(0.2, requests.exceptions.ReadTimeout()), (0, second)]
+        resp, won = upstream.hedged_get("url", 0.05, lambda: True, timeout=1)
+        self.assertEqual((resp, won), (second, True))
+        self.assertTrue(self.calls[1].startswith("hedge"))
+
+    def test_late_hedge_response_is_closed(self):
+        first, second = mock.MagicMock(), mock.MagicMock()
+        self.delays = [(0.1, first), (0.1, second)]
+        self.assertEqual(upstream.hedged_get("url", 0.05, timeout=1), (first, False))
+        deadline = time.monotonic() + 5
+        while not second.close.called and time.monotonic() < deadline:
+            time.sleep(0.01)
+        second.close.assert_called_once()
+
+    def test_hedge_not_allowed(self):
+        self.delays = [(0.1, requests.exceptions.ConnectionError())]
+        allow_hedge = mock.MagicMock(return_value=False)
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            upstream.hedged_get("url", 0.02, allow_hedge, timeout=1)
+        allow_hedge.assert_called_once()
+        self.assertEqual(len(self.calls), 1)
+
+    def test_both_failed_raise_primary_error(self):
+        self.delays = [(0.1, requests.exceptions.ReadTimeout()), (0, requests.exceptions.ConnectionError())]
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            upstream.hedged_get("url", 0.02, timeout=1)
+
+
+class AsyncHedgedGetTests(SimpleTestCase):
+    def test_losers_are_closed(self):
+        responses = []
+
+        async def aget(url, **kwargs):
+            resp = mock.AsyncMock()
+            responses.append(resp)
+            # Первый отвечает сразу за вторым: оба готовы к одному раунду ожидания
+            if len(responses) == 1:
+                await released.wait()
+            else:
+                released.set()
+            return resp
+
+        async def main():
+            nonlocal released
+            released = asyncio.Event()
+            with mock.patch.object(upstream, "aget", aget):
+                return await upstream.ahedged_get("url", 0.01)
+
+        released = None
+        resp, _ = asyncio.run(main())
+        self.assertEqual(len(responses), 2)
+        loser = responses[0] if resp is responses[1] else responses[1]
+        loser.aclose.assert_awaited_once()
+        resp.aclose.assert_not_awaited()
+
+    def test_pending_loser_is_cancelled(self):
+        calls = []
+        cancelled = []
+
+        async def aget(url, **kwargs):
+            calls.append(url)
+            n = len(calls)
+            try:
+                await asyncio.sleep(1 if n == 1 else 0)
+            except asyncio.CancelledError:
+                cancelled.append(n)
+                raise
+            return mock.AsyncMock()
+
+        async def main():
+            with mock.patch.object(upstream, "aget", aget):
+                return await upstream.ahedged_get("url", 0.01)
+
+        self.assertTrue(asyncio.run(main())[1])
+        # Первый запрос не ответил и отменён
+        self.assertEqual(cancelled, [1])
+
+
+class BudgetTests(TMDBTestCase):
+    def test_exhausted_budget_gives_504(self):
+        # Запрос простоял в очереди nginx дольше бюджета вьюхи
+        resp = self.client.get("/api/v1/movies/550", HTTP_X_REQUEST_START=f"t={time.time() - 100:.3f}")
+        self.assertEqual(resp.status_code, 504)
+        self.upstream.assert_not_called()
+
+    def test_hedged_request_in_view(self):
+        self.upstream.return_value = tmdb_response(200, {"id": 550, "title": "Бойцовский клуб"})
+        with mock.patch.object(deadlines, "hedge_after", return_value=0.01):
+            resp = self.client.get("/api/v1/movies/550")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.upstream.call_count, 1)
@@ -0,0 +1,58 @@
+import os
+from unittest import mock
+
+from api import responses, services
+from api.tests.base import MOVIE, TMDBTestCase, tmdb_response
+
+
+class StaleFallbackTests(TMDBTestCase):
+    def test_last_known_served_when_tmdb_fails(self):
+        self.upstream.return_value = tmdb_response(200, MOVIE)
+        resp = self.client.get("/api/v1/movies/550")
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("public", resp["Cache-Control"])
+
+        self.expire_tmdb_cache()
+        self.upstream.return_value = tmdb_response(503)
+        resp = self.client.get("/api/v1/movies/550")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["title"], MOVIE["title"])
+        # Устаревшие данные не кэшируются ни у нас, ни у клиента
+        self.assertEqual(resp["Cache-Control"], responses.UNCACHEABLE_CACHE_CONTROL)
+        self.assertFalse(resp.has_header("ETag"))
+        self.assertEqual(responses._cache.stats()["size"], 0)
+
+    def test_client_errors_are_not_masked(self):
+        self.upstream.return_value = tmdb_response(200, MOVIE)
+        self.client.get("/api/v1/movies/550")
+        self.expire_tmdb_cache()
+        # 401 (неверный ключ) — ошибка запроса, а не сбой TMDB: устаревший ответ не подставляется
+        self.upstream.return_value = tmdb_response(401)
+        self.assertEqual(self.client.get("/api/v1/movies/550").status_code, 502)
+
+    @mock.patch.dict(os.environ, {"TMDB_API_KEY": "test"})
+    def test_home_with_stale_block_is_not_cached(self):
+        # Блоки главной собираются в пуле потоков — отметка об устаревшем блоке должна дойти до вьюхи
+        self.upstream.return_value = tmdb_response(200, {"results": [MOVIE]}, url="/trending/all/day")
+        self.assertEqual(self.client.get("/api/home").status_code, 200)
+        self.expire_tmdb_cache("/trending/")
+        self.upstream.return_value = tmdb_response(503)
+        resp = self.client.get("/api/home")
+        self.assertEqual(resp.json()["popular_now"]["results"][0]["id"], 550)
+        self.assertEqual(resp["Cache-Control"], responses.UNCACHEABLE_CACHE_CONTROL)
+
+    def test_fresh_response_is_cached(self):
+        self.upstream.return_value = tmdb_response(200, MOVIE)
+        first = self.client.get("/api/v1/movies/550")
+        second = self.client.get("/api/v1/movies/550", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(self.upstream.call_count, 1)
+
+    def test_tracking_fallbacks(self):
+        with services.tracking_fallbacks() as outer:
+            services._note_fallback("a")
+            with services.tracking_fallbacks() as inner:
+                services._note_fallback("b")
+        self.assertEqual((outer, inner), (["a"], ["b"]))
+        # Вне блока отметки никуда не пишутся
+        services._note_fallback("c")
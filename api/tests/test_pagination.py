@@ -0,0 +1,116 @@
+import json
+import time
+
+from django.test import SimpleTestCase
+
+from api import responses
+from api.pagination import PAGINATION_PREFETCH, Cursor, row_ref
+from api.tests.base import TMDBTestCase, discover_page, tmdb_response
+
+
+class CursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        cursor = Cursor.decode(Cursor(3, 5, ["movie:550", "tv:1399"]).encode())
+        self.assertEqual((cursor.page, cursor.skip, cursor.exclude), (3, 5, ("movie:550", "tv:1399")))
+
+    def test_legacy_int_exclude(self):
+        token = Cursor(1, 0, [550]).encode()
+        self.assertEqual(Cursor.decode(token).exclude, (550,))
+
+    def test_invalid(self):
+        for token in ("", "garbage", Cursor(0).encode(), Cursor(501).encode(), Cursor(1, -1).encode()):
+            with self.assertRaises(ValueError, msg=token):
+                Cursor.decode(token)
+
+    def test_row_ref(self):
+        self.assertEqual(row_ref({"id": 1399, "media_type": "tv"}), "tv:1399")
+        self.assertEqual(row_ref({"id": 550}), "movie:550")
+
+
+class GenrePagesTests(TMDBTestCase):
+    total_pages = 5
+
+    def setUp(self):
+        super().setUp()
+        self.failing_pages = set()
+        self.upstream.side_effect = self.tmdb
+
+    def tmdb(self, url, params=None, **kwargs):
+        page = int(params["page"])
+        if page in self.failing_pages:
+            return tmdb_response(503, url="/discover/movie")
+        return tmdb_response(200, discover_page(page, self.total_pages), url="/discover/movie")
+
+    def requested_pages(self) -> list:
+        return sorted(call.kwargs["params"]["page"] for call in self.upstream.call_args_list)
+
+    def get(self, **params):
+        return self.client.get("/api/v1/movies", {"genre": "драма", **params})
+
+    def test_cursor_walks_all_pages(self):
+        seen = []
+        params = {"limit": "30"}
+        while True:
+            data = self.get(**params).json()
+            seen.extend(row["id"] for row in data["results"])
+            if not data["next_cursor"]:
+                break
+            params["cursor"] = data["next_cursor"]
+        self.assertEqual(seen, [page * 100 + i for page in range(1, self.total_pages + 1) for i in range(20)])
+
+    def test_first_page_without_prefetch(self):
+        self.get()
+        self.assertEqual(self.requested_pages(), [1])
+
+    def test_cursor_prefetches_next_pages(self):
+        self.get(cursor=Cursor(2).encode())
+        expected = list(range(2, 2 + PAGINATION_PREFETCH + 1))
+        deadline = time.monotonic() + 5
+        while self.requested_pages() != expected and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.requested_pages(), expected)
+        # Следующая страница уже в кэше
+        self.get(cursor=Cursor(3).encode())
+        self.assertEqual(self.requested_pages().count(3), 1)
+
+    def test_stale_prefetched_page_is_not_cached(self):
+        self.get(cursor=Cursor(2).encode(), limit="40")
+        self.expire_tmdb_cache("/discover/")
+        # Страница 3 приходит из предзагрузки, TMDB за ней недоступен — отдаётся last_known
+        self.failing_pages = {3}
+        resp = self.get(cursor=Cursor(2).encode(), limit="40")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.json()["results"]), 40)
+        self.assertEqual(resp["Cache-Control"], responses.UNCACHEABLE_CACHE_CONTROL)
+        self.assertFalse(resp.has_header("ETag"))
+
+    def test_ndjson_stream(self):
+        resp = self.get(format="ndjson", limit="50")
+        self.assertEqual(resp["Content-Type"], "application/x-ndjson")
+        lines = [json.loads(line) for line in b"".join(resp.streaming_content).splitlines()]
+        self.assertEqual([row["id"] for row in lines[:-1]], [page * 100 + i for page in (1, 2, 3) for i in range(20)][:50])
+        cursor = Cursor.decode(lines[-1]["next_cursor"])
+        self.assertEqual((cursor.page, cursor.skip), (3, 10))
+
+    def test_ndjson_error_after_first_row(self):
+        self.failing_pages = {2}
+        resp = self.get(format="ndjson", limit="40")
+        lines = [json.loads(line) for line in b"".join(resp.streaming_content).splitlines()]
+        self.assertEqual(len(lines), 21)
+        self.assertIn("detail", lines[-1])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.get(cursor="garbage").status_code, 400)
+
+
+class SearchExcludeTests(TMDBTestCase):
+    def test_rows_from_cursor_exclude_are_skipped(self):
+        results = [
+            {"id": 550, "media_type": "movie", "title": "Фильм"},
+            {"id": 550, "media_type": "tv", "name": "Сериал с тем же id"},
+            {"id": 1, "media_type": "person", "name": "Персона"},
+        ]
+        self.upstream.return_value = tmdb_response(200, {"total_pages": 1, "results": results}, url="/search/multi")
+        cursor = Cursor(1, 0, ["movie:550"]).encode()
+        data = self.client.get("/api/v1/movies", {"q": "фильм", "cursor": cursor}).json()
+        self.assertEqual([(row["media_type"], row["id"]) for row in data["results"]], [("tv", 550)])
@@ -0,0 +1,122 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from api import posters
+from api.posters import AsyncPosterStream, PosterCache, PosterStream
+
+IMAGE = os.urandom(200 * 1024)
+URL = "https://image.tmdb.org/t/p/w500/poster.jpg"
+
+
+class _Response:
+    """Потоковый ответ источника (requests) из готовых байт."""
+
+    def __init__(self, content: bytes, headers: dict | None = None):
+        self.content = content
+        self.headers = {"Content-Type": "image/jpeg", "Content-Length": str(len(content)), **(headers or {})}
+        self.closed = False
+
+    def iter_content(self, size):
+        for i in range(0, len(self.content), size):
+            yield self.content[i : i + size]
+
+    def close(self):
+        self.closed = True
+
+
+class _AsyncResponse(_Response):
+    """То же для httpx."""
+
+    @property
+    def is_closed(self):
+        return self.closed
+
+    async def aiter_bytes(self, size):
+        for chunk in self.iter_content(size):
+            yield chunk
+
+    async def aclose(self):
+        self.closed = True
+
+
+class PosterCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = PosterCache(directory.name, max_bytes=1024 * 1024)
+        patch = mock.patch.object(posters, "poster_cache", self.cache)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def flush_disk(self):
+        """Дождаться потока записи AsyncPosterStream."""
+        posters._get_disk_executor().submit(lambda: None).result(5)
+
+
+class PosterCacheTests(PosterCacheTestCase):
+    def test_store_and_lookup(self):
+        stored = self.cache.store(URL, IMAGE, "image/jpeg", last_modified=1000.0)
+        entry = self.cache.lookup(URL)
+        self.assertEqual(entry.sha256, hashlib.sha256(IMAGE).hexdigest())
+        self.assertEqual(entry.etag, stored.etag)
+        self.assertEqual(entry.size, len(IMAGE))
+        self.assertEqual(entry.last_modified, 1000.0)
+        self.assertEqual(entry.path.read_bytes(), IMAGE)
+        self.assertIsNone(self.cache.lookup(URL + "?other"))
+
+    def test_evict_least_recently_read(self):
+        urls = [f"{URL}?n={i}" for i in range(6)]
+        for i, url in enumerate(urls):
+            entry = self.cache.store(url, os.urandom(200 * 1024), "image/jpeg")
+            # Чем меньше i, тем давнее читали
+            os.utime(entry.path, (time.time() - 1000 + i, time.time() - 1000 + i))
+        self.assertGreater(self.cache.evict(), 0)
+        self.assertLessEqual(self.cache.stats()["bytes"], self.cache.max_bytes)
+        self.assertIsNone(self.cache.lookup(urls[0]))
+        self.assertIsNotNone(self.cache.lookup(urls[-1]))
+        # Индекс вытесненной картинки удалён вместе с ней
+        self.assertFalse(self.cache._index_path(urls[0]).exists())
+
+
+class PosterStreamTests(PosterCacheTestCase):
+    def test_streamed_poster_is_cached(self):
+        resp = _Response(IMAGE)
+        stream = PosterStream(resp, URL, time.monotonic() + 10, None)
+        self.assertEqual(b"".join(stream), IMAGE)
+        self.assertTrue(resp.closed)
+        self.assertEqual(self.cache.lookup(URL).path.read_bytes(), IMAGE)
+
+    def test_interrupted_stream_is_not_cached(self):
+        stream = PosterStream(_Response(IMAGE), URL, time.monotonic() + 10, None)
+        chunks = iter(stream)
+        next(chunks)
+        # Клиент ушёл после первого куска — Django закрывает тело
+        stream.close()
+        self.assertIsNone(self.cache.lookup(URL))
+        self.assertEqual(list((self.cache.root / "blobs").glob("*")), [])
+
+    def test_async_stream_writes_off_event_loop(self):
+        threads = set()
+        write = posters.PosterWriter.write
+
+        def recording_write(writer, chunk):
+            threads.add(threading.current_thread().name)
+            return write(writer, chunk)
+
+        async def main():
+            stream = AsyncPosterStream(_AsyncResponse(IMAGE), URL, time.monotonic() + 10)
+            return b"".join([chunk async for chunk in stream])
+
+        with mock.patch.object(posters.PosterWriter, "write", recording_write):
+            self.assertEqual(asyncio.run(main()), IMAGE)
+            self.flush_disk()
+        self.assertTrue(threads)
+        self.assertTrue(all(name.startswith("poster-cache") for name in threads))
+        self.assertEqual(self.cache.lookup(URL).path.read_bytes(), IMAGE)
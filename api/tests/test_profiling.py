@@ -0,0 +1,59 @@
+import asyncio
+import tempfile
+import threading
+from pathlib import Path
+from unittest import mock
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+
+from api import profiling
+
+
+class ProfilingTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        for patch in (
+            mock.patch.object(profiling, "PROFILE_ENABLED", True),
+            mock.patch.object(profiling, "PROFILE_TOKEN", "secret"),
+            mock.patch.object(profiling, "PROFILE_DIR", self.directory),
+            mock.patch.object(profiling, "PROFILE_MAX_FILES", 3),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.request = RequestFactory().get("/api/v1/movies/550", HTTP_X_PROFILE="secret")
+
+    def test_rotation_keeps_newest(self):
+        middleware = profiling.profiling_middleware(lambda request: HttpResponse(b"{}"))
+        ids = [middleware(self.request)["X-Profile-Id"] for _ in range(12)]
+        self.assertEqual([meta["id"] for meta in profiling.load(self.directory)], ids[-3:])
+        self.assertEqual(len(list(self.directory.glob("*.prof"))), 3)
+
+    def test_request_without_token_not_profiled(self):
+        middleware = profiling.profiling_middleware(lambda request: HttpResponse(b"{}"))
+        resp = middleware(RequestFactory().get("/", HTTP_X_PROFILE="wrong"))
+        self.assertFalse(resp.has_header("X-Profile-Id"))
+        self.assertEqual(list(self.directory.iterdir()), [])
+
+    def test_async_writes_off_event_loop(self):
+        threads = []
+        write = profiling._write
+
+        def record(*args):
+            threads.append(threading.current_thread())
+            write(*args)
+
+        async def get_response(request):
+            return HttpResponse(b"{}")
+
+        async def main():
+            return await profiling.profiling_middleware(get_response)(self.request), threading.current_thread()
+
+        with mock.patch.object(profiling, "_write", record):
+            resp, loop_thread = asyncio.run(main())
+        self.assertTrue(resp.has_header("Server-Timing"))
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], loop_thread)
+        self.assertEqual(len(profiling.load(self.directory)), 1)
@@ -0,0 +1,57 @@
+from django.test import SimpleTestCase
+
+from api import services
+from api.tests.base import TMDBTestCase, tmdb_response
+
+MOVIE = {
+    "id": 550,
+    "title": "Бойцовский клуб",
+    "runtime": 139,
+    "poster_path": "/p.jpg",
+    "credits": {"cast": [{"name": "Эдвард Нортон"}], "crew": [{"name": "Дэвид Финчер"}]},
+    "videos": {"results": []},
+}
+
+
+class ProjectTests(SimpleTestCase):
+    def test_nested_fields(self):
+        out = services._project(MOVIE, ["id", "credits.cast", "missing", "credits.missing"])
+        self.assertEqual(out, {"id": 550, "credits": {"cast": MOVIE["credits"]["cast"]}})
+
+    def test_parent_field_wins(self):
+        out = services._project(MOVIE, ["credits.cast", "credits"])
+        self.assertIs(out["credits"], MOVIE["credits"])
+
+    def test_no_fields(self):
+        self.assertIs(services._project(MOVIE, None), MOVIE)
+
+
+class DetailProjectionTests(TMDBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.upstream.return_value = tmdb_response(200, MOVIE)
+
+    def test_include_is_one_request(self):
+        resp = self.client.get("/api/v1/movies/550", {"include": "videos,credits", "fields": "id,title,credits.crew"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json(), {"id": 550, "title": "Бойцовский клуб", "credits": {"crew": [{"name": "Дэвид Финчер"}]}})
+        self.assertEqual(self.upstream.call_args.kwargs["params"]["append_to_response"], "credits,videos")
+        # Тот же набор include в другом порядке и другие fields — та же запись кэша TMDB
+        resp = self.client.get("/api/v1/movies/550", {"include": "credits,videos", "fields": "runtime"})
+        self.assertEqual(resp.json(), {"runtime": 139})
+        self.assertEqual(self.upstream.call_count, 1)
+
+    def test_unknown_include(self):
+        resp = self.client.get("/api/v1/movies/550", {"include": "credits,secrets"})
+        self.assertEqual(resp.status_code, 400)
+        self.upstream.assert_not_called()
+
+    def test_watch_fields(self):
+        resp = self.client.get("/api/v1/movies/550/watch", {"fields": "id,view_link"})
+        self.assertEqual(resp.json(), {"id": 550, "view_link": f"{services.FILMS_STORAGE_BASE}550"})
+
+    def test_projection_does_not_touch_cached_data(self):
+        self.client.get("/api/v1/movies/550", {"fields": "credits.cast"})
+        resp = self.client.get("/api/v1/movies/550")
+        self.assertEqual(resp.json()["credits"], MOVIE["credits"])
+        self.assertEqual(resp.json()["poster_url"], services._poster_url("/p.jpg"))
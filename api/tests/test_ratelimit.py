@@ -0,0 +1,105 @@
+import asyncio
+import fcntl
+import os
+import tempfile
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+from django.utils.http import http_date
+
+from api import ratelimit
+from api.ratelimit import RateLimited
+from api.tests.base import TMDBTestCase, tmdb_response
+
+
+class RateLimitTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.state_file = os.path.join(directory.name, "ratelimit.bin")
+        # Ведро на 4 запроса почти без пополнения: фоновой полосе остаётся 3
+        for patch in (
+            mock.patch.object(ratelimit, "RATE_LIMIT_ENABLED", True),
+            mock.patch.object(ratelimit, "RATE_LIMIT_FILE", self.state_file),
+            mock.patch.object(ratelimit, "RATE_LIMIT_BURST", 4.0),
+            mock.patch.object(ratelimit, "RATE_LIMIT_RPS", 0.001),
+            mock.patch.object(ratelimit, "RATE_LIMIT_RESERVE", 0.25),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.forget_state_file()
+        self.addCleanup(self.forget_state_file)
+
+    def forget_state_file(self):
+        if ratelimit._fd is not None and ratelimit._fd_pid == os.getpid():
+            os.close(ratelimit._fd)
+        ratelimit._reset_after_fork()
+
+    def take_all(self) -> int:
+        taken = 0
+        while ratelimit.try_acquire():
+            taken += 1
+        return taken
+
+    def hold_state(self):
+        """Состояние ведра занято другим воркером."""
+        fd = os.open(self.state_file, os.O_RDWR | os.O_CREAT)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        self.addCleanup(os.close, fd)
+
+    def test_background_lane_leaves_reserve(self):
+        with ratelimit.lane(ratelimit.BACKGROUND):
+            self.assertEqual(self.take_all(), 3)
+        self.assertEqual(self.take_all(), 1)
+
+    def test_acquire_timeout(self):
+        self.take_all()
+        with self.assertRaises(RateLimited) as raised:
+            ratelimit.acquire(timeout=0.5)
+        self.assertGreater(raised.exception.wait, 0.5)
+
+    def test_background_helper(self):
+        self.assertEqual(ratelimit.background(ratelimit._lane.get), ratelimit.BACKGROUND)
+        self.assertEqual(ratelimit._lane.get(), ratelimit.USER)
+
+    def test_throttled_blocks_everyone(self):
+        self.assertEqual(ratelimit.throttled("2"), 2)
+        self.assertFalse(ratelimit.try_acquire())
+        with self.assertRaises(RateLimited) as raised:
+            ratelimit.acquire(timeout=0.1)
+        self.assertGreater(raised.exception.wait, 1.5)
+        self.assertEqual(ratelimit.stats()["rate_factor"], 0.5)
+
+    def test_throttled_http_date(self):
+        self.assertGreater(ratelimit.throttled(http_date(time.time() + 60)), 50)
+        self.assertEqual(ratelimit.throttled(None), 1)
+
+    def test_async_paths_do_not_wait_for_flock(self):
+        self.hold_state()
+
+        async def main():
+            started = time.monotonic()
+            self.assertFalse(ratelimit.try_acquire(blocking=False))
+            with self.assertRaises(RateLimited):
+                await ratelimit.aacquire(timeout=0.05)
+            throttled = asyncio.ensure_future(ratelimit.athrottled("3"))
+            # event loop не заблокирован: задача ждёт flock через asyncio.sleep
+            await asyncio.sleep(0.05)
+            self.assertFalse(throttled.done())
+            throttled.cancel()
+            return time.monotonic() - started
+
+        self.assertLess(asyncio.run(main()), 1)
+
+    def test_athrottled(self):
+        self.assertEqual(asyncio.run(ratelimit.athrottled("2")), 2)
+        self.assertFalse(ratelimit.try_acquire(blocking=False))
+
+
+class TMDBRateLimitTests(TMDBTestCase):
+    def test_tmdb_429_gives_503_with_its_retry_after(self):
+        self.upstream.return_value = tmdb_response(429, headers={"Retry-After": "7"})
+        resp = self.client.get("/api/v1/movies/550")
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(resp["Retry-After"], "7")
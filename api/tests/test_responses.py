@@ -0,0 +1,125 @@
+import asyncio
+import gzip
+import threading
+from unittest import mock
+
+import brotli
+from django.test import RequestFactory, SimpleTestCase
+
+from api import async_views, responses
+from api.cache import TTLCache
+from api.responses import CachedResponse
+from api.tests.base import MOVIE, TMDBTestCase, tmdb_response
+
+BODY = b'{"results": [' + b",".join(b'{"id": %d, "name": "Film %d"}' % (i, i) for i in range(100)) + b"]}"
+
+
+class ResponseTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.entry = CachedResponse(BODY)
+
+    def get(self, **headers):
+        return responses.response(self.factory.get("/", **headers), "detail", self.entry)
+
+    def test_etag_and_cache_control(self):
+        resp = self.get()
+        self.assertEqual(resp.content, BODY)
+        self.assertEqual(resp["ETag"], self.entry.etag)
+        self.assertEqual(resp["Cache-Control"], responses.RESPONSE_CACHE_CONTROL["detail"])
+
+    def test_not_modified(self):
+        resp = self.get(HTTP_IF_NONE_MATCH=self.entry.etag)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp["ETag"], self.entry.etag)
+        self.assertEqual(resp.content, b"")
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_uncacheable(self):
+        resp = responses.response(self.factory.get("/"), "detail", self.entry, cacheable=False)
+        self.assertEqual(resp["Cache-Control"], responses.UNCACHEABLE_CACHE_CONTROL)
+        self.assertFalse(resp.has_header("ETag"))
+
+
+class VariantTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.entry = CachedResponse(BODY, compress=True)
+
+    def get(self, **headers):
+        return responses.response(self.factory.get("/", **headers), "detail", self.entry)
+
+    def test_variant_by_accept_encoding(self):
+        resp = self.get(HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(resp["Content-Encoding"], "br")
+        self.assertEqual(resp["ETag"], self.entry.encoded["br"][1])
+        self.assertEqual(brotli.decompress(resp.content), BODY)
+        self.assertIn("Accept-Encoding", resp["Vary"])
+
+        resp = self.get(HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(resp["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(resp.content), BODY)
+
+    def test_identity_without_accept_encoding(self):
+        resp = self.get()
+        self.assertFalse(resp.has_header("Content-Encoding"))
+        self.assertEqual(resp["ETag"], self.entry.etag)
+        self.assertEqual(resp.content, BODY)
+
+    def test_refused_coding_not_overridden_by_star(self):
+        resp = self.get(HTTP_ACCEPT_ENCODING="br;q=0, *")
+        self.assertEqual(resp["Content-Encoding"], "gzip")
+        resp = self.get(HTTP_ACCEPT_ENCODING="*;q=0, identity")
+        self.assertFalse(resp.has_header("Content-Encoding"))
+
+    def test_not_modified_per_variant(self):
+        etag = self.get(HTTP_ACCEPT_ENCODING="br")["ETag"]
+        self.assertEqual(self.get(HTTP_ACCEPT_ENCODING="br", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # ETag другого варианта — не совпадение
+        self.assertEqual(self.get(HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_small_body_not_compressed(self):
+        self.assertEqual(CachedResponse(b'{"id": 550}', compress=True).encoded, {})
+
+
+class StoreTests(SimpleTestCase):
+    def setUp(self):
+        patch = mock.patch.object(responses, "_cache", TTLCache(maxsize=8, name="responses_test"))
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_search_compressed_on_fast_levels(self):
+        with mock.patch.object(responses, "_compress", wraps=responses._compress) as compress:
+            responses.store("search", ("клуб",), {"results": []})
+            responses.store("detail", (550,), {"id": 550})
+        self.assertEqual([call.args[2] for call in compress.call_args_list], [True, False])
+
+    def test_compression_off_event_loop(self):
+        threads = []
+        store = responses.store
+
+        def record(*args):
+            threads.append(threading.current_thread())
+            return store(*args)
+
+        async def build():
+            return {"results": [{"id": i} for i in range(100)]}, True
+
+        async def main():
+            return await async_views._cached_json(RequestFactory().get("/"), "genres", (), build)
+
+        with mock.patch.object(responses, "store", record):
+            resp = asyncio.run(main())
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
+
+
+class ConditionalViewTests(TMDBTestCase):
+    def test_not_modified_without_tmdb(self):
+        self.upstream.return_value = tmdb_response(200, MOVIE)
+        etag = self.client.get("/api/v1/movies/550")["ETag"]
+        self.upstream.reset_mock()
+        resp = self.client.get("/api/v1/movies/550", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+        self.upstream.assert_not_called()
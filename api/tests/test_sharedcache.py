@@ -0,0 +1,102 @@
+import importlib
+import os
+import sqlite3
+import tempfile
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from api import sharedcache
+from api.cache import TTLCache
+from api.sharedcache import SharedCache
+
+# Схема — из тех же миграций, что создают таблицы в db.sqlite3
+MIGRATIONS = ("api.migrations.0003_shared_cache", "api.migrations.0004_shared_cache_size")
+
+
+class SharedCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "shared.sqlite3")
+        with sqlite3.connect(self.path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            for module in MIGRATIONS:
+                migration = importlib.import_module(module)
+                for sql in getattr(migration, "SHARED_CACHE_SQL", ()) + getattr(migration, "SHARED_CACHE_SIZE_SQL", ()):
+                    conn.execute(sql)
+        conn.close()
+
+    def cache(self, name: str = "test", max_bytes: int = sharedcache.SHARED_CACHE_MAX_BYTES) -> SharedCache:
+        with mock.patch.object(sharedcache, "_database_path", return_value=self.path):
+            return SharedCache(name, max_bytes)
+
+    def table_size(self, cache: SharedCache) -> int:
+        return cache._connection().execute("SELECT COALESCE(SUM(size), 0) FROM api_shared_cache").fetchone()[0]
+
+    def test_set_get(self):
+        cache = self.cache()
+        now = time.time()
+        value = {"results": [{"id": i, "title": "Фильм"} for i in range(100)]}
+        cache.set(("/movie/popular", 1), value, now + 60, now + 120)
+        self.assertEqual(cache.get(("/movie/popular", 1)), (value, now + 60, now + 120))
+        self.assertIsNone(cache.get(("/movie/popular", 2)))
+        # Другой процесс (своё соединение) видит ту же запись
+        self.assertEqual(self.cache().get(("/movie/popular", 1))[0], value)
+        self.assertIsNone(self.cache("other").get(("/movie/popular", 1)))
+
+    def test_out_of_stale_window_only_on_request(self):
+        cache = self.cache()
+        now = time.time()
+        cache.set(("k",), [1], now - 20, now - 10)
+        self.assertIsNone(cache.get(("k",)))
+        self.assertEqual(cache.get(("k",), expired=True)[0], [1])
+
+    def test_size_table_follows_writes(self):
+        cache = self.cache()
+        now = time.time()
+        for i in range(5):
+            cache.set(("k", i), {"i": i}, now + 60, now + 120)
+        cache.set(("k", 0), {"i": "x" * 5000}, now + 60, now + 120)
+        cache.delete(("k", 1))
+        conn = cache._connection()
+        self.assertEqual(cache._size(conn), self.table_size(cache))
+        cache.clear()
+        self.assertEqual(cache._size(conn), 0)
+
+    def test_evicts_oldest_stale_until(self):
+        cache = self.cache(max_bytes=2000)
+        now = time.time()
+        for i in range(20):
+            cache.set(("k", i), {"value": "x" * 200}, now + i, now + i)
+        cache._evict()
+        conn = cache._connection()
+        self.assertLessEqual(cache._size(conn), 2000 * 0.9)
+        self.assertEqual(cache._size(conn), self.table_size(cache))
+        self.assertIsNone(cache.get(("k", 0), expired=True))
+        self.assertIsNotNone(cache.get(("k", 19), expired=True))
+        self.assertGreater(cache.stats()["evictions"], 0)
+
+    def test_missing_table_is_a_miss(self):
+        with mock.patch.object(sharedcache, "_database_path", return_value=os.path.join(os.path.dirname(self.path), "empty")):
+            cache = SharedCache("test")
+        cache.set(("k",), [1], time.time() + 60, time.time() + 60)
+        self.assertIsNone(cache.get(("k",)))
+        self.assertEqual(cache.stats()["errors"], 2)
+
+    def test_ttl_cache_reads_other_workers_entries(self):
+        writer = TTLCache(maxsize=8, name="tmdb_test", shared=self.cache("tmdb"))
+        reader = TTLCache(maxsize=8, name="tmdb_test", shared=self.cache("tmdb"))
+        writer.set(("/movie/550",), {"id": 550}, 60)
+        self.assertEqual(reader.get(("/movie/550",)), ({"id": 550}, "fresh"))
+        self.assertEqual(reader.get(("/movie/13",)), (None, None))
+        self.assertEqual(TTLCache(maxsize=8, shared=self.cache("tmdb")).get(("/movie/550",), shared=False), (None, None))
+
+    def test_fresher_shared_entry_replaces_local(self):
+        writer = TTLCache(maxsize=8, name="tmdb_test", shared=self.cache("tmdb"))
+        reader = TTLCache(maxsize=8, name="tmdb_test", shared=self.cache("tmdb"))
+        reader.set(("/movie/550",), {"id": 550, "title": "старое"}, 0.01, 60)
+        time.sleep(0.02)
+        writer.set(("/movie/550",), {"id": 550, "title": "новое"}, 60)
+        self.assertEqual(reader.get(("/movie/550",)), ({"id": 550, "title": "новое"}, "fresh"))
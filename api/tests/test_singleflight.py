@@ -0,0 +1,191 @@
+import asyncio
+import fcntl
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.test import SimpleTestCase
+
+from api import deadlines
+from api.deadlines import DeadlineExceeded
+from api.singleflight import SingleFlight, _FileLease
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight("")
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def fn():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return {"value": 42}
+
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            leader = pool.submit(flight.do, "key", fn)
+            started.wait(5)
+            followers = [pool.submit(flight.do, "key", fn) for _ in range(4)]
+            # Ждём, пока все ведомые встанут в очередь за ведущим
+            while flight.stats()["followers"] < 4:
+                time.sleep(0.005)
+            release.set()
+            results = [leader.result(5)] + [f.result(5) for f in followers]
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"value": 42}] * 5)
+
+    def test_error_is_shared(self):
+        flight = SingleFlight("")
+        started = threading.Event()
+        release = threading.Event()
+
+        def fn():
+            started.set()
+            release.wait(5)
+            raise ValueError("boom")
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leader = pool.submit(flight.do, "key", fn)
+            started.wait(5)
+            follower = pool.submit(flight.do, "key", fn)
+            while flight.stats()["followers"] < 1:
+                time.sleep(0.005)
+            release.set()
+            for future in (leader, follower):
+                with self.assertRaises(ValueError):
+                    future.result(5)
+
+    def test_follower_waits_no_longer_than_its_budget(self):
+        flight = SingleFlight("")
+        started = threading.Event()
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def fn():
+            started.set()
+            release.wait(5)
+            return 1
+
+        def follower():
+            token = deadlines._deadline.set(time.monotonic() + 0.05)
+            try:
+                return flight.do("key", fn)
+            finally:
+                deadlines._deadline.reset(token)
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            # Ведущий без бюджета (как прогрев), ведомый — с бюджетом запроса
+            leader = pool.submit(flight.do, "key", fn)
+            started.wait(5)
+            waiting = pool.submit(follower)
+            with self.assertRaises(DeadlineExceeded):
+                waiting.result(2)
+            release.set()
+            self.assertEqual(leader.result(5), 1)
+
+    def test_async_follower_waits_no_longer_than_its_budget(self):
+        flight = SingleFlight("")
+
+        async def fetch():
+            await asyncio.sleep(0.5)
+            return 1
+
+        async def follower():
+            token = deadlines._deadline.set(time.monotonic() + 0.05)
+            try:
+                return await flight.ado("key", fetch)
+            finally:
+                deadlines._deadline.reset(token)
+
+        async def main():
+            leader = asyncio.create_task(flight.ado("key", fetch))
+            await asyncio.sleep(0)
+            with self.assertRaises(DeadlineExceeded):
+                await follower()
+            # Общий запрос не отменён
+            return await leader
+
+        self.assertEqual(asyncio.run(main()), 1)
+
+    def test_lease_wait_is_bounded(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        other = _FileLease(directory.name, "key")
+        other.acquire()
+        self.addCleanup(other.release)
+        lease = _FileLease(directory.name, "key")
+        started = time.monotonic()
+        with self.assertRaises(DeadlineExceeded):
+            lease.acquire(0.05)
+        self.assertLess(time.monotonic() - started, 1)
+        other.release()
+        lease.acquire(0.05)
+        lease.release()
+
+    def test_async_calls_share_one_execution(self):
+        flight = SingleFlight("")
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return 7
+
+        async def main():
+            return await asyncio.gather(*(flight.ado("key", fetch) for _ in range(5)))
+
+        self.assertEqual(asyncio.run(main()), [7] * 5)
+        self.assertEqual(len(calls), 1)
+
+    def test_follower_survives_cancelled_leader(self):
+        flight = SingleFlight("")
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return len(calls)
+
+        async def main():
+            leader = asyncio.create_task(flight.ado("key", fetch))
+            await asyncio.sleep(0)
+            follower = asyncio.create_task(flight.ado("key", fetch))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            return await follower
+
+        # Ведомый не получает CancelledError, а выполняет запрос сам
+        self.assertEqual(asyncio.run(main()), 2)
+
+    def test_cancelled_leader_releases_file_lock(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        flight = SingleFlight(directory.name)
+        other = _FileLease(directory.name, "key")
+        other.acquire()
+
+        async def fetch():
+            return 1
+
+        async def main():
+            leader = asyncio.create_task(flight.ado("key", fetch))
+            await asyncio.sleep(0.05)
+            leader.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+            other.release()
+            # Поток ведущего получает блокировку и сразу её отпускает
+            await asyncio.sleep(0.2)
+
+        asyncio.run(main())
+        fd = os.open(other.lock_path, os.O_RDWR)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
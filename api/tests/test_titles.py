@@ -0,0 +1,46 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from api import titles
+
+ITEMS = [
+    {"id": 155, "title": "Тёмный рыцарь", "original_title": "The Dark Knight", "release_date": "2008-07-16", "vote_count": 30000, "popularity": 90},
+    {"id": 49026, "title": "Тёмный рыцарь: Возрождение легенды", "original_title": "The Dark Knight Rises", "release_date": "2012-07-16", "vote_count": 20000, "popularity": 80},
+    {"id": 1, "title": "Тёмный город", "original_title": "Dark City", "release_date": "1998-02-27", "vote_count": 3000, "popularity": 10},
+    {"id": 1399, "name": "Игра престолов", "original_name": "Game of Thrones", "first_air_date": "2011-04-17", "vote_count": 25000, "popularity": 100},
+]
+
+
+class TitleIndexTests(TestCase):
+    def setUp(self):
+        patch = mock.patch.object(titles, "TITLE_INDEX_ENABLED", True)
+        patch.start()
+        self.addCleanup(patch.stop)
+        titles.index_items(ITEMS)
+
+    def test_prefix_search(self):
+        rows = titles.search("тёмн рыц", limit=2)
+        self.assertEqual([row["id"] for row in rows], [155, 49026])
+        self.assertEqual(rows[0]["media_type"], "movie")
+        self.assertEqual(rows[0]["year"], 2008)
+
+    def test_exact_title_first(self):
+        rows = titles.search("Тёмный рыцарь: Возрождение легенды", limit=1)
+        self.assertEqual(rows[0]["id"], 49026)
+        # Одно точное совпадение отвечает из индекса и без TITLE_INDEX_MIN_HITS совпадений
+        rows = titles.search("игра престолов")
+        self.assertEqual([(row["id"], row["media_type"]) for row in rows], [(1399, "tv")])
+
+    def test_too_few_hits_go_to_tmdb(self):
+        with mock.patch.object(titles, "TITLE_INDEX_MIN_HITS", 3):
+            self.assertIsNone(titles.search("рыцарь"))
+        self.assertIsNone(titles.search("матрица"))
+
+    @mock.patch.object(titles, "_ensure_flusher")
+    def test_remember_response_updates_index(self, ensure_flusher):
+        titles.remember_response("/movie/155", {**ITEMS[0], "title": "Тёмный рыцарь (2008)", "vote_count": 31000})
+        self.assertEqual(titles.flush(), 1)
+        rows = titles.search("тёмный рыцарь (2008)")
+        self.assertEqual(rows[0]["name"], "Тёмный рыцарь (2008)")
+        self.assertEqual(rows[0]["votes"], 31000)
@@ -0,0 +1,77 @@
+import fcntl
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from api import services, warmup
+from api.tests.base import TMDBMixin, tmdb_response
+
+POPULAR = {"page": 1, "total_pages": 1, "results": [{"id": 550, "title": "Бойцовский клуб"}]}
+
+
+class WarmupTests(TMDBMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.lock_file = os.path.join(directory.name, "warmup.lock")
+        for patch in (
+            mock.patch.object(warmup, "WARMUP_LOCK_FILE", self.lock_file),
+            mock.patch.object(warmup, "_leader_fd", None),
+            mock.patch.object(warmup, "_next_due", {}),
+            mock.patch.dict(os.environ, {"TMDB_API_KEY": "test"}),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(self.close_leader_fd)
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(self.executor.shutdown)
+        self.upstream.return_value = tmdb_response(200, POPULAR, url="/movie/popular")
+        self.jobs = [("popular_movies", lambda: services.get_popular_movies(limit=4))]
+
+    def close_leader_fd(self):
+        if warmup._leader_fd is not None:
+            os.close(warmup._leader_fd)
+
+    def other_worker_is_leader(self):
+        fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT)
+        self.addCleanup(os.close, fd)
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def test_leader_fills_cache_and_schedules_refresh(self):
+        warmup._tick(self.jobs, self.executor)
+        self.assertIsNotNone(warmup._leader_fd)
+        self.assertEqual(self.upstream.call_count, 1)
+        self.assertEqual(services.get_popular_movies(limit=4)["results"][0]["id"], 550)
+        self.assertEqual(self.upstream.call_count, 1)
+        # Следующее обновление — через WARMUP_AHEAD от TTL /movie/popular
+        self.assertIn("popular_movies", warmup._next_due)
+        warmup._tick(self.jobs, self.executor)
+        self.assertEqual(self.upstream.call_count, 1)
+
+    def test_follower_leaves_shared_cache_to_leader(self):
+        self.other_worker_is_leader()
+        with mock.patch.object(warmup, "_shared_cache", return_value=True):
+            self.assertEqual(warmup._tick(self.jobs, self.executor), warmup.WARMUP_RETRY)
+        self.upstream.assert_not_called()
+        self.assertIsNone(warmup._leader_fd)
+
+    def test_follower_without_shared_cache_warms_itself(self):
+        self.other_worker_is_leader()
+        warmup._tick(self.jobs, self.executor)
+        self.assertEqual(self.upstream.call_count, 1)
+        self.assertIsNone(warmup._leader_fd)
+
+    def test_fork_closes_inherited_leader_lock(self):
+        self.assertTrue(warmup._is_leader())
+        fd = warmup._leader_fd
+        with mock.patch.object(warmup, "_started_pid", None):
+            warmup._after_fork()
+        self.assertIsNone(warmup._leader_fd)
+        with self.assertRaises(OSError):
+            os.fstat(fd)
+        # Блокировку ведущего теперь может взять другой воркер
+        self.other_worker_is_leader()
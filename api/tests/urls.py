@@ -0,0 +1,5 @@
+# Тесты вьюх — всегда по синхронным вьюхам (upstream.get), независимо от API_ASYNC_VIEWS
+from api import views
+from config.urls import _patterns
+
+urlpatterns = _patterns(views)
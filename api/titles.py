@@ -0,0 +1,200 @@
+"""
+Локальный индекс названий (таблица api_title + FTS5 api_title_fts в db.sqlite3).
+
+Наполняется всем, что backend получает от TMDB (remember_response вызывается из
+services._fetch), и командой ingest_titles. search() отвечает на /api/v1/movies?q=
+за миллисекунды, если в индексе достаточно совпадений; иначе вызывающий идёт в TMDB.
+Запись идёт пачками в фоновом потоке, чтобы не задерживать ответы.
+"""
+import os
+import re
+import threading
+import time
+from collections import deque
+
+from django.db import DatabaseError, connection
+
+from .models import Title
+
+TITLE_INDEX_ENABLED = os.environ.get("TITLE_INDEX", "1").strip().lower() not in ("0", "false", "no", "off")
+# Сколько совпадений нужно, чтобы ответить из индекса без запроса к TMDB
+TITLE_INDEX_MIN_HITS = int(os.environ.get("TITLE_INDEX_MIN_HITS", "3"))
+# Период записи накопленных названий в БД, секунд
+TITLE_INDEX_FLUSH_INTERVAL = float(os.environ.get("TITLE_INDEX_FLUSH_INTERVAL", "2"))
+_QUEUE_MAX = 5000
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+_queue = deque(maxlen=_QUEUE_MAX)
+_lock = threading.Lock()
+_flusher_pid = None
+
+
+def _enabled() -> bool:
+    return TITLE_INDEX_ENABLED and connection.vendor == "sqlite"
+
+
+def _title_from_item(item: dict, media_type: str | None = None) -> dict | None:
+    """Поля Title из элемента TMDB (фильм или сериал); None — не фильм/сериал или нет названия."""
+    if not isinstance(item, dict) or not item.get("id"):
+        return None
+    media_type = item.get("media_type") or media_type
+    if media_type is None:
+        media_type = "tv" if ("name" in item and "title" not in item) else "movie"
+    if media_type not in ("movie", "tv"):
+        return None
+    if media_type == "tv":
+        name = item.get("name") or item.get("original_name")
+        original = item.get("original_name") or ""
+        date_str = item.get("first_air_date") or ""
+    else:
+        name = item.get("title") or item.get("original_title")
+        original = item.get("original_title") or ""
+        date_str = item.get("release_date") or ""
+    if not name:
+        return None
+    year = int(date_str[:4]) if len(date_str) >= 4 and date_str[:4].isdigit() else None
+    return {
+        "media_type": media_type,
+        "tmdb_id": int(item["id"]),
+        "name": str(name)[:500],
+        "original_name": str(original)[:500],
+        "year": year,
+        "votes": int(item.get("vote_count") or 0),
+        "popularity": float(item.get("popularity") or 0),
+        "poster_path": (item.get("poster_path") or "")[:255],
+    }
+
+
+def remember_response(path: str, data: dict):
+    """Поставить в очередь на индексацию названия из ответа TMDB (списки results или детали)."""
+    if not TITLE_INDEX_ENABLED or not isinstance(data, dict):
+        return
+    if path.startswith("/tv/") or path.startswith("/discover/tv"):
+        media_type = "tv"
+    elif path.startswith("/movie/") or path.startswith("/discover/movie"):
+        media_type = "movie"
+    else:
+        media_type = None
+    items = data.get("results") if isinstance(data.get("results"), list) else [data]
+    rows = [row for row in (_title_from_item(x, media_type) for x in items) if row]
+    if not rows:
+        return
+    with _lock:
+        _queue.extend(rows)
+    _ensure_flusher()
+
+
+def _ensure_flusher():
+    global _flusher_pid
+    pid = os.getpid()
+    if _flusher_pid == pid:
+        return
+    with _lock:
+        if _flusher_pid == pid:
+            return
+        _flusher_pid = pid
+    threading.Thread(target=_flush_loop, name="title-index", daemon=True).start()
+
+
+def _flush_loop():
+    while True:
+        time.sleep(TITLE_INDEX_FLUSH_INTERVAL)
+        try:
+            flush()
+        except DatabaseError:
+            # БД занята или не смигрирована — попробуем в следующий раз (очередь ограничена)
+            pass
+
+
+def flush() -> int:
+    """Записать накопленные названия в БД. Возвращает число записанных."""
+    with _lock:
+        rows = list(_queue)
+        _queue.clear()
+    if not rows or not _enabled():
+        return 0
+    return index_rows(rows)
+
+
+def index_rows(rows: list) -> int:
+    # Последнее значение для (media_type, tmdb_id) побеждает: в одной пачке бывают дубли
+    unique = {(r["media_type"], r["tmdb_id"]): r for r in rows}
+    Title.objects.bulk_create(
+        [Title(**r) for r in unique.values()],
+        update_conflicts=True,
+        unique_fields=["media_type", "tmdb_id"],
+        update_fields=["name", "original_name", "year", "votes", "popularity", "poster_path", "updated_at"],
+    )
+    return len(unique)
+
+
+def index_items(items: list, media_type: str | None = None) -> int:
+    """Синхронно проиндексировать элементы TMDB (для ingest_titles)."""
+    rows = [row for row in (_title_from_item(x, media_type) for x in items or []) if row]
+    return index_rows(rows) if rows and _enabled() else 0
+
+
+def _match_query(q: str) -> str | None:
+    """FTS5-запрос: все слова, каждое — как префикс ("тёмн"* "рыц"*)."""
+    words = _WORD_RE.findall(q.lower())
+    if not words:
+        return None
+    return " ".join('"{}"*'.format(w.replace('"', '""')) for w in words)
+
+
+def search(q: str, limit: int = 10) -> list | None:
+    """
+    Поиск по локальному индексу: [{id, media_type, name, alternativeName, year, votes, poster_path}].
+    None — индекс выключен или совпадений мало (TITLE_INDEX_MIN_HITS) и нет точного совпадения названия.
+    """
+    if not _enabled():
+        return None
+    match = _match_query(q)
+    if match is None:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT t.tmdb_id, t.media_type, t.name, t.original_name, t.year, t.votes, t.poster_path "
+                "FROM api_title_fts JOIN api_title t ON t.id = api_title_fts.rowid "
+                "WHERE api_title_fts MATCH %s "
+                "ORDER BY bm25(api_title_fts), t.popularity DESC, t.votes DESC LIMIT %s",
+                # С запасом: точные совпадения поднимаем наверх уже после выборки
+                [match, limit * 5],
+            )
+            rows = cursor.fetchall()
+    except DatabaseError:
+        return None
+    needle = q.strip().lower()
+
+    def is_exact(row):
+        return needle in ((row[2] or "").lower(), (row[3] or "").lower())
+
+    exact = any(is_exact(row) for row in rows)
+    if len(rows) < min(limit, TITLE_INDEX_MIN_HITS) and not exact:
+        return None
+    # Точное совпадение названия — первым (lower() в SQLite не понимает кириллицу, поэтому здесь)
+    rows.sort(key=lambda row: not is_exact(row))
+    rows = rows[:limit]
+    return [
+        {
+            "id": tmdb_id,
+            "media_type": media_type,
+            "name": name,
+            "alternativeName": original or None,
+            "year": year,
+            "votes": votes,
+            "poster_path": poster_path or None,
+        }
+        for tmdb_id, media_type, name, original, year, votes, poster_path in rows
+    ]
+
+
+def stats() -> dict:
+    enabled = _enabled()
+    try:
+        count = Title.objects.count() if enabled else 0
+    except DatabaseError:
+        count = 0
+    return {"enabled": enabled, "queued": len(_queue), "titles": count}
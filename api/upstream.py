@@ -0,0 +1,350 @@
+"""
+Общий HTTP-клиент для внешних источников (TMDB API, картинки постеров).
+
+Вместо голого requests.get используется одна Session на процесс с пулом
+keep-alive соединений: DNS, TCP и TLS не повторяются на каждый запрос.
+После fork (pre-fork воркеры gunicorn) сессия пересоздаётся в дочернем
+процессе, чтобы воркеры не делили сокеты родителя.
+
+Для ASGI есть асинхронный вариант на httpx: один AsyncClient на event loop.
+
+hedged_get / ahedged_get — GET с дублированием (для идемпотентных GET к TMDB): если ответа нет
+за hedge_after секунд, уходит второй такой же запрос. В async берётся ответ, пришедший первым;
+в синхронном варианте первый запрос не прервать, и второй подменяет его только при сбое.
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+# Размер пула по умолчанию (соединений на хост) и переопределения для конкретных хостов.
+# UPSTREAM_POOL_SIZES=api.themoviedb.org:20,image.tmdb.org:30
+UPSTREAM_POOL_MAXSIZE = int(os.environ.get("UPSTREAM_POOL_MAXSIZE", "10"))
+UPSTREAM_POOL_SIZES_RAW = os.environ.get(
+    "UPSTREAM_POOL_SIZES", "api.themoviedb.org:20,image.tmdb.org:20"
+)
+# Блокироваться при исчерпании пула вместо открытия лишних соединений сверх maxsize
+UPSTREAM_POOL_BLOCK = os.environ.get("UPSTREAM_POOL_BLOCK", "0").strip().lower() in ("1", "true", "yes", "on")
+# Асинхронный клиент: одновременных соединений и keep-alive соединений на весь воркер
+UPSTREAM_ASYNC_MAX_CONNECTIONS = int(os.environ.get("UPSTREAM_ASYNC_MAX_CONNECTIONS", "1000"))
+UPSTREAM_ASYNC_MAX_KEEPALIVE = int(os.environ.get("UPSTREAM_ASYNC_MAX_KEEPALIVE", "100"))
+# Потоков для вторых (хеджирующих) запросов hedged_get; первый выполняется в вызывающем потоке
+UPSTREAM_HEDGE_THREADS = int(os.environ.get("UPSTREAM_HEDGE_THREADS", "32"))
+
+_lock = threading.Lock()
+_session = None
+_session_pid = None
+_adapters = {}
+_stats = {}
+# event loop -> {verify: httpx.AsyncClient}; клиент нельзя использовать в чужом loop
+_async_clients = weakref.WeakKeyDictionary()
+_hedge_executor = None
+_hedge_timer = None
+
+
+def _pool_sizes() -> dict:
+    """Разбор UPSTREAM_POOL_SIZES в словарь {host: maxsize}."""
+    out = {}
+    for chunk in UPSTREAM_POOL_SIZES_RAW.split(","):
+        host, _, size = chunk.strip().partition(":")
+        if not host or not size.strip().isdigit():
+            continue
+        out[host.strip()] = int(size)
+    return out
+
+
+def _make_adapter(maxsize: int) -> HTTPAdapter:
+    # Повторы делает вызывающий код (services._get, poster_proxy), здесь их отключаем
+    return HTTPAdapter(pool_connections=4, pool_maxsize=maxsize, pool_block=UPSTREAM_POOL_BLOCK, max_retries=0)
+
+
+def _build_session() -> requests.Session:
+    session = requests.Session()
+    adapters = {}
+    default = _make_adapter(UPSTREAM_POOL_MAXSIZE)
+    session.mount("https://", default)
+    session.mount("http://", default)
+    adapters["*"] = default
+    for host, size in _pool_sizes().items():
+        adapter = _make_adapter(size)
+        session.mount(f"https://{host}/", adapter)
+        session.mount(f"http://{host}/", adapter)
+        adapters[host] = adapter
+    _adapters.clear()
+    _adapters.update(adapters)
+    return session
+
+
+def _reset_after_fork():
+    """В дочернем процессе забываем сессию родителя — она будет создана заново при первом запросе."""
+    global _session, _session_pid, _lock, _hedge_executor, _hedge_timer
+    _lock = threading.Lock()
+    _session = None
+    _session_pid = None
+    _hedge_executor = None
+    _hedge_timer = None
+    _adapters.clear()
+    _stats.clear()
+    _async_clients.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_session() -> requests.Session:
+    """Session текущего процесса (создаётся лениво, пересоздаётся после fork)."""
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is not None and _session_pid == pid:
+        return _session
+    with _lock:
+        if _session is None or _session_pid != pid:
+            _session = _build_session()
+            _session_pid = pid
+    return _session
+
+
+def _count(url: str):
+    host = urlparse(url).netloc
+    with _lock:
+        _stats[host] = _stats.get(host, 0) + 1
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    """GET через общий пул. Параметры — как у requests.get."""
+    resp = get_session().get(url, **kwargs)
+    _count(url)
+    return resp
+
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_executor
+    if _hedge_executor is None:
+        with _lock:
+            if _hedge_executor is None:
+                _hedge_executor = ThreadPoolExecutor(max_workers=UPSTREAM_HEDGE_THREADS, thread_name_prefix="hedge")
+    return _hedge_executor
+
+
+def _close_quietly(future):
+    try:
+        future.result().close()
+    except Exception:
+        pass
+
+
+def _hedge_kwargs(kwargs: dict, hedge_after: float) -> dict:
+    # Второй запрос должен уложиться в тот же срок, что и первый
+    timeout = kwargs.get("timeout")
+    if isinstance(timeout, (int, float)):
+        kwargs = {**kwargs, "timeout": max(timeout - hedge_after, 0.001)}
+    return kwargs
+
+
+class _HedgeTimer:
+    """Поток, который запускает отложенные вызовы (вторые запросы hedged_get): один на процесс, а не Timer на запрос."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        threading.Thread(target=self._run, name="hedge-timer", daemon=True).start()
+
+    def call_later(self, delay: float, fn):
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), fn))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                fn = heapq.heappop(self._heap)[2]
+            try:
+                fn()
+            except Exception:
+                pass
+
+
+def _get_hedge_timer() -> _HedgeTimer:
+    global _hedge_timer
+    if _hedge_timer is None:
+        with _lock:
+            if _hedge_timer is None:
+                _hedge_timer = _HedgeTimer()
+    return _hedge_timer
+
+
+class _Hedge:
+    """Второй запрос hedged_get: таймер отправляет его в пул, если первый к тому времени ещё не ответил."""
+
+    def __init__(self, url: str, kwargs: dict, allow_hedge):
+        self._url = url
+        self._kwargs = kwargs
+        self._allow_hedge = allow_hedge
+        # Лимит запросов (полоса) и бюджет запроса — из контекста вызывающего потока
+        self._context = contextvars.copy_context()
+        self._lock = threading.Lock()
+        self._future = None
+        self._cancelled = False
+
+    def start(self):
+        with self._lock:
+            if not self._cancelled:
+                self._future = _get_hedge_executor().submit(self._context.run, self._send)
+
+    def _send(self) -> requests.Response | None:
+        if self._allow_hedge is not None and not self._allow_hedge():
+            return None
+        return get(self._url, **self._kwargs)
+
+    def cancel(self):
+        """Не отправлять второй запрос; Future уже отправленного (результат None — отправка не разрешена) или None."""
+        with self._lock:
+            self._cancelled = True
+            return self._future
+
+
+def hedged_get(url: str, hedge_after: float, allow_hedge=None, **kwargs) -> tuple:
+    """
+    GET (параметры — как у get) в вызывающем потоке; если ответа нет за hedge_after секунд, в пуле уходит второй
+    такой же запрос, когда allow_hedge() -> bool это разрешает (например, есть токен лимита). Ждущий ответа
+    первый запрос не прервать, поэтому второй страхует от его сбоя (обрыв, таймаут): упал первый — берётся
+    ответ второго, к этому времени уже полученный или почти полученный. Возвращает (ответ, выиграл ли второй);
+    ненужный ответ второго закрывается. Если оба запроса упали — исключение первого.
+    """
+    hedge = _Hedge(url, _hedge_kwargs(kwargs, hedge_after), allow_hedge)
+    _get_hedge_timer().call_later(hedge_after, hedge.start)
+    try:
+        resp = get(url, **kwargs)
+    except Exception:
+        second = hedge.cancel()
+        if second is not None:
+            try:
+                resp = second.result()
+            except Exception:
+                resp = None
+            if resp is not None:
+                return resp, True
+        raise
+    second = hedge.cancel()
+    if second is not None:
+        second.add_done_callback(_close_quietly)
+    return resp, False
+
+
+def get_async_client(verify: bool = True) -> httpx.AsyncClient:
+    """AsyncClient текущего event loop (SSL-проверка в httpx задаётся на клиента, поэтому по клиенту на verify)."""
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.get(loop)
+    if clients is None:
+        clients = _async_clients[loop] = {}
+    client = clients.get(verify)
+    if client is None:
+        limits = httpx.Limits(
+            max_connections=UPSTREAM_ASYNC_MAX_CONNECTIONS,
+            max_keepalive_connections=UPSTREAM_ASYNC_MAX_KEEPALIVE,
+        )
+        client = clients[verify] = httpx.AsyncClient(limits=limits, verify=verify, follow_redirects=True)
+    return client
+
+
+async def aget(url: str, params: dict | None = None, timeout: float | None = None, verify: bool = True, stream: bool = False) -> httpx.Response:
+    """Асинхронный GET через общий клиент. При stream=True тело не читается — закрыть через aclose()."""
+    client = get_async_client(verify)
+    request = client.build_request("GET", url, params=params, timeout=timeout)
+    resp = await client.send(request, stream=stream)
+    _count(url)
+    return resp
+
+
+async def ahedged_get(url: str, hedge_after: float, allow_hedge=None, **kwargs) -> tuple:
+    """
+    Асинхронный hedged_get (параметры — как у aget): берётся ответ, пришедший первым. Проигравший запрос
+    отменяется, а если он успел ответить в тот же момент — его ответ закрывается.
+    """
+    first = asyncio.ensure_future(aget(url, **kwargs))
+    tasks = [first]
+    winner = None
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if done or (allow_hedge is not None and not allow_hedge()):
+            winner = first
+            return await first, False
+        second = asyncio.ensure_future(aget(url, **_hedge_kwargs(kwargs, hedge_after)))
+        tasks.append(second)
+        pending = set(tasks)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    winner = task
+                    return task.result(), task is second
+                if task is first or error is None:
+                    error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            if task is winner:
+                continue
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled() and task.exception() is None:
+                await task.result().aclose()
+
+
+def close():
+    """Закрыть все соединения пула текущего процесса."""
+    global _session, _session_pid
+    with _lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+        _session_pid = None
+        _adapters.clear()
+
+
+def pool_stats() -> dict:
+    """Статистика пулов: число запросов и соединений по хостам."""
+    hosts = {}
+    for name, adapter in list(_adapters.items()):
+        pools = getattr(adapter.poolmanager, "pools", None)
+        if pools is None:
+            continue
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            # В очереди пула лежат свободные соединения и None-заглушки для ещё не открытых
+            idle = sum(1 for c in list(pool.pool.queue) if c is not None) if pool.pool is not None else 0
+            hosts[pool.host] = {
+                "adapter": name,
+                "maxsize": pool.pool.maxsize if pool.pool is not None else 0,
+                "idle": idle,
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+            }
+    with _lock:
+        requests_by_host = dict(_stats)
+    async_loops = len(_async_clients)
+    return {
+        "pid": _session_pid or os.getpid(),
+        "async_clients": async_loops,
+        "default_maxsize": UPSTREAM_POOL_MAXSIZE,
+        "pool_sizes": _pool_sizes(),
+        "requests_by_host": requests_by_host,
+        "pools": hosts,
+    }
@@ -1,12 +1,20 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
 
 app_name = "api"
 
-urlpatterns = [
-    path("movies", views.movie_list),
-    path("movies/<int:movie_id>", views.movie_detail),
-    path("movies/<int:movie_id>/watch", views.movie_watch),
-    path("genres", views.genre_list),
-    path("search_by_genre", views.search_by_genre),
-]
+
+def build_urlpatterns(api_views):
+    return [
+        path("movies", api_views.movie_list),
+        path("movies/batch", api_views.movie_batch),
+        path("movies/<int:movie_id>", api_views.movie_detail),
+        path("movies/<int:movie_id>/watch", api_views.movie_watch),
+        path("genres", api_views.genre_list),
+        path("search_by_genre", api_views.search_by_genre),
+        path("upstream/stats", api_views.upstream_stats),
+    ]
+
+
+urlpatterns = build_urlpatterns(async_views if settings.API_ASYNC_VIEWS else views)
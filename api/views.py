@@ -1,20 +1,41 @@
+import hashlib
+import math
 import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
 
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
 from rest_framework import status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, renderer_classes
 from rest_framework.request import Request
 from rest_framework.response import Response
-from drf_yasg.utils import swagger_auto_schema
-from drf_yasg import openapi
+from rest_framework.settings import api_settings
+import httpx
 import requests
 
-from . import services
+from . import aservices, catalog, deadlines, metrics, posters, profiling, responses, services, titles, upstream, warmup
+# Описания для Swagger; drf_yasg подключается только при генерации схемы (api.docs)
+from .docs import openapi, swagger_auto_schema
+from .pagination import PAGINATION_MAX_LIMIT, PAGINATION_STREAM_MAX_LIMIT, Cursor
+from .renderers import NDJSONRenderer, ndjson_line
 
 # Домены, с которых разрешено проксировать постеры (избегаем ERR_BLOCKED_BY_CLIENT в браузере)
-ALLOWED_POSTER_HOSTS = ("avatars.mds.yandex.net", "st.kp.yandex.net", "www.kinopoisk.ru", "image.tmdb.org")
+ALLOWED_POSTER_HOSTS = ("avatars.mds.yandex.net", "st.kp.yandex.net", "www.kinopoisk.ru", "image.tmdb.org") + tuple(
+    # Дополнительные хосты постеров (host[:port] через запятую) — например, подменный сервер из bench/
+    h.strip() for h in os.environ.get("POSTER_EXTRA_HOSTS", "").split(",") if h.strip()
+)
+
+# Блоки главной: (ключ в ответе /api/home, имя функции в services/aservices, limit)
+HOME_BLOCKS = (
+    ("popular_now", "get_popular_now", 12),
+    ("popular_movies", "get_popular_movies", 4),
+    ("popular_series", "get_popular_series", 4),
+    ("coming_soon", "get_coming_soon", 4),
+)
 
 GENRE_NAMES = [
     "Боевик", "Комедия", "Фэнтези", "Драма", "Криминал",
@@ -22,27 +43,135 @@ GENRE_NAMES = [
 ]
 
 
+def _year_error(year: str | None) -> str | None:
+    """Проверка параметра year (2020 или 2015-2021): текст ошибки или None."""
+    if not year:
+        return None
+    if "-" in year:
+        parts = year.split("-")
+        if len(parts) != 2:
+            return "Год: один год (2020) или диапазон (2016-2020)."
+        try:
+            start, end = int(parts[0]), int(parts[1])
+            if start > end:
+                raise ValueError
+        except ValueError:
+            return "Некорректный диапазон года."
+    elif not year.isdigit():
+        return "Год должен быть числом или диапазоном."
+    else:
+        start = end = int(year)
+    low, high = services.year_range()
+    if start < low or end > high:
+        return f"Год — от {low} до {high}."
+    return None
+
+
+# Списки можно получить потоком NDJSON: Accept: application/x-ndjson или ?format=ndjson
+LIST_RENDERERS = [*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer]
+
+PAGE_PARAMETERS = [
+    openapi.Parameter(
+        "cursor", openapi.IN_QUERY, type=openapi.TYPE_STRING,
+        description="Продолжение списка: next_cursor из предыдущего ответа",
+    ),
+    openapi.Parameter(
+        "limit", openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+        description=f"Сколько результатов (до {PAGINATION_MAX_LIMIT}, в потоке NDJSON — до {PAGINATION_STREAM_MAX_LIMIT})",
+    ),
+]
+
+
+def _page_options(query, stream: bool) -> tuple:
+    """(cursor, limit, None) или (None, None, текст ошибки) из параметров cursor и limit (limit None — по умолчанию)."""
+    cursor = None
+    token = query.get("cursor", "").strip()
+    if token:
+        try:
+            cursor = Cursor.decode(token)
+        except ValueError:
+            return None, None, "Некорректный cursor: передайте next_cursor из предыдущего ответа."
+    limit = query.get("limit", "").strip()
+    if not limit:
+        return cursor, None, None
+    max_limit = PAGINATION_STREAM_MAX_LIMIT if stream else PAGINATION_MAX_LIMIT
+    if not limit.isdigit() or not 1 <= int(limit) <= max_limit:
+        return None, None, f"limit — число от 1 до {max_limit}."
+    return cursor, int(limit), None
+
+
+def _cached_json(request, endpoint: str, key: tuple, build) -> HttpResponse:
+    """
+    Ответ из кэша готовых ответов (api.responses) или build() -> (data, можно ли кэшировать).
+    С ETag и Cache-Control эндпоинта; совпал If-None-Match — 304 (из кэша — без вызова build).
+    Собранный из устаревших данных (TMDB недоступен, services.tracking_fallbacks) — как ответ с ошибкой:
+    не кэшируется, no-cache. Исключения build пробрасываются.
+    """
+    entry = responses.get(endpoint, key)
+    cacheable = True
+    if entry is None:
+        with services.tracking_fallbacks() as fallbacks:
+            data, cacheable = build()
+        cacheable = cacheable and not fallbacks
+        entry = responses.store(endpoint, key, data) if cacheable else responses.encode(data)
+    return responses.response(request, endpoint, entry, cacheable)
+
+
+def _ndjson_response(walk):
+    """
+    Поток NDJSON: строка на результат по мере прихода страниц TMDB, последняя — {"next_cursor": ...}.
+    Ошибка TMDB до первой строки — обычный ответ с ошибкой (_upstream_error), после — строка {"detail": ...}.
+    """
+    rows = iter(walk) if walk is not None else iter(())
+    try:
+        first = next(rows, None)
+    except UPSTREAM_ERRORS as e:
+        return _upstream_error(e)
+    return StreamingHttpResponse(_ndjson_lines(first, rows, walk), content_type=NDJSONRenderer.media_type)
+
+
+def _ndjson_lines(first, rows, walk):
+    if first is not None:
+        yield ndjson_line(first)
+        try:
+            for row in rows:
+                yield ndjson_line(row)
+        except Exception as e:
+            yield ndjson_line({"detail": _block_error(e)["detail"]})
+            return
+    yield ndjson_line({"next_cursor": walk.next_token if walk is not None else None})
+
+
 @swagger_auto_schema(
     method="get",
     operation_summary="Поиск фильмов",
-    operation_description="Поиск по названию (q) или по жанру и году (genre, year). Укажите либо q, либо genre.",
+    operation_description="Поиск по названию (q) или по жанру и году (genre, year). Укажите либо q, либо genre. "
+    "Продолжение списка — cursor=next_cursor из ответа; Accept: application/x-ndjson — поток по строке на результат.",
     manual_parameters=[
         openapi.Parameter("q", openapi.IN_QUERY, description="Поиск по названию (мин. 2 символа)", type=openapi.TYPE_STRING),
         openapi.Parameter("genre", openapi.IN_QUERY, description="Жанр (напр. комедия, драма)", type=openapi.TYPE_STRING),
         openapi.Parameter("year", openapi.IN_QUERY, description="Год: 2020 или 2015-2021", type=openapi.TYPE_STRING),
+        *PAGE_PARAMETERS,
     ],
 )
 @api_view(["GET"])
+@renderer_classes(LIST_RENDERERS)
+@deadlines.view_budget("movie_list")
 def movie_list(request: Request):
     """
     Список/поиск фильмов.
     - q — поиск по названию (минимум 2 символа).
     - genre — поиск по жанру.
     - year — год или диапазон (например 2020 или 2015-2021).
+    - cursor, limit — продолжение списка и размер страницы.
     """
     q = request.query_params.get("q", "").strip()
     genre = request.query_params.get("genre", "").strip()
     year = request.query_params.get("year", "").strip() or None
+    stream = request.accepted_renderer.format == NDJSONRenderer.format
+    cursor, limit, error = _page_options(request.query_params, stream)
+    if error:
+        return Response({"detail": error}, status=status.HTTP_400_BAD_REQUEST)
 
     if q:
         if len(q) < 2:
@@ -50,44 +179,23 @@ def movie_list(request: Request):
                 {"detail": "Параметр q должен быть не короче 2 символов."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
+        if stream:
+            return _ndjson_response(services.query_walk(q, cursor, limit or PAGINATION_MAX_LIMIT))
         try:
-            return Response(services.search_by_query(q))
-        except requests.HTTPError as e:
-            return Response(
-                {"detail": f"Ошибка API TMDB: {e.response.status_code}"},
-                status=status.HTTP_502_BAD_GATEWAY,
-            )
+            return _cached_json(request, "search", _list_key(q.lower(), None, cursor, limit), lambda: (services.search_by_query(q, cursor, limit), True))
+        except UPSTREAM_ERRORS as e:
+            return _upstream_error(e)
 
     if genre:
-        if year:
-            if "-" in year:
-                parts = year.split("-")
-                if len(parts) != 2:
-                    return Response(
-                        {"detail": "Год: один год (2020) или диапазон (2016-2020)."},
-                        status=status.HTTP_400_BAD_REQUEST,
-                    )
-                try:
-                    start, end = int(parts[0]), int(parts[1])
-                    if start > end:
-                        raise ValueError
-                except ValueError:
-                    return Response(
-                        {"detail": "Некорректный диапазон года."},
-                        status=status.HTTP_400_BAD_REQUEST,
-                    )
-            elif not year.isdigit():
-                return Response(
-                    {"detail": "Год должен быть числом или диапазоном."},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
+        error = _year_error(year)
+        if error:
+            return Response({"detail": error}, status=status.HTTP_400_BAD_REQUEST)
+        if stream:
+            return _ndjson_response(services.genre_walk(genre, year, cursor, limit or PAGINATION_MAX_LIMIT))
         try:
-            return Response(services.search_by_genre(genre, year))
-        except requests.HTTPError as e:
-            return Response(
-                {"detail": f"Ошибка API TMDB: {e.response.status_code}"},
-                status=status.HTTP_502_BAD_GATEWAY,
-            )
+            return _cached_json(request, "genre", _list_key(genre.lower(), year, cursor, limit), lambda: (services.search_by_genre(genre, year, cursor, limit), True))
+        except UPSTREAM_ERRORS as e:
+            return _upstream_error(e)
 
     return Response(
         {"detail": "Укажите q (поиск по названию) или genre (поиск по жанру)."},
@@ -95,40 +203,145 @@ def movie_list(request: Request):
     )
 
 
+def _csv_param(value: str) -> list:
+    return [x.strip() for x in (value or "").split(",") if x.strip()]
+
+
+def _detail_options(query) -> tuple:
+    """(include, fields, None) или (None, None, текст ошибки) из параметров include и fields."""
+    include = _csv_param(query.get("include", ""))
+    unknown = [x for x in include if x not in services.TMDB_DETAIL_INCLUDES]
+    if unknown:
+        return None, None, (
+            f"Неизвестные include: {', '.join(unknown)}. Доступны: {', '.join(services.TMDB_DETAIL_INCLUDES)}."
+        )
+    return include, _csv_param(query.get("fields", "")) or None, None
+
+
+def _detail_key(movie_id: int, include, fields) -> tuple:
+    return (movie_id, tuple(sorted(include or ())), tuple(fields or ()))
+
+
+def _list_key(term: str, year: str | None, cursor, limit) -> tuple:
+    return (term, year, cursor.encode() if cursor else None, limit)
+
+
+DETAIL_PARAMETERS = [
+    openapi.Parameter(
+        "fields", openapi.IN_QUERY, type=openapi.TYPE_STRING,
+        description="Только эти поля через запятую, вложенные — через точку: id,title,poster_url,credits.cast",
+    ),
+    openapi.Parameter(
+        "include", openapi.IN_QUERY, type=openapi.TYPE_STRING,
+        description="Подгрузить тем же запросом к TMDB (append_to_response): " + ", ".join(services.TMDB_DETAIL_INCLUDES),
+    ),
+]
+
+
 @swagger_auto_schema(
     method="get",
     operation_summary="Детали фильма",
-    operation_description="Полная информация о фильме/сериале по ID (TMDB).",
+    operation_description="Полная информация о фильме/сериале по ID (TMDB). "
+    "fields — оставить только нужные поля, include — подресурсы (credits, videos, ...) в том же ответе.",
+    manual_parameters=DETAIL_PARAMETERS,
 )
 @api_view(["GET"])
+@deadlines.view_budget("movie_detail")
 def movie_detail(request: Request, movie_id: int):
     """Детали фильма по ID."""
+    include, fields, error = _detail_options(request.query_params)
+    if error:
+        return Response({"detail": error}, status=status.HTTP_400_BAD_REQUEST)
     try:
-        data = services.get_movie_details(movie_id)
-        return Response(data)
-    except requests.HTTPError as e:
-        return Response(
-            {"detail": "Фильм не найден или ошибка API."},
-            status=status.HTTP_404_NOT_FOUND if e.response.status_code == 404 else status.HTTP_502_BAD_GATEWAY,
-        )
+        return _cached_json(request, "detail", _detail_key(movie_id, include, fields), lambda: (services.get_movie_details(movie_id, include=include, fields=fields), True))
+    except UPSTREAM_ERRORS as e:
+        return _upstream_error(e, not_found=True)
+
+
+def _batch_ids(raw: str):
+    """
+    (ids, None) или (None, текст ошибки) для параметра ids: "550,tv:1399,movie:13" (без префикса — фильм).
+    ids — список пар (media_type, id) или строк-токенов, которые не удалось разобрать; порядок запроса, без дублей.
+    """
+    tokens = [t.strip().lower() for t in raw.split(",") if t.strip()]
+    if not tokens:
+        return None, "Укажите ids, напр. ids=550,tv:1399,movie:13."
+    ids = []
+    for token in tokens:
+        media_type, _, raw_id = token.rpartition(":")
+        media_type = media_type or "movie"
+        if media_type in ("movie", "tv") and raw_id.isdigit() and int(raw_id) > 0:
+            ids.append((media_type, int(raw_id)))
+        else:
+            ids.append(token)
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > services.BATCH_MAX_IDS:
+        return None, f"Не больше {services.BATCH_MAX_IDS} id в одном запросе."
+    return ids, None
+
+
+@profiling.timed("transform")
+def _batch_response(ids: list, results: dict) -> dict:
+    """Ответ пакетного запроса: по элементу на id в порядке запроса — data или status + detail."""
+    items = []
+    errors = 0
+    for ref in ids:
+        if isinstance(ref, str):
+            items.append({"id": ref, "status": 400, "detail": "Некорректный id: ожидается 550, movie:550 или tv:1399."})
+            errors += 1
+            continue
+        key = f"{ref[0]}:{ref[1]}"
+        value = results[ref]
+        if not isinstance(value, Exception):
+            items.append({"id": key, "status": 200, "data": value})
+            continue
+        errors += 1
+        code = _upstream_status(value, not_found=True)[0] if isinstance(value, UPSTREAM_ERRORS) else 502
+        if code == 404:
+            items.append({"id": key, "status": 404, "detail": "Фильм не найден."})
+        else:
+            items.append({"id": key, "status": code, "detail": _block_error(value)["detail"]})
+    return {"count": len(items), "errors_count": errors, "results": items}
+
+
+@swagger_auto_schema(
+    method="get",
+    operation_summary="Детали нескольких фильмов",
+    operation_description="Детали до BATCH_MAX_IDS (50) фильмов и сериалов одним запросом: "
+    "ids=550,tv:1399,movie:13 (без префикса — фильм). Дубли схлопываются, кэшированные отдаются сразу, "
+    "остальные запрашиваются у TMDB параллельно. Для каждого id — data или status и detail.",
+    manual_parameters=[
+        openapi.Parameter("ids", openapi.IN_QUERY, description="id через запятую, tv: — сериал", type=openapi.TYPE_STRING, required=True),
+    ],
+)
+@api_view(["GET"])
+@deadlines.view_budget("movie_batch")
+def movie_batch(request: Request):
+    """Детали нескольких фильмов/сериалов."""
+    ids, error = _batch_ids(request.query_params.get("ids", ""))
+    if error:
+        return Response({"detail": error}, status=status.HTTP_400_BAD_REQUEST)
+    refs = [ref for ref in ids if not isinstance(ref, str)]
+    return Response(_batch_response(ids, services.get_details_batch(refs)))
 
 
 @swagger_auto_schema(
     method="get",
     operation_summary="Ссылка на просмотр",
-    operation_description="Детали фильма и ссылка на просмотр (view_link).",
+    operation_description="Детали фильма и ссылка на просмотр (view_link). fields и include — как в деталях фильма.",
+    manual_parameters=DETAIL_PARAMETERS,
 )
 @api_view(["GET"])
+@deadlines.view_budget("movie_watch")
 def movie_watch(request: Request, movie_id: int):
     """Детали фильма и ссылка на просмотр."""
+    include, fields, error = _detail_options(request.query_params)
+    if error:
+        return Response({"detail": error}, status=status.HTTP_400_BAD_REQUEST)
     try:
-        data = services.get_watch_link(movie_id)
-        return Response(data)
-    except requests.HTTPError as e:
-        return Response(
-            {"detail": "Фильм не найден или ошибка API."},
-            status=status.HTTP_404_NOT_FOUND if e.response.status_code == 404 else status.HTTP_502_BAD_GATEWAY,
-        )
+        return _cached_json(request, "watch", _detail_key(movie_id, include, fields), lambda: (services.get_watch_link(movie_id, include=include, fields=fields), True))
+    except UPSTREAM_ERRORS as e:
+        return _upstream_error(e, not_found=True)
 
 
 @swagger_auto_schema(
@@ -139,19 +352,23 @@ def movie_watch(request: Request, movie_id: int):
 @api_view(["GET"])
 def genre_list(request: Request):
     """Список доступных жанров."""
-    return Response({"genres": GENRE_NAMES})
+    return _cached_json(request, "genres", (), lambda: ({"genres": GENRE_NAMES}, True))
 
 
 @swagger_auto_schema(
     method="get",
     operation_summary="Поиск по жанру",
-    operation_description="Эндпоинт для фронтенда: api/search_by_genre?genre_name=триллер",
+    operation_description="Эндпоинт для фронтенда: api/search_by_genre?genre_name=триллер. "
+    "Продолжение списка — cursor=next_cursor из ответа; Accept: application/x-ndjson — поток по строке на результат.",
     manual_parameters=[
         openapi.Parameter("genre_name", openapi.IN_QUERY, description="Название жанра (напр. триллер, комедия)", type=openapi.TYPE_STRING, required=True),
         openapi.Parameter("year", openapi.IN_QUERY, description="Год или диапазон (напр. 2020 или 2015-2021)", type=openapi.TYPE_STRING),
+        *PAGE_PARAMETERS,
     ],
 )
 @api_view(["GET"])
+@renderer_classes(LIST_RENDERERS)
+@deadlines.view_budget("search_by_genre")
 def search_by_genre(request: Request):
     """
     Поиск фильмов по жанру.
@@ -164,111 +381,306 @@ def search_by_genre(request: Request):
             status=status.HTTP_400_BAD_REQUEST,
         )
     year = request.query_params.get("year", "").strip() or None
-    if year and "-" in year:
-        parts = year.split("-")
-        if len(parts) != 2:
-            return Response(
-                {"detail": "Год: один год (2020) или диапазон (2016-2020)."},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-        try:
-            start, end = int(parts[0]), int(parts[1])
-            if start > end:
-                raise ValueError
-        except ValueError:
-            return Response(
-                {"detail": "Некорректный диапазон года."},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-    elif year and not year.isdigit():
-        return Response(
-            {"detail": "Год должен быть числом или диапазоном."},
-            status=status.HTTP_400_BAD_REQUEST,
-        )
+    error = _year_error(year)
+    stream = request.accepted_renderer.format == NDJSONRenderer.format
+    cursor, limit, page_error = _page_options(request.query_params, stream)
+    if error or page_error:
+        return Response({"detail": error or page_error}, status=status.HTTP_400_BAD_REQUEST)
+    if stream:
+        return _ndjson_response(services.genre_walk(genre_name, year, cursor, limit or PAGINATION_MAX_LIMIT))
     try:
-        return Response(services.search_by_genre(genre_name, year))
-    except requests.HTTPError as e:
-        return Response(
-            {"detail": f"Ошибка API TMDB: {e.response.status_code}"},
-            status=status.HTTP_502_BAD_GATEWAY,
-        )
+        return _cached_json(request, "genre", _list_key(genre_name.lower(), year, cursor, limit), lambda: (services.search_by_genre(genre_name, year, cursor, limit), True))
+    except UPSTREAM_ERRORS as e:
+        return _upstream_error(e)
 
 
-def _api_response(service_call):
-    """Вызов сервиса TMDB: при любой ошибке возвращаем 200 с пустыми results, чтобы фронт не падал."""
-    try:
-        return Response(service_call())
-    except requests.HTTPError as e:
+def _api_response(request, endpoint: str, service_call):
+    """Вызов сервиса TMDB: при любой ошибке возвращаем 200 с пустыми results, чтобы фронт не падал (такой ответ не кэшируется)."""
+
+    def build():
+        try:
+            return service_call(), True
+        except Exception as e:
+            return _block_error(e), False
+
+    return _cached_json(request, endpoint, (), build)
+
+
+# Ошибки обращения к TMDB, которые вьюхи отдают клиенту ответом _upstream_error (остальные — 500)
+UPSTREAM_ERRORS = (
+    requests.RequestException, httpx.HTTPError, services.BreakerOpen, services.RateLimited, services.DeadlineExceeded,
+)
+
+
+def _upstream_status(e: Exception, not_found: bool = False) -> tuple:
+    """
+    (статус, Retry-After или None) для ошибки TMDB из UPSTREAM_ERRORS.
+    Исчерпан бюджет запроса (api.deadlines) — 504. TMDB недоступен (services._upstream_failure: breaker открыт,
+    лимит запросов, таймаут, 429, 5xx) — 503, Retry-After — когда breaker или лимит пропустят запрос;
+    404 при not_found — 404; прочие ответы TMDB — 502.
+    """
+    if isinstance(e, services.DeadlineExceeded):
+        return status.HTTP_504_GATEWAY_TIMEOUT, None
+    if services._upstream_failure(e) or aservices._upstream_failure(e):
+        if isinstance(e, services.BreakerOpen):
+            retry_after = e.retry_in
+        elif isinstance(e, services.RateLimited):
+            retry_after = e.wait
+        else:
+            header = getattr(getattr(e, "response", None), "headers", {}).get("Retry-After", "")
+            retry_after = float(header) if header.strip().isdigit() else None
+        return status.HTTP_503_SERVICE_UNAVAILABLE, None if retry_after is None else max(math.ceil(retry_after), 1)
+    code = getattr(getattr(e, "response", None), "status_code", None)
+    if not_found and code == 404:
+        return status.HTTP_404_NOT_FOUND, None
+    return status.HTTP_502_BAD_GATEWAY, None
+
+
+def _upstream_error_data(e: Exception, not_found: bool = False) -> tuple:
+    """(data, статус, заголовки) ответа вьюхи на ошибку TMDB; not_found — 404 TMDB означает «фильм не найден»."""
+    code, retry_after = _upstream_status(e, not_found)
+    if code == status.HTTP_504_GATEWAY_TIMEOUT:
+        detail = "TMDB не ответил вовремя, попробуйте позже"
+    elif code == status.HTTP_503_SERVICE_UNAVAILABLE:
+        detail = "TMDB временно недоступен, попробуйте позже"
+    elif not_found:
+        detail = "Фильм не найден или ошибка API."
+    else:
+        detail = _block_error(e)["detail"]
+    return {"detail": detail}, code, {"Retry-After": str(retry_after)} if retry_after is not None else None
+
+
+def _upstream_error(e: Exception, not_found: bool = False) -> Response:
+    """Ответ на ошибку TMDB, когда отдать нечего (нет и устаревшей копии в кэше): 404, 502, 503 с Retry-After или 504."""
+    data, code, headers = _upstream_error_data(e, not_found)
+    return Response(data, status=code, headers=headers)
+
+
+def _block_error(e: Exception) -> dict:
+    """Пустой блок главной с описанием ошибки (requests.HTTPError или httpx.HTTPStatusError)."""
+    if isinstance(e, (services.BreakerOpen, services.RateLimited, services.DeadlineExceeded)):
+        return {"results": [], "detail": "TMDB временно недоступен, попробуйте позже"}
+    if isinstance(e, (requests.HTTPError, httpx.HTTPStatusError)):
         code = e.response.status_code if e.response is not None else 502
         if code == 401:
-            return Response({"results": [], "detail": "Неверный или отсутствующий TMDB_API_KEY на сервере"})
-        return Response({"results": [], "detail": f"Ошибка API TMDB: {code}"})
-    except Exception as e:
-        return Response(
-            {"results": [], "detail": f"Ошибка сервера: {type(e).__name__}"},
-            status=status.HTTP_200_OK,
-        )
+            return {"results": [], "detail": "Неверный или отсутствующий TMDB_API_KEY на сервере"}
+        return {"results": [], "detail": f"Ошибка API TMDB: {code}"}
+    return {"results": [], "detail": f"Ошибка сервера: {type(e).__name__}"}
 
 
 @api_view(["GET"])
+@deadlines.view_budget("popular_now")
 def popular_now(request: Request):
     """Популярное сейчас — топ по голосам."""
-    return _api_response(lambda: services.get_popular_now(limit=12))
+    return _api_response(request, "popular_now", lambda: services.get_popular_now(limit=12))
 
 
 @api_view(["GET"])
+@deadlines.view_budget("popular_movies")
 def popular_movies(request: Request):
     """Популярные фильмы (только фильмы)."""
-    return _api_response(lambda: services.get_popular_movies(limit=4))
+    return _api_response(request, "popular_movies", lambda: services.get_popular_movies(limit=4))
 
 
 @api_view(["GET"])
+@deadlines.view_budget("popular_series")
 def popular_series(request: Request):
     """Популярные сериалы (только сериалы)."""
-    return _api_response(lambda: services.get_popular_series(limit=4))
+    return _api_response(request, "popular_series", lambda: services.get_popular_series(limit=4))
 
 
 @api_view(["GET"])
+@deadlines.view_budget("coming_soon")
 def coming_soon(request: Request):
     """Скоро на экранах — премьеры."""
-    return _api_response(lambda: services.get_coming_soon(limit=4))
+    return _api_response(request, "coming_soon", lambda: services.get_coming_soon(limit=4))
 
 
-def poster_proxy(request):
+_home_executor = None
+_home_executor_lock = threading.Lock()
+
+
+def _get_home_executor() -> ThreadPoolExecutor:
+    # Создаём лениво в воркере, а не при импорте (потоки не переживают fork)
+    global _home_executor
+    if _home_executor is None:
+        with _home_executor_lock:
+            if _home_executor is None:
+                _home_executor = ThreadPoolExecutor(max_workers=len(HOME_BLOCKS) * 4, thread_name_prefix="home")
+    return _home_executor
+
+
+def _home_block(func_name: str, limit: int) -> dict:
+    try:
+        return getattr(services, func_name)(limit=limit)
+    except Exception as e:
+        return _block_error(e)
+
+
+@swagger_auto_schema(
+    method="get",
+    operation_summary="Главная страница",
+    operation_description="Все блоки главной одним ответом: popular_now, popular_movies, popular_series, coming_soon. "
+    "Блоки запрашиваются у TMDB параллельно; ошибка одного блока даёт пустой results только в нём.",
+)
+@api_view(["GET"])
+@deadlines.view_budget("home")
+def home(request: Request):
+    """Блоки главной одним запросом."""
+    def build():
+        executor = _get_home_executor()
+        futures = {key: executor.submit(deadlines.bind(_home_block), func_name, limit) for key, func_name, limit in HOME_BLOCKS}
+        blocks = {key: future.result() for key, future in futures.items()}
+        # Блок с ошибкой (в нём есть detail) — не кэшируем весь ответ
+        return blocks, not any("detail" in block for block in blocks.values())
+
+    return _cached_json(request, "home", (), build)
+
+
+def _poster_url_param(request):
     """
-    Прокси постеров (TMDB, Yandex и т.д.). При ошибке загрузки — редирект на оригинальный URL.
-    GET ?url=<encoded_image_url>
+    (url, parsed, None) или (None, None, ответ с ошибкой) для параметров url и size.
+    size (w185, 342, original) переводится на ступень TMDB и подставляется в URL image.tmdb.org —
+    у каждого размера своя запись в кэше.
     """
     url = request.GET.get("url", "").strip()
     if not url:
-        return HttpResponse("Missing url", status=400)
+        return None, None, HttpResponse("Missing url", status=400)
     try:
         parsed = urlparse(url)
         if parsed.scheme not in ("http", "https") or parsed.netloc not in ALLOWED_POSTER_HOSTS:
-            return HttpResponse("Forbidden", status=403)
+            return None, None, HttpResponse("Forbidden", status=403)
     except Exception:
-        return HttpResponse("Invalid url", status=400)
+        return None, None, HttpResponse("Invalid url", status=400)
+    size = request.GET.get("size", "").strip()
+    if size:
+        tmdb_size = services.tmdb_image_size(size)
+        if tmdb_size is None:
+            return None, None, HttpResponse("Invalid size", status=400)
+        url = posters.resize_url(url, tmdb_size)
+    return url, parsed, None
+
+
+def _store_poster(url: str, content: bytes, headers) -> posters.PosterEntry:
+    """Сохранить картинку в дисковый кэш; если кэш выключен или недоступен — запись только в памяти."""
+    content_type = headers.get("Content-Type", "image/jpeg")
+    last_modified = parse_http_date_safe(headers.get("Last-Modified") or "")
+    if posters.POSTER_CACHE_ENABLED:
+        try:
+            return posters.poster_cache.store(url, content, content_type, last_modified)
+        except OSError:
+            pass
+    sha256 = hashlib.sha256(content).hexdigest()
+    return posters.PosterEntry(url, None, sha256, len(content), content_type, last_modified or time.time())
+
 
-    verify = True
-    if parsed.netloc == "image.tmdb.org":
-        v = os.environ.get("TMDB_SSL_VERIFY", "1").strip().lower()
-        verify = v not in ("0", "false", "no", "off")
+def _poster_response(request, entry: posters.PosterEntry, content: bytes | None = None, file_response: bool = True) -> HttpResponse:
+    """
+    Ответ с картинкой и валидаторами (ETag, Last-Modified); на условный запрос — 304.
+    Файл из кэша отдаёт nginx (X-Accel-Redirect) или FileResponse; file_response=False — читаем в память (ASGI).
+    """
+    last_modified = int(entry.last_modified)
+    response = get_conditional_response(request, etag=entry.etag, last_modified=last_modified)
+    if response is None:
+        if content is not None:
+            response = HttpResponse(content, content_type=entry.content_type)
+        elif posters.POSTER_ACCEL_REDIRECT_PREFIX:
+            response = HttpResponse(content_type=entry.content_type)
+            response["X-Accel-Redirect"] = entry.accel_redirect
+        elif file_response:
+            response = FileResponse(open(entry.path, "rb"), content_type=entry.content_type)
+        else:
+            with open(entry.path, "rb") as f:
+                response = HttpResponse(f.read(), content_type=entry.content_type)
+        metrics.poster_bytes("upstream" if content is not None else "cache", entry.size)
+    response["ETag"] = entry.etag
+    response["Last-Modified"] = http_date(last_modified)
+    response["Cache-Control"] = "public, max-age=86400"
+    return response
+
+
+def _streaming_poster_response(headers, stream, last_modified: float | None) -> StreamingHttpResponse:
+    """Потоковый ответ для промаха кэша. ETag (хэш содержимого) появится у следующих ответов — из кэша."""
+    response = StreamingHttpResponse(stream, content_type=headers.get("Content-Type", "image/jpeg"))
+    if headers.get("Content-Length") and not headers.get("Content-Encoding"):
+        response["Content-Length"] = headers["Content-Length"]
+    response["Last-Modified"] = http_date(int(last_modified or time.time()))
+    response["Cache-Control"] = "public, max-age=86400"
+    return response
+
+
+@deadlines.view_budget("poster_proxy")
+def poster_proxy(request):
+    """
+    Прокси постеров (TMDB, Yandex и т.д.). При ошибке загрузки — редирект на оригинальный URL.
+    GET ?url=<encoded_image_url>[&size=w185]
+    Картинки кэшируются на диске (api.posters); поддерживаются If-None-Match / If-Modified-Since.
+    Промах отдаётся потоково; при исчерпании слотов загрузки (POSTER_MAX_CONCURRENCY) — тоже редирект.
+    """
+    url, parsed, error = _poster_url_param(request)
+    if error is not None:
+        return error
+
+    entry = posters.poster_cache.lookup(url) if posters.POSTER_CACHE_ENABLED else None
+    if entry is not None:
+        try:
+            return _poster_response(request, entry)
+        except OSError:
+            # Картинку вытеснили между lookup и чтением — загрузим заново
+            pass
 
-    last_error = None
-    for attempt in range(3):
+    verify = services._ssl_verify() if parsed.netloc == "image.tmdb.org" else True
+
+    if not posters.poster_slots.try_acquire():
+        return HttpResponseRedirect(url)
+    deadline = time.monotonic() + posters.POSTER_DEADLINE
+    streaming = False
+    try:
+        # Ответ источника ждём в пределах бюджета запроса; начатую передачу тела доводим до POSTER_DEADLINE
+        resp = posters.open_upstream(url, verify, deadlines.until(posters.POSTER_DEADLINE))
+        if resp is None:
+            # После всех неудач — редирект на оригинальный URL (браузер попробует загрузить сам)
+            return HttpResponseRedirect(url)
+        last_modified = parse_http_date_safe(resp.headers.get("Last-Modified") or "")
+        if posters.POSTER_STREAMING:
+            # Слот и соединение теперь освобождает PosterStream.close()
+            stream = posters.PosterStream(resp, url, deadline, last_modified)
+            streaming = True
+            return _streaming_poster_response(resp.headers, stream, last_modified)
         try:
-            resp = requests.get(url, timeout=25, stream=True, verify=verify)
-            resp.raise_for_status()
-            content_type = resp.headers.get("Content-Type", "image/jpeg")
             content = resp.content
-            response = HttpResponse(content, content_type=content_type)
-            response["Cache-Control"] = "public, max-age=86400"
-            return response
-        except requests.RequestException as e:
-            last_error = e
-            if attempt < 2:
-                time.sleep(1)
-            continue
+        except requests.RequestException:
+            return HttpResponseRedirect(url)
+        finally:
+            resp.close()
+        return _poster_response(request, _store_poster(url, content, resp.headers), content)
+    finally:
+        if not streaming:
+            posters.poster_slots.release()
+
 
-    # После 3 неудач — редирект на оригинальный URL (браузер попробует загрузить сам)
-    return HttpResponseRedirect(url)
+@swagger_auto_schema(
+    method="get",
+    operation_summary="Статистика пулов соединений",
+    operation_description="Использование пулов keep-alive соединений к TMDB и хостам постеров, кэша ответов TMDB и состояние circuit breaker в текущем воркере.",
+)
+@api_view(["GET"])
+def upstream_stats(request: Request):
+    """Статистика общего HTTP-клиента и кэша TMDB текущего процесса."""
+    return Response({
+        "pools": upstream.pool_stats(),
+        "cache": services.cache_stats(),
+        "responses": responses.stats(),
+        "breakers": services.breaker_stats(),
+        "rate_limit": services.ratelimit_stats(),
+        "singleflight": services.singleflight_stats(),
+        "latency": deadlines.stats(),
+        "title_index": titles.stats(),
+        "catalog": catalog.stats(),
+        "warmup": warmup.stats(),
+        "posters": {
+            **posters.poster_cache.stats(),
+            "downloads_in_flight": posters.poster_slots.in_use,
+            "downloads_rejected": posters.poster_slots.rejected,
+        },
+    })
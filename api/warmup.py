@@ -0,0 +1,197 @@
+"""
+Фоновый прогрев и обновление горячих данных TMDB: блоки главной и страницы жанров.
+
+Поток-планировщик при старте заполняет кэш, а затем обновляет каждую запись заранее — через
+WARMUP_AHEAD от её TTL, до того как она устареет. Запросы идут параллельно в ограниченном пуле
+(WARMUP_CONCURRENCY).
+
+Прогревает ведущий — воркер, взявший flock на WARMUP_LOCK_FILE: он пишет ответы во второй уровень
+кэша (api.sharedcache), откуда их берут остальные воркеры, и обновляет ячейки каталога жанров без
+года в БД (api.catalog). Остальные раз в WARMUP_RETRY пробуют стать ведущим — если ведущий
+завершится, его место займёт другой. Без второго уровня кэш у каждого воркера свой, и прогревает
+его каждый воркер сам (каталог — всё равно только ведущий).
+
+Запускается в воркере хуком post_worker_init из gunicorn.conf.py (start), а не при импорте
+config/wsgi.py: с --preload импорт идёт в мастере. WARMUP=0 — выключить.
+"""
+import fcntl
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+
+from . import catalog, ratelimit, services
+
+WARMUP_ENABLED = os.environ.get("WARMUP", "1").strip().lower() not in ("0", "false", "no", "off")
+# Сколько запросов прогрева одновременно
+WARMUP_CONCURRENCY = int(os.environ.get("WARMUP_CONCURRENCY", "4"))
+# Доля TTL, после которой запись обновляется заранее
+WARMUP_AHEAD = float(os.environ.get("WARMUP_AHEAD", "0.8"))
+# Повтор после ошибки и проверка заданий, не дошедших до TMDB (ответ из каталога), — секунд
+WARMUP_RETRY = float(os.environ.get("WARMUP_RETRY", "60"))
+WARMUP_IDLE = float(os.environ.get("WARMUP_IDLE", "300"))
+# Возраст ячеек каталога без года, после которого ведущий их обновляет, — часов
+WARMUP_CATALOG_MAX_AGE = float(os.environ.get("WARMUP_CATALOG_MAX_AGE", "6"))
+WARMUP_LOCK_FILE = os.environ.get("WARMUP_LOCK_FILE", "").strip() or os.path.join(
+    tempfile.gettempdir(),
+    "movie-backend-warmup-{}.lock".format(hashlib.sha1(str(settings.BASE_DIR).encode("utf-8")).hexdigest()[:12]),
+)
+
+_lock = threading.Lock()
+_started_pid = None
+_leader_fd = None
+_state = {"runs": 0, "errors": 0, "last_error": None, "last_run": None}
+_next_due = {}
+
+
+def _jobs() -> list:
+    """(имя, функция без аргументов): блоки главной с теми же limit, что в /api/home, и 11 жанров без года."""
+    from .views import GENRE_NAMES, HOME_BLOCKS
+
+    jobs = []
+    for key, func_name, limit in HOME_BLOCKS:
+        jobs.append((key, lambda f=getattr(services, func_name), n=limit: f(limit=n)))
+    for name in GENRE_NAMES:
+        jobs.append((f"genre:{name.lower()}", lambda g=name.lower(): services.search_by_genre(g, None)))
+    return jobs
+
+
+def start():
+    """Запустить планировщик в текущем процессе (один раз на pid). Без ключа TMDB или кэша — ничего не делает."""
+    global _started_pid
+    if not WARMUP_ENABLED or not services.TMDB_CACHE_ENABLED or not services._api_key():
+        return
+    pid = os.getpid()
+    with _lock:
+        if _started_pid == pid:
+            return
+        _started_pid = pid
+    threading.Thread(target=_loop, name="warmup", daemon=True).start()
+
+
+def _after_fork():
+    # Потоки не переживают fork. Унаследованный дескриптор закрываем: flock принадлежит открытому файлу,
+    # и пока копия дескриптора открыта у потомка, блокировку ведущего не отпустит и завершение родителя
+    global _leader_fd
+    if _leader_fd is not None:
+        try:
+            os.close(_leader_fd)
+        except OSError:
+            pass
+    _leader_fd = None
+    _next_due.clear()
+    if _started_pid is not None:
+        start()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def _loop():
+    jobs = _jobs()
+    executor = ThreadPoolExecutor(max_workers=WARMUP_CONCURRENCY, thread_name_prefix="warmup")
+    while True:
+        time.sleep(_tick(jobs, executor))
+
+
+def _tick(jobs: list, executor) -> float:
+    """Один цикл планировщика: задания, которым пора, — в executor. Возвращает паузу до следующего цикла, секунд."""
+    now = time.monotonic()
+    if _is_leader():
+        _refresh_catalog()
+    elif _shared_cache():
+        # Общий кэш наполняет ведущий
+        return WARMUP_RETRY
+    due = [(name, fn) for name, fn in jobs if _next_due.get(name, 0) <= now]
+    wait([executor.submit(_run_job, name, fn) for name, fn in due])
+    _state["last_run"] = time.time()
+    next_at = min(_next_due.values(), default=now + WARMUP_RETRY)
+    return min(max(next_at - time.monotonic(), 1), WARMUP_RETRY)
+
+
+def _run_job(name: str, fn):
+    try:
+        with ratelimit.lane(ratelimit.BACKGROUND), services.refreshing() as keys:
+            fn()
+    except Exception as e:
+        _record_error(f"{name}: {e}")
+        _next_due[name] = time.monotonic() + WARMUP_RETRY
+        return
+    finally:
+        close_old_connections()
+    with _lock:
+        _state["runs"] += 1
+    # Ответ пришёл из каталога в БД — в кэше обновлять нечего, заглянем позже
+    interval = min(ttl for _, ttl in keys) * WARMUP_AHEAD if keys else WARMUP_IDLE
+    _next_due[name] = time.monotonic() + interval
+
+
+def _shared_cache() -> bool:
+    """Есть ли у кэша TMDB второй уровень, общий для воркеров."""
+    shared = services._cache.shared
+    return shared is not None and shared.enabled
+
+
+def _record_error(message: str):
+    with _lock:
+        _state["errors"] += 1
+        _state["last_error"] = message
+
+
+def _is_leader() -> bool:
+    """Неблокирующий flock на WARMUP_LOCK_FILE; удерживается до завершения процесса."""
+    global _leader_fd
+    if _leader_fd is not None:
+        return True
+    try:
+        fd = os.open(WARMUP_LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+    except OSError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return False
+    _leader_fd = fd
+    return True
+
+
+def _refresh_catalog():
+    """Обновить устаревшие ячейки каталога без года — из них отвечают страницы жанров."""
+    from .views import GENRE_NAMES
+
+    if not catalog.CATALOG_ENABLED:
+        return
+    names = {services.TMDB_GENRE_IDS[n.lower()]: n.lower() for n in GENRE_NAMES}
+    max_age = timedelta(hours=WARMUP_CATALOG_MAX_AGE)
+    try:
+        cells = catalog.stale_cells(names, [catalog.ALL_YEARS], max_age, max_age)
+    except DatabaseError:
+        # Таблицы каталога нет (не выполнен migrate) — страницы жанров прогреваются через кэш
+        close_old_connections()
+        return
+    for genre_id, year in cells:
+        try:
+            ratelimit.background(services.refresh_catalog_cell, names[genre_id], year)
+        except Exception as e:
+            _record_error(f"catalog:{names[genre_id]}: {e}")
+    close_old_connections()
+
+
+def stats() -> dict:
+    now = time.monotonic()
+    return {
+        "enabled": _started_pid == os.getpid(),
+        "leader": _leader_fd is not None,
+        "runs": _state["runs"],
+        "errors": _state["errors"],
+        "last_error": _state["last_error"],
+        "last_run": _state["last_run"],
+        "next_in": {name: round(due - now, 1) for name, due in sorted(_next_due.items())},
+    }
@@ -0,0 +1 @@
+"""Нагрузочные тесты API на подменном TMDB: python -m bench.run --help."""
@@ -0,0 +1,205 @@
+"""
+Подменный TMDB для нагрузочных тестов: API (/3/...) и картинки (/t/p/<size>/...) на одном порту.
+
+Ответы детерминированы (зависят только от пути и параметров), задержка, доля 5xx и 429
+задаются параметрами. Запуск отдельно:
+
+    python -m bench.fake_tmdb --port 8765 --latency 80 --jitter 40 --error-rate 0.01 --throttle-rate 0.01
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+PAGE_SIZE = 20
+
+
+class Config:
+    def __init__(self, latency=80.0, jitter=40.0, error_rate=0.0, throttle_rate=0.0, retry_after=1, total_pages=20, image_latency=30.0, image_kb=40):
+        self.latency = latency / 1000
+        self.jitter = jitter / 1000
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.total_pages = total_pages
+        self.image_latency = image_latency / 1000
+        self.image_bytes = image_kb * 1024
+
+
+class Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {}
+
+    def add(self, kind: str):
+        with self._lock:
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.counts)
+
+
+def _seed(*parts) -> int:
+    return int.from_bytes(hashlib.sha1("|".join(map(str, parts)).encode("utf-8")).digest()[:8], "big")
+
+
+def _item(movie_id: int, media_type: str | None = None) -> dict:
+    rnd = random.Random(movie_id)
+    year = rnd.randint(1960, 2026)
+    item = {
+        "id": movie_id,
+        "title": f"Фильм {movie_id}",
+        "original_title": f"Movie {movie_id}",
+        "name": f"Сериал {movie_id}",
+        "original_name": f"Series {movie_id}",
+        "release_date": f"{year}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}",
+        "first_air_date": f"{year}-01-01",
+        "vote_count": rnd.randint(0, 30000),
+        "vote_average": round(rnd.uniform(3, 9), 1),
+        "popularity": round(rnd.uniform(1, 500), 2),
+        "poster_path": f"/p{movie_id}.jpg",
+        "overview": "Описание " * rnd.randint(10, 60),
+    }
+    if media_type:
+        item["media_type"] = media_type
+    return item
+
+
+def _list(path: str, query: dict, config: Config) -> dict:
+    page = int(query.get("page", ["1"])[0] or 1)
+    seed = _seed(path, query.get("query", [""])[0], query.get("with_genres", [""])[0], query.get("primary_release_year", [""])[0], page)
+    rnd = random.Random(seed)
+    multi = path.endswith("/search/multi") or path.startswith("/3/trending/all")
+    results = []
+    for _ in range(PAGE_SIZE):
+        media_type = rnd.choice(("movie", "movie", "tv", "person")) if multi else None
+        results.append(_item(rnd.randint(1, 1_000_000), media_type))
+    return {"page": page, "total_pages": config.total_pages, "total_results": config.total_pages * PAGE_SIZE, "results": results}
+
+
+def _detail(media_type: str, movie_id: int, query: dict) -> dict:
+    data = _item(movie_id)
+    rnd = random.Random(movie_id)
+    data.update(
+        runtime=rnd.randint(80, 180),
+        genres=[{"id": 18, "name": "драма"}, {"id": 35, "name": "комедия"}],
+        tagline="Слоган",
+        imdb_id=f"tt{movie_id:07d}",
+    )
+    for extra in query.get("append_to_response", [""])[0].split(","):
+        if extra == "credits":
+            data["credits"] = {"cast": [{"id": i, "name": f"Актёр {i}", "character": "Роль"} for i in range(15)], "crew": []}
+        elif extra == "videos":
+            data["videos"] = {"results": [{"key": f"v{movie_id}", "site": "YouTube", "type": "Trailer"}]}
+        elif extra:
+            data[extra] = {"results": []}
+    if media_type == "tv":
+        data["number_of_seasons"] = rnd.randint(1, 10)
+    return data
+
+
+def _image(path: str, size: int) -> bytes:
+    # Начало JPEG и псевдослучайное тело фиксированного размера — постер не сжимается gzip
+    rnd = random.Random(_seed(path))
+    return b"\xff\xd8\xff\xe0" + rnd.randbytes(max(size - 4, 0))
+
+
+def make_handler(config: Config, stats: Stats):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, body: bytes, content_type: str = "application/json", headers=None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/_stats":
+                return self._send(200, json.dumps(stats.snapshot()).encode("utf-8"))
+            if url.path.startswith("/t/p/"):
+                stats.add("image")
+                time.sleep(config.image_latency)
+                return self._send(200, _image(url.path.split("/", 4)[-1], config.image_bytes), "image/jpeg", {"Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"})
+            if not url.path.startswith("/3/"):
+                return self._send(404, b"{}")
+            time.sleep(max(config.latency + random.uniform(-config.jitter, config.jitter), 0))
+            roll = random.random()
+            if roll < config.throttle_rate:
+                stats.add("429")
+                return self._send(429, b'{"status_code":25}', headers={"Retry-After": str(config.retry_after)})
+            if roll < config.throttle_rate + config.error_rate:
+                stats.add("5xx")
+                return self._send(503, b'{"status_code":11}')
+            query = parse_qs(url.query)
+            parts = url.path.strip("/").split("/")
+            if len(parts) == 3 and parts[1] in ("movie", "tv") and parts[2].isdigit():
+                stats.add("detail")
+                data = _detail(parts[1], int(parts[2]), query)
+            else:
+                stats.add("list")
+                data = _list(url.path, query, config)
+            return self._send(200, json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+    return Handler
+
+
+def serve(port: int, config: Config, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), make_handler(config, Stats()))
+    server.daemon_threads = True
+    return server
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", type=float, default=80, help="средняя задержка ответа API, мс")
+    parser.add_argument("--jitter", type=float, default=40, help="разброс задержки ±, мс")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After у 429, сек")
+    parser.add_argument("--total-pages", type=int, default=20, help="total_pages у списков")
+    parser.add_argument("--image-latency", type=float, default=30, help="задержка отдачи картинки, мс")
+    parser.add_argument("--image-kb", type=int, default=40, help="размер картинки, КБ")
+
+
+def argv_from_args(args) -> list:
+    """Параметры подменного TMDB из разобранных аргументов — для запуска отдельным процессом."""
+    return [
+        "--latency", str(args.latency), "--jitter", str(args.jitter),
+        "--error-rate", str(args.error_rate), "--throttle-rate", str(args.throttle_rate),
+        "--retry-after", str(args.retry_after), "--total-pages", str(args.total_pages),
+        "--image-latency", str(args.image_latency), "--image-kb", str(args.image_kb),
+    ]
+
+
+def config_from_args(args) -> Config:
+    return Config(args.latency, args.jitter, args.error_rate, args.throttle_rate, args.retry_after, args.total_pages, args.image_latency, args.image_kb)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server = serve(args.port, config_from_args(args), args.host)
+    print(f"fake TMDB on http://{args.host}:{args.port}/3, images on http://{args.host}:{args.port}/t/p", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""
+Нагрузочный прогон: подменный TMDB (bench.fake_tmdb), сервер приложения под WSGI и/или ASGI
+и сценарии из bench.scenarios. По каждому сценарию — p50/p95/p99, RPS, ошибки, запросы к TMDB
+и память (RSS) каждого воркера.
+
+    python -m bench.run --mode both --workers 3 --concurrency 32 --duration 20
+    python -m bench.run --mode asgi --scenarios details,posters --error-rate 0.02 --throttle-rate 0.01 --json out.json
+
+WSGI — gunicorn config.wsgi:application, ASGI — gunicorn с uvicorn-воркерами и API_ASYNC_VIEWS=1
+(без gunicorn — uvicorn --workers). У каждого режима своя копия БД, кэш постеров и файлы состояния
+во временном каталоге, так что прогоны не влияют друг на друга и на рабочие данные.
+По умолчанию WARMUP=0 и RATE_LIMIT=0 — заданные в окружении значения важнее.
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import httpx
+
+from . import fake_tmdb
+from .scenarios import SCENARIOS, Session
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+# --- Сервер приложения ---
+
+def _server_command(mode: str, port: int, workers: int, threads: int) -> list:
+    bind = f"127.0.0.1:{port}"
+    if importlib.util.find_spec("gunicorn") is not None:
+        cmd = [sys.executable, "-m", "gunicorn", "--workers", str(workers), "--bind", bind, "--log-level", "warning"]
+        if mode == "asgi":
+            return cmd + ["-k", "uvicorn.workers.UvicornWorker", "config.asgi:application"]
+        if threads > 1:
+            cmd += ["--threads", str(threads)]
+        return cmd + ["config.wsgi:application"]
+    if mode == "asgi":
+        return [sys.executable, "-m", "uvicorn", "--workers", str(workers), "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning", "config.asgi:application"]
+    raise SystemExit("Для режима wsgi нужен gunicorn: pip install gunicorn")
+
+
+def _server_env(mode: str, fake_port: int, workdir: Path) -> dict:
+    env = dict(os.environ)
+    env.setdefault("WARMUP", "0")
+    env.setdefault("RATE_LIMIT", "0")
+    fake = f"127.0.0.1:{fake_port}"
+    env.update(
+        TMDB_BASE=f"http://{fake}/3",
+        TMDB_IMAGE_ROOT=f"http://{fake}/t/p",
+        POSTER_EXTRA_HOSTS=fake,
+        TMDB_API_KEY="bench",
+        API_ASYNC_VIEWS="1" if mode == "asgi" else "0",
+        SQLITE_PATH=str(workdir / "db.sqlite3"),
+        POSTER_CACHE_DIR=str(workdir / "posters"),
+        RATE_LIMIT_FILE=str(workdir / "ratelimit.bin"),
+        WARMUP_LOCK_FILE=str(workdir / "warmup.lock"),
+        DJANGO_SETTINGS_MODULE="config.settings",
+    )
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    return env
+
+
+def _prepare_db(env: dict):
+    """Копия рабочей БД (индекс названий, каталог) с применёнными миграциями."""
+    source = BASE_DIR / "db.sqlite3"
+    if source.exists():
+        shutil.copyfile(source, env["SQLITE_PATH"])
+    subprocess.run([sys.executable, "manage.py", "migrate", "--noinput", "-v0"], cwd=BASE_DIR, env=env, check=True)
+
+
+def _wait_ready(base_url: str, proc: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"Сервер завершился с кодом {proc.returncode}")
+        try:
+            if httpx.get(f"{base_url}/api/v1/genres", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.3)
+    raise SystemExit(f"Сервер не ответил за {timeout:.0f} с")
+
+
+def _check_port_free(port: int):
+    with socket.socket() as sock:
+        if sock.connect_ex(("127.0.0.1", port)) == 0:
+            raise SystemExit(f"Порт {port} уже занят")
+
+
+def _wait_fake(fake_url: str, proc: subprocess.Popen, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and proc.poll() is None:
+        if _fake_stats(fake_url) is not None:
+            return
+        time.sleep(0.1)
+    raise SystemExit("Подменный TMDB не запустился")
+
+
+# --- Память воркеров ---
+
+def _children(pid: int) -> list:
+    out = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # pid (comm) state ppid ...; comm может содержать пробелы
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        if ppid == pid:
+            out.append(int(entry))
+    return out
+
+
+def _workers(pid: int) -> list:
+    """Процессы-воркеры сервера: потомки мастера (без служебных процессов), иначе сам процесс."""
+    workers = [p for p in _children(pid) if "resource_tracker" not in _cmdline(p)]
+    return workers or [pid]
+
+
+def _cmdline(pid: int) -> str:
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return f.read().replace(b"\0", b" ").decode("utf-8", "replace")
+    except OSError:
+        return ""
+
+
+def _rss_mb(pid: int) -> float | None:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class MemorySampler:
+    """Пиковый RSS каждого воркера за время сценария (опрос раз в interval секунд)."""
+
+    def __init__(self, pid: int | None, interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.peak = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        if self.pid is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            for pid in _workers(self.pid):
+                rss = _rss_mb(pid)
+                if rss is not None:
+                    self.peak[pid] = max(self.peak.get(pid, 0), rss)
+            if self._stop.wait(self.interval):
+                return
+
+
+# --- Нагрузка ---
+
+def _percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+async def _load(base_url: str, scenario, ctx: dict, concurrency: int, duration: float, seed: int) -> tuple:
+    """Крутить scenario на concurrency пользователях duration секунд: (samples, фактическая длительность)."""
+    samples = []
+    stop_at = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=concurrency * 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits, follow_redirects=False) as client:
+
+        async def user(n: int):
+            session = Session(client, random.Random(seed * 1000 + n), samples, ctx)
+            while time.perf_counter() < stop_at:
+                await scenario(session)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user(n) for n in range(concurrency)))
+        return samples, time.perf_counter() - started
+
+
+def _fake_stats(fake_url: str) -> dict | None:
+    """Счётчики запросов подменного TMDB по видам (list, detail, image, 5xx, 429); None — не отвечает."""
+    try:
+        return httpx.get(f"{fake_url}/_stats", timeout=5).json()
+    except (httpx.HTTPError, ValueError):
+        return None
+
+
+def _summary(name: str, samples: list, elapsed: float, memory: dict, upstream: dict) -> dict:
+    latencies = sorted(t * 1000 for t, _ in samples)
+    statuses = {}
+    for _, status in samples:
+        statuses[status] = statuses.get(status, 0) + 1
+    # 0 — нет ответа (ошибка соединения, таймаут клиента)
+    errors = sum(n for status, n in statuses.items() if status == 0 or status >= 500)
+    return {
+        "scenario": name,
+        "requests": len(samples),
+        "errors": errors,
+        "rps": round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(_percentile(latencies, 50), 1),
+        "p95_ms": round(_percentile(latencies, 95), 1),
+        "p99_ms": round(_percentile(latencies, 99), 1),
+        "statuses": {str(status): n for status, n in sorted(statuses.items())},
+        "tmdb_calls": upstream,
+        "rss_mb": {str(pid): round(rss, 1) for pid, rss in sorted(memory.items())},
+    }
+
+
+def run_scenarios(base_url: str, fake_url: str, server_pid: int | None, args) -> list:
+    ctx = {
+        "detail_ids": args.detail_ids,
+        "poster_ids": args.poster_ids,
+        "poster_burst": args.poster_burst,
+        "image_root": f"{fake_url}/t/p",
+    }
+    results = []
+    for name in args.scenarios:
+        scenario = SCENARIOS[name]
+        if args.warmup:
+            asyncio.run(_load(base_url, scenario, ctx, args.concurrency, args.warmup, args.seed + 1))
+        before = _fake_stats(fake_url) or {}
+        with MemorySampler(server_pid) as memory:
+            samples, elapsed = asyncio.run(_load(base_url, scenario, ctx, args.concurrency, args.duration, args.seed))
+        after = _fake_stats(fake_url) or {}
+        upstream = {k: after.get(k, 0) - before.get(k, 0) for k in after if after.get(k, 0) != before.get(k, 0)}
+        results.append(_summary(name, samples, elapsed, memory.peak, upstream))
+        _print_row(results[-1])
+    return results
+
+
+def _print_header(title: str):
+    print(f"\n== {title}")
+    print(f"{'scenario':<10} {'requests':>9} {'errors':>7} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'tmdb':>6}  rss MB per worker")
+
+
+def _print_row(r: dict):
+    rss = " ".join(f"{v:.0f}" for v in r["rss_mb"].values()) or "-"
+    tmdb = sum(r["tmdb_calls"].values())
+    print(f"{r['scenario']:<10} {r['requests']:>9} {r['errors']:>7} {r['rps']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} {tmdb:>6}  {rss}", flush=True)
+
+
+def _run_mode(mode: str, fake_url: str, args) -> list:
+    workdir = Path(tempfile.mkdtemp(prefix=f"movie-bench-{mode}-"))
+    env = _server_env(mode, args.fake_port, workdir)
+    try:
+        _prepare_db(env)
+        cmd = _server_command(mode, args.port, args.workers, args.threads)
+        proc = subprocess.Popen(cmd, cwd=BASE_DIR, env=env)
+        base_url = f"http://127.0.0.1:{args.port}"
+        try:
+            _wait_ready(base_url, proc)
+            _print_header(f"{mode}: {' '.join(cmd[2:])}")
+            return run_scenarios(base_url, fake_url, proc.pid, args)
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон API на подменном TMDB")
+    parser.add_argument("--mode", choices=("wsgi", "asgi", "both"), default="both")
+    parser.add_argument("--url", help="уже запущенный сервер (его TMDB_BASE должен смотреть на подменный); --mode игнорируется")
+    parser.add_argument("--server-pid", type=int, help="pid мастера сервера для --url — чтобы снять память воркеров")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="через запятую: " + ", ".join(SCENARIOS))
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=1, help="потоков на воркер WSGI (gthread)")
+    parser.add_argument("--concurrency", type=int, default=32, help="одновременных виртуальных пользователей")
+    parser.add_argument("--duration", type=float, default=20, help="секунд на сценарий")
+    parser.add_argument("--warmup", type=float, default=3, help="секунд прогрева перед замером (0 — замер на холодном кэше)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--detail-ids", type=int, default=2000, help="размер пула id для details")
+    parser.add_argument("--poster-ids", type=int, default=300, help="размер пула постеров")
+    parser.add_argument("--poster-burst", type=int, default=12, help="постеров одновременно в posters")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--fake-port", type=int, default=8765)
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    fake_tmdb.add_arguments(parser)
+    args = parser.parse_args()
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in args.scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"неизвестные сценарии: {', '.join(unknown)}")
+
+    for port in {args.fake_port} if args.url else {args.fake_port, args.port}:
+        _check_port_free(port)
+    # Подменный TMDB — отдельным процессом, чтобы не делить GIL с генератором нагрузки
+    fake = subprocess.Popen([sys.executable, "-m", "bench.fake_tmdb", "--port", str(args.fake_port), *fake_tmdb.argv_from_args(args)], cwd=BASE_DIR, stdout=subprocess.DEVNULL)
+    fake_url = f"http://127.0.0.1:{args.fake_port}"
+    _wait_fake(fake_url, fake)
+
+    report = {"args": {k: v for k, v in vars(args).items() if k != "json"}, "results": {}}
+    try:
+        if args.url:
+            _print_header(args.url)
+            report["results"]["external"] = run_scenarios(args.url.rstrip("/"), fake_url, args.server_pid, args)
+        else:
+            for mode in (("wsgi", "asgi") if args.mode == "both" else (args.mode,)):
+                report["results"][mode] = _run_mode(mode, fake_url, args)
+    finally:
+        fake.terminate()
+        fake.wait()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
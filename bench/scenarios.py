@@ -0,0 +1,98 @@
+"""
+Сценарии нагрузки: каждый — корутина одной итерации «виртуального пользователя».
+Итерации крутятся в цикле на concurrency пользователях (см. bench.run); все запросы — через Session.get,
+которая замеряет время и статус.
+"""
+import asyncio
+import random
+import time
+from urllib.parse import quote
+
+GENRES = ["боевик", "комедия", "фэнтези", "драма", "криминал", "мелодрама", "триллер", "ужасы", "фантастика", "документальный", "приключения"]
+YEARS = [None, None, "2024", "2020", "2010-2015", "1999"]
+WORDS = ["аватар", "матрица", "интерстеллар", "зеленая миля", "начало", "титаник", "джокер", "дюна", "batman", "avatar"]
+
+
+class Session:
+    """HTTP-клиент виртуального пользователя: пишет (время, статус) каждого запроса в samples."""
+
+    def __init__(self, client, rnd: random.Random, samples: list, ctx: dict):
+        self.client = client
+        self.rnd = rnd
+        self.samples = samples
+        self.ctx = ctx
+
+    async def get(self, path: str):
+        started = time.perf_counter()
+        try:
+            resp = await self.client.get(path)
+            await resp.aread()
+        except Exception:
+            self.samples.append((time.perf_counter() - started, 0))
+            return None
+        self.samples.append((time.perf_counter() - started, resp.status_code))
+        return resp
+
+
+def _json(resp) -> dict:
+    if resp is None or resp.status_code != 200:
+        return {}
+    try:
+        return resp.json()
+    except ValueError:
+        return {}
+
+
+async def home(s: Session):
+    """Главная: все блоки одним запросом."""
+    await s.get("/api/home")
+
+
+async def typeahead(s: Session):
+    """Поиск по мере ввода: запрос на каждый набранный символ, начиная со второго."""
+    word = s.rnd.choice(WORDS)
+    for n in range(2, len(word) + 1):
+        await s.get(f"/api/v1/movies?q={quote(word[:n])}")
+        await asyncio.sleep(s.rnd.uniform(0.02, 0.08))
+
+
+async def genre_browse(s: Session):
+    """Жанр (иногда с годом) и ещё 1–3 страницы по next_cursor."""
+    url = f"/api/v1/movies?genre={quote(s.rnd.choice(GENRES))}"
+    year = s.rnd.choice(YEARS)
+    if year:
+        url += f"&year={year}"
+    data = _json(await s.get(url))
+    for _ in range(s.rnd.randint(1, 3)):
+        cursor = data.get("next_cursor")
+        if not cursor:
+            return
+        data = _json(await s.get(f"{url}&cursor={cursor}&limit=20"))
+
+
+async def detail_storm(s: Session):
+    """Карточки фильмов из пула ctx["detail_ids"] id (часть — с credits), каждая десятая итерация — batch."""
+    ids = s.ctx["detail_ids"]
+    if s.rnd.random() < 0.1:
+        refs = ",".join(str(s.rnd.randint(1, ids)) for _ in range(20))
+        await s.get(f"/api/v1/movies/batch?ids={refs}")
+        return
+    movie_id = s.rnd.randint(1, ids)
+    await s.get(f"/api/v1/movies/{movie_id}" + ("?include=credits" if s.rnd.random() < 0.3 else ""))
+
+
+async def poster_burst(s: Session):
+    """Сетка постеров: ctx["poster_burst"] картинок одновременно из пула ctx["poster_ids"]."""
+    root, pool = s.ctx["image_root"], s.ctx["poster_ids"]
+    size = s.rnd.choice(("w185", "w342"))
+    urls = [quote(f"{root}/{size}/p{s.rnd.randint(1, pool)}.jpg", safe="") for _ in range(s.ctx["poster_burst"])]
+    await asyncio.gather(*(s.get(f"/api/poster?url={u}") for u in urls))
+
+
+SCENARIOS = {
+    "home": home,
+    "typeahead": typeahead,
+    "genre": genre_browse,
+    "details": detail_storm,
+    "posters": poster_burst,
+}
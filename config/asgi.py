@@ -2,4 +2,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+# Под ASGI обслуживаем API асинхронными вьюхами (api.async_views); API_ASYNC_VIEWS=0 — вернуть синхронные
+os.environ.setdefault("API_ASYNC_VIEWS", "1")
 application = get_asgi_application()
@@ -26,6 +26,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым — чтобы время ответа в метриках включало остальные middleware
+    "api.metrics.metrics_middleware",
+    # Профилирование выбранных запросов (api/profiling.py; без PROFILE_SAMPLE_RATE/PROFILE_TOKEN не подключается)
+    "api.profiling.profiling_middleware",
     "django.middleware.security.SecurityMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -48,7 +52,8 @@ TEMPLATES = [
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        # SQLITE_PATH — другой файл БД (например, копия для bench/)
+        'NAME': os.environ.get("SQLITE_PATH") or BASE_DIR / 'db.sqlite3',
     }
 }
 
@@ -62,10 +67,14 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Асинхронные вьюхи (api.async_views) вместо синхронных; config/asgi.py включает их по умолчанию
+API_ASYNC_VIEWS = os.environ.get("API_ASYNC_VIEWS", "0").strip().lower() in ("1", "true", "yes", "on")
+
 # REST Framework
 REST_FRAMEWORK = {
     "DEFAULT_RENDERER_CLASSES": [
-        "rest_framework.renderers.JSONRenderer",
+        # JSON через orjson (api.renderers)
+        "api.renderers.ORJSONRenderer",
     ],
 }
 
@@ -1,32 +1,55 @@
+from functools import cache
+
+from django.conf import settings
 from django.urls import path, include
-from drf_yasg import openapi
-from drf_yasg.views import get_schema_view
 
-from api import views as api_views
+from api import async_views, docs, metrics, views
+from api.urls import build_urlpatterns
+
+
+def _patterns(api_views):
+    return [
+        # Оба варианта пути — с префиксом /api и без (для разного деплоя/прокси)
+        path("search_by_genre", api_views.search_by_genre),
+        path("api/search_by_genre", api_views.search_by_genre),
+        path("popular_now", api_views.popular_now),
+        path("api/popular_now", api_views.popular_now),
+        path("popular_movies", api_views.popular_movies),
+        path("api/popular_movies", api_views.popular_movies),
+        path("popular_series", api_views.popular_series),
+        path("api/popular_series", api_views.popular_series),
+        path("coming_soon", api_views.coming_soon),
+        path("api/coming_soon", api_views.coming_soon),
+        path("home", api_views.home),
+        path("api/home", api_views.home),
+        path("poster", api_views.poster_proxy),
+        path("api/poster", api_views.poster_proxy),
+        path("api/v1/", include((build_urlpatterns(api_views), "api"))),
+    ]
+
+
+@cache
+def schema_view(url: str | None = None):
+    """drf_yasg schema view — drf_yasg импортируется здесь, а не при старте воркера (см. api.docs)."""
+    from drf_yasg import openapi
+    from drf_yasg.views import get_schema_view
+
+    docs.apply()
+    return get_schema_view(
+        openapi.Info(
+            title="Movie REST API",
+            default_version="v1",
+            description="API для поиска фильмов (Кинопоиск) и получения ссылок на просмотр.",
+        ),
+        url=url,
+        public=True,
+        # Схема всегда строится по синхронным DRF-вьюхам: async-вьюхи отдают тот же API, но drf_yasg их не видит
+        patterns=_patterns(views),
+    )
 
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Movie REST API",
-        default_version="v1",
-        description="API для поиска фильмов (Кинопоиск) и получения ссылок на просмотр.",
-    ),
-    public=True,
-)
 
 urlpatterns = [
-    path("", schema_view.with_ui("swagger", cache_timeout=0), name="schema-swagger-ui"),
-    # Оба варианта пути — с префиксом /api и без (для разного деплоя/прокси)
-    path("search_by_genre", api_views.search_by_genre),
-    path("api/search_by_genre", api_views.search_by_genre),
-    path("popular_now", api_views.popular_now),
-    path("api/popular_now", api_views.popular_now),
-    path("popular_movies", api_views.popular_movies),
-    path("api/popular_movies", api_views.popular_movies),
-    path("popular_series", api_views.popular_series),
-    path("api/popular_series", api_views.popular_series),
-    path("coming_soon", api_views.coming_soon),
-    path("api/coming_soon", api_views.coming_soon),
-    path("poster", api_views.poster_proxy),
-    path("api/poster", api_views.poster_proxy),
-    path("api/v1/", include("api.urls")),
-]
+    # Swagger UI и схема: готовые файлы из generate_openapi, иначе живая схема drf_yasg
+    path("", docs.root_view(schema_view), name="schema-swagger-ui"),
+    path("metrics", metrics.metrics_view),
+] + _patterns(async_views if settings.API_ASYNC_VIEWS else views)
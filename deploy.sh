@@ -39,7 +39,12 @@ After=network.target
 User=$USER
 Group=www-data
 WorkingDirectory=$PROJECT_ROOT
+# Метрики всех воркеров в /metrics (api.metrics, gunicorn.conf.py)
+Environment=PROMETHEUS_MULTIPROC_DIR=/run/$PROJECT_NAME/metrics
+RuntimeDirectory=$PROJECT_NAME
 ExecStart=$VENV_PATH/bin/gunicorn --access-logfile - --workers 3 --bind unix:$PROJECT_ROOT/$PROJECT_NAME.sock config.wsgi:application
+# ASGI (async-вьюхи, воркер не блокируется на ожидании TMDB):
+# ExecStart=$VENV_PATH/bin/gunicorn --access-logfile - --workers 3 -k uvicorn.workers.UvicornWorker --bind unix:$PROJECT_ROOT/$PROJECT_NAME.sock config.asgi:application
 
 [Install]
 WantedBy=multi-user.target
@@ -52,6 +57,8 @@ sudo systemctl start $PROJECT_NAME
 python3 manage.py makemigrations
 pwd
 python3 manage.py migrate
+# Схема OpenAPI для корня сайта (воркеры подхватят новые файлы без перезапуска)
+python3 manage.py generate_openapi
 # Create the Nginx configuration file
 sudo tee $NGINX_CONF > /dev/null <<EOF
 server {
@@ -64,8 +71,15 @@ server {
     location /media/ {
         root $PROJECT_ROOT;
     }
+    # Постеры из дискового кэша отдаёт nginx (POSTER_ACCEL_REDIRECT_PREFIX=/_poster_cache/)
+    location /_poster_cache/ {
+        internal;
+        alias $PROJECT_ROOT/poster_cache/;
+    }
     location / {
         include proxy_params;
+        # Время прихода запроса: бюджет вьюхи учитывает ожидание в очереди (api/deadlines.py)
+        proxy_set_header X-Request-Start "t=\${msec}";
         proxy_pass http://unix:$PROJECT_ROOT/$PROJECT_NAME.sock;
     }
 }
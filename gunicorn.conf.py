@@ -0,0 +1,36 @@
+"""
+Настройки gunicorn, общие для WSGI и ASGI (uvicorn-воркеры). gunicorn читает этот файл сам,
+если запущен из корня проекта; параметры командной строки в deploy.sh имеют приоритет.
+
+PROMETHEUS_MULTIPROC_DIR (api.metrics): каталог очищается при старте мастера — значения прошлого
+запуска не должны попасть в сумму, — а при завершении воркера его gauge-файлы помечаются мёртвыми.
+
+Прогрев кэша TMDB (api.warmup) запускается в каждом воркере после загрузки приложения,
+а не в мастере: с --preload мастер иначе держал бы блокировку ведущего.
+"""
+import glob
+import os
+
+_MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR", "").strip()
+
+
+def on_starting(server):
+    if not _MULTIPROC_DIR:
+        return
+    os.makedirs(_MULTIPROC_DIR, exist_ok=True)
+    for path in glob.glob(os.path.join(_MULTIPROC_DIR, "*.db")):
+        os.remove(path)
+
+
+def post_worker_init(worker):
+    from api import warmup
+
+    warmup.start()
+
+
+def child_exit(server, worker):
+    if not _MULTIPROC_DIR:
+        return
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)